@@ -0,0 +1,149 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { EmbeddingStore, chunkTextHash } from './embeddingStore';
+import { INDEX_TYPES, IndexType, IndexTypeOptions, buildFaissIndex, withSearchParameters } from './indexTypes';
+
+// Recall@k and query latency of every index type against exact (flat) search.
+//
+// Usage: node build/benchIndexTypes.js [--n 100000] [--dimension 384] [--k 10]
+//          [--queries 200] [--types flat,ivf-flat,ivf-pq,hnsw] [--nlist N] [--pqM M] [--hnswM M]
+//          [--nprobe 1,4,16] [--efSearch 16,64,128]
+//          [--index <index.faiss> [--model xenova:Xenova/all-MiniLM-L6-v2] [--store <dir>]]
+//
+// By default the vectors are synthetic: unit vectors scattered around random
+// cluster centres, which is how code embeddings are distributed. With
+// --index, the vectors of a processed repository are read back from the
+// embedding store instead. Queries are perturbed copies of corpus vectors.
+// --nprobe and --efSearch take lists of values, so that one run shows what
+// recall each setting buys; by default the IVF and HNSW indexes are
+// searched with the defaults of indexTypes.ts.
+
+function option(name: string, fallback: string): string {
+  const i = process.argv.indexOf(`--${name}`);
+  return i >= 0 && i + 1 < process.argv.length ? process.argv[i + 1] : fallback;
+}
+
+// Small seeded PRNG so that every run benchmarks the same vectors
+function random(seed: number): () => number {
+  return () => {
+    seed = (seed + 0x6D2B79F5) | 0;
+    let t = Math.imul(seed ^ (seed >>> 15), 1 | seed);
+    t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t;
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+function gaussian(rand: () => number): number {
+  return Math.sqrt(-2 * Math.log(rand() + 1e-12)) * Math.cos(2 * Math.PI * rand());
+}
+
+function normalise(vectors: Float32Array, dimension: number) {
+  for (let row = 0; row < vectors.length / dimension; row++) {
+    let norm = 0;
+    for (let j = 0; j < dimension; j++) {
+      norm += vectors[row * dimension + j] ** 2;
+    }
+    norm = Math.sqrt(norm) || 1;
+    for (let j = 0; j < dimension; j++) {
+      vectors[row * dimension + j] /= norm;
+    }
+  }
+}
+
+function syntheticVectors(n: number, dimension: number, rand: () => number): Float32Array {
+  const clusters = Math.max(1, Math.round(Math.sqrt(n) / 2));
+  const centres = new Float32Array(clusters * dimension).map(() => gaussian(rand));
+  const vectors = new Float32Array(n * dimension);
+  for (let row = 0; row < n; row++) {
+    const centre = Math.floor(rand() * clusters);
+    for (let j = 0; j < dimension; j++) {
+      vectors[row * dimension + j] = centres[centre * dimension + j] + 0.6 * gaussian(rand);
+    }
+  }
+  normalise(vectors, dimension);
+  return vectors;
+}
+
+function storedVectors(indexPath: string, modelId: string, storeRoot: string): { vectors: Float32Array; dimension: number } {
+  const texts: string[] = JSON.parse(fs.readFileSync(`${indexPath}.texts.json`, 'utf-8'));
+  const found = EmbeddingStore.open(storeRoot, modelId).lookup(texts.map(chunkTextHash))
+    .filter((vector): vector is number[] => vector !== null);
+  if (found.length === 0) {
+    throw new Error(`No vectors of ${indexPath} are in the embedding store at ${storeRoot}`);
+  }
+  const dimension = found[0].length;
+  const vectors = new Float32Array(found.length * dimension);
+  found.forEach((vector, i) => vectors.set(vector, i * dimension));
+  return { vectors, dimension };
+}
+
+function main() {
+  const k = Number(option('k', '10'));
+  const queryCount = Number(option('queries', '200'));
+  const types = option('types', INDEX_TYPES.filter(type => type !== 'auto').join(',')).split(',') as IndexType[];
+  const rand = random(42);
+
+  const indexPath = option('index', '');
+  const { vectors, dimension } = indexPath
+    ? storedVectors(indexPath, option('model', 'xenova:Xenova/all-MiniLM-L6-v2'),
+        option('store', path.join(os.homedir(), '.github_repo_rag', 'embeddings')))
+    : { vectors: syntheticVectors(Number(option('n', '100000')), Number(option('dimension', '384')), rand),
+        dimension: Number(option('dimension', '384')) };
+  const n = vectors.length / dimension;
+
+  const queries: number[][] = [];
+  for (let q = 0; q < queryCount; q++) {
+    const row = Math.floor(rand() * n);
+    const query = new Float32Array(vectors.subarray(row * dimension, (row + 1) * dimension));
+    for (let j = 0; j < dimension; j++) {
+      query[j] += 0.05 * gaussian(rand);
+    }
+    normalise(query, dimension);
+    queries.push(Array.from(query));
+  }
+
+  const options: IndexTypeOptions = {};
+  if (process.argv.includes('--nlist')) options.nlist = Number(option('nlist', '0'));
+  if (process.argv.includes('--pqM')) options.pqM = Number(option('pqM', '0'));
+  if (process.argv.includes('--hnswM')) options.hnswM = Number(option('hnswM', '0'));
+  const values = (name: string) => process.argv.includes(`--${name}`) ? option(name, '').split(',').map(Number) : [undefined];
+  const nprobes = values('nprobe');
+  const efSearches = values('efSearch');
+
+  console.log(`${n} vectors of dimension ${dimension}, ${queryCount} queries, k=${k}`);
+  console.log(`${'index'.padEnd(16)} ${'search'.padEnd(14)} ${'build ms'.padStart(10)} ${'query ms'.padStart(10)} ${`recall@${k}`.padStart(10)} ${'MB'.padStart(8)}`);
+
+  let exact: number[][] = [];
+  for (const type of ['flat' as IndexType, ...types.filter(type => type !== 'flat')]) {
+    const settings = type.startsWith('ivf') ? nprobes.map(nprobe => ({ nprobe }))
+      : type === 'hnsw' ? efSearches.map(efSearch => ({ efSearch })) : [{}];
+    const started = Date.now();
+    const built = buildFaissIndex(vectors, dimension, { ...options, type });
+    const buildMs = Date.now() - started;
+    for (const setting of settings) {
+      const index = withSearchParameters(built.index, setting);
+      const results: number[][] = [];
+      const searchStarted = process.hrtime.bigint();
+      for (const query of queries) {
+        results.push(index.search(query, k).labels);
+      }
+      const queryMs = Number(process.hrtime.bigint() - searchStarted) / 1e6 / queries.length;
+
+      if (type === 'flat') {
+        exact = results;
+      }
+      let recall = 0;
+      results.forEach((labels, q) => {
+        const truth = new Set(exact[q]);
+        recall += labels.filter(label => truth.has(label)).length / k;
+      });
+      const megabytes = index.toBuffer().length / (1024 * 1024);
+      const search = Object.entries(setting).map(([name, value]) => `${name}=${value ?? 'default'}`).join(' ') || '-';
+      console.log(`${built.descriptor.padEnd(16)} ${search.padEnd(14)} ${String(buildMs).padStart(10)} ${queryMs.toFixed(3).padStart(10)} ` +
+        `${(recall / queries.length).toFixed(3).padStart(10)} ${megabytes.toFixed(1).padStart(8)}`);
+    }
+  }
+}
+
+main();
@@ -0,0 +1,55 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { CallGraph } from './callGraph';
+
+describe('CallGraph', () => {
+  const documents = [
+    { name: 'main', calls: ['parse_file', 'print'] },
+    { name: 'parse_file', calls: ['scan', 'self.read'] },
+    { name: 'scan', calls: [] },
+    { name: 'read', calls: ['scan'] },
+    { name: '', calls: ['Parser.parse_file'] },
+  ];
+
+  it('resolves calls to definitions by name', () => {
+    const graph = CallGraph.build(documents);
+    expect(graph.definitions('scan')).toEqual([2]);
+    expect(graph.callees(1)).toEqual([2, 3]);
+    expect(graph.callersOf('parse_file')).toEqual([0, 4]);
+    expect(graph.calleesOf('main')).toEqual([1]);
+    expect(graph.callers(2)).toEqual([1, 3]);
+  });
+
+  it('expands results by hops in both directions', () => {
+    const graph = CallGraph.build(documents);
+    expect(graph.expand([2], 1)).toEqual([2, 1, 3]);
+    expect(graph.expand([2], 2)).toEqual([2, 1, 3, 0, 4]);
+    expect(graph.expand([2], 2, 3)).toEqual([2, 1, 3]);
+  });
+
+  it('resolves aliases to the document they repeat', () => {
+    // A copy of `scan` named `tokenize`, which also calls `read`
+    const graph = CallGraph.build(documents, [{ document: { name: 'tokenize', calls: ['read'] }, of: 2 }]);
+    expect(graph.size).toBe(5);
+    expect(graph.definitions('tokenize')).toEqual([2]);
+    expect(graph.callees(2)).toEqual([3]);
+    expect(graph.callers(3)).toEqual([1, 2]);
+    expect(graph.document(2)).toEqual({ name: 'scan', calls: [] });
+  });
+
+  it('round-trips through its file', () => {
+    const dir = fs.mkdtempSync(path.join(os.tmpdir(), 'call-graph-'));
+    try {
+      const indexPath = path.join(dir, 'index.faiss');
+      CallGraph.build(documents, [{ document: { name: 'tokenize', calls: [] }, of: 2 }]).save(indexPath);
+      const loaded = CallGraph.load(indexPath)!;
+      expect(loaded.size).toBe(5);
+      expect(loaded.definitions('tokenize')).toEqual([2]);
+      expect(loaded.callersOf('parse_file')).toEqual([0, 4]);
+      expect(loaded.document(1)).toEqual({ name: 'parse_file', calls: ['scan', 'self.read'] });
+    } finally {
+      fs.rmSync(dir, { recursive: true, force: true });
+    }
+  });
+});
@@ -0,0 +1,286 @@
+import fs from "fs";
+
+// Call graph over the chunks of a repository index, stored next to it as
+// `${indexPath}.callgraph.bin`. Document i is the i-th vector of the FAISS
+// index, as in lexicalIndex.ts.
+//
+// Every adjacency list is kept in CSR form: an offsets array with one entry
+// per row plus one, and a flat array of the rows' items, so row r is
+// items[offsets[r]..offsets[r + 1]). Looking up the callers or callees of a
+// chunk is then two array reads and a slice, O(degree).
+//
+// Calls are resolved by name: a call to `List.map` or `self.map` reaches
+// every chunk defining `map`. The unresolved call names are kept as well, so
+// that an incremental update can resolve them against newly added files.
+//
+// A chunk stored as an alias of an indexed one (see chunkDedup.ts) is kept
+// as an extra document after the indexed ones, and `aliasOf` gives the row
+// it repeats: its name defines that row and its calls are that row's calls,
+// so a duplicate under another name or path is still found by both.
+//
+// File layout: "CGR1", a uint32 header length, the JSON header, padding to a
+// multiple of 4 bytes, then the int32 arrays in ARRAYS order.
+
+const MAGIC = "CGR1";
+const ARRAYS = [
+    "documentNames",
+    "callOffsets", "calls",
+    "definitionOffsets", "definitions",
+    "calleeOffsets", "callees",
+    "callerOffsets", "callers",
+    "aliasOf"
+] as const;
+
+type ArrayName = typeof ARRAYS[number];
+
+interface CallGraphHeader {
+    documents: number;
+    names: string[];
+    lengths: Record<ArrayName, number>;
+}
+
+export interface CallGraphDocument {
+    // Defined name, or "" for anonymous chunks
+    name: string;
+    calls: string[];
+}
+
+// The name a call resolves to: its last dotted segment
+function calledName(call: string): string {
+    return call.slice(call.lastIndexOf(".") + 1);
+}
+
+function csr(rows: number[][]): { offsets: Int32Array; items: Int32Array } {
+    const offsets = new Int32Array(rows.length + 1);
+    rows.forEach((row, r) => {
+        offsets[r + 1] = offsets[r] + row.length;
+    });
+    const items = new Int32Array(offsets[rows.length]);
+    rows.forEach((row, r) => items.set(row, offsets[r]));
+    return { offsets, items };
+}
+
+export class CallGraph {
+    private nameIds: Map<string, number>;
+
+    private constructor(readonly names: string[], private arrays: Record<ArrayName, Int32Array>) {
+        this.nameIds = new Map(names.map((name, id) => [name, id]));
+    }
+
+    static build(documents: CallGraphDocument[], aliases: { document: CallGraphDocument; of: number }[] = []): CallGraph {
+        const builder = CallGraph.builder();
+        documents.forEach(document => builder.add(document));
+        aliases.forEach(alias => builder.addAlias(alias.document, alias.of));
+        return builder.build();
+    }
+
+    // Builds a graph from documents added one at a time, keeping only the
+    // interned ids of their names and calls. Aliases may be added between
+    // documents; `of` is the document they repeat.
+    static builder(): {
+        add(document: CallGraphDocument): void;
+        addAlias(document: CallGraphDocument, of: number): void;
+        build(): CallGraph;
+    } {
+        const names: string[] = [];
+        const nameIds = new Map<string, number>();
+        const idOf = (name: string): number => {
+            let id = nameIds.get(name);
+            if (id === undefined) {
+                id = names.length;
+                names.push(name);
+                nameIds.set(name, id);
+            }
+            return id;
+        };
+        const documentNameIds: number[] = [];
+        const callRows: number[][] = [];
+        const aliasNameIds: number[] = [];
+        const aliasCallRows: number[][] = [];
+        const aliasOf: number[] = [];
+        return {
+            add(document: CallGraphDocument) {
+                documentNameIds.push(document.name ? idOf(document.name) : -1);
+                callRows.push([...new Set(document.calls.map(idOf))]);
+            },
+            addAlias(document: CallGraphDocument, of: number) {
+                aliasNameIds.push(document.name ? idOf(document.name) : -1);
+                aliasCallRows.push([...new Set(document.calls.map(idOf))]);
+                aliasOf.push(of);
+            },
+            build: () => CallGraph.resolve(names, nameIds, Int32Array.from([...documentNameIds, ...aliasNameIds]),
+                [...callRows, ...aliasCallRows], Int32Array.from(aliasOf))
+        };
+    }
+
+    private static resolve(names: string[], nameIds: Map<string, number>, documentNames: Int32Array,
+                           callRows: number[][], aliasOf: Int32Array): CallGraph {
+        // Documents after the first `size` are aliases of one of those
+        const size = documentNames.length - aliasOf.length;
+        const documentOf = (doc: number): number => doc < size ? doc : aliasOf[doc - size];
+        const definitionRows: number[][] = names.map(() => []);
+        documentNames.forEach((id, doc) => {
+            if (id >= 0) {
+                definitionRows[id].push(documentOf(doc));
+            }
+        });
+        if (aliasOf.length > 0) {
+            definitionRows.forEach((row, id) => {
+                definitionRows[id] = [...new Set(row)].sort((a, b) => a - b);
+            });
+        }
+        // The calls of each document together with those of its aliases
+        const documentCalls = callRows.slice(0, size);
+        aliasOf.forEach((of, alias) => {
+            documentCalls[of] = [...documentCalls[of], ...callRows[size + alias]];
+        });
+
+        const resolved = new Map<number, number[]>();
+        const definitionsOfCall = (id: number): number[] => {
+            let docs = resolved.get(id);
+            if (!docs) {
+                const target = nameIds.get(calledName(names[id]));
+                docs = target === undefined ? [] : definitionRows[target];
+                resolved.set(id, docs);
+            }
+            return docs;
+        };
+        const calleeRows = documentCalls.map((row, doc) =>
+            [...new Set(row.flatMap(definitionsOfCall))].filter(callee => callee !== doc).sort((a, b) => a - b));
+        const callerRows: number[][] = documentCalls.map(() => []);
+        calleeRows.forEach((row, doc) => row.forEach(callee => callerRows[callee].push(doc)));
+
+        const calls = csr(callRows);
+        const definitions = csr(definitionRows);
+        const callees = csr(calleeRows);
+        const callers = csr(callerRows);
+        return new CallGraph(names, {
+            documentNames,
+            callOffsets: calls.offsets, calls: calls.items,
+            definitionOffsets: definitions.offsets, definitions: definitions.items,
+            calleeOffsets: callees.offsets, callees: callees.items,
+            callerOffsets: callers.offsets, callers: callers.items,
+            aliasOf
+        });
+    }
+
+    static path(indexPath: string): string {
+        return `${indexPath}.callgraph.bin`;
+    }
+
+    // The call graph stored with the index at indexPath, or null if it has none
+    static load(indexPath: string): CallGraph | null {
+        const graphPath = CallGraph.path(indexPath);
+        if (!fs.existsSync(graphPath)) {
+            return null;
+        }
+        const buffer = fs.readFileSync(graphPath);
+        if (buffer.toString("latin1", 0, 4) !== MAGIC) {
+            return null;
+        }
+        const headerLength = buffer.readUInt32LE(4);
+        const header: CallGraphHeader = JSON.parse(buffer.toString("utf-8", 8, 8 + headerLength));
+        let offset = Math.ceil((8 + headerLength) / 4) * 4;
+        const arrays = {} as Record<ArrayName, Int32Array>;
+        for (const name of ARRAYS) {
+            // Graphs saved before aliases were kept have no aliasOf
+            const length = header.lengths[name] ?? 0;
+            // Copy out of the file buffer, which need not be 4-byte aligned
+            arrays[name] = new Int32Array(buffer.buffer.slice(buffer.byteOffset + offset, buffer.byteOffset + offset + 4 * length));
+            offset += 4 * length;
+        }
+        return new CallGraph(header.names, arrays);
+    }
+
+    save(indexPath: string) {
+        const header: CallGraphHeader = {
+            documents: this.size,
+            names: this.names,
+            lengths: Object.fromEntries(ARRAYS.map(name => [name, this.arrays[name].length])) as Record<ArrayName, number>
+        };
+        const headerBytes = Buffer.from(JSON.stringify(header), "utf-8");
+        const prefix = Buffer.alloc(Math.ceil((8 + headerBytes.length) / 4) * 4);
+        prefix.write(MAGIC, 0, "latin1");
+        prefix.writeUInt32LE(headerBytes.length, 4);
+        headerBytes.copy(prefix, 8);
+        const parts = [prefix, ...ARRAYS.map(name => {
+            const array = this.arrays[name];
+            return Buffer.from(array.buffer, array.byteOffset, array.byteLength);
+        })];
+        const tmpPath = `${CallGraph.path(indexPath)}.tmp`;
+        fs.writeFileSync(tmpPath, Buffer.concat(parts));
+        fs.renameSync(tmpPath, CallGraph.path(indexPath));
+    }
+
+    // Number of documents, not counting aliases
+    get size(): number {
+        return this.arrays.documentNames.length - this.arrays.aliasOf.length;
+    }
+
+    // Rough memory footprint, for cache budgets
+    get bytes(): number {
+        return ARRAYS.reduce((sum, name) => sum + this.arrays[name].byteLength, 0) +
+            this.names.reduce((sum, name) => sum + 2 * name.length, 0);
+    }
+
+    private row(offsets: ArrayName, items: ArrayName, r: number): number[] {
+        return Array.from(this.arrays[items].subarray(this.arrays[offsets][r], this.arrays[offsets][r + 1]));
+    }
+
+    // The name and calls of a document, as it was built from
+    document(doc: number): CallGraphDocument {
+        const id = this.arrays.documentNames[doc];
+        return {
+            name: id >= 0 ? this.names[id] : "",
+            calls: this.row("callOffsets", "calls", doc).map(call => this.names[call])
+        };
+    }
+
+    // Documents defining `name`
+    definitions(name: string): number[] {
+        const id = this.nameIds.get(name);
+        return id === undefined ? [] : this.row("definitionOffsets", "definitions", id);
+    }
+
+    // Documents that `doc` calls
+    callees(doc: number): number[] {
+        return this.row("calleeOffsets", "callees", doc);
+    }
+
+    // Documents that call `doc`
+    callers(doc: number): number[] {
+        return this.row("callerOffsets", "callers", doc);
+    }
+
+    // Documents calling any definition of `name`
+    callersOf(name: string): number[] {
+        return [...new Set(this.definitions(name).flatMap(doc => this.callers(doc)))].sort((a, b) => a - b);
+    }
+
+    // Documents called by any definition of `name`
+    calleesOf(name: string): number[] {
+        return [...new Set(this.definitions(name).flatMap(doc => this.callees(doc)))].sort((a, b) => a - b);
+    }
+
+    // The documents within `hops` calls of `docs` in either direction,
+    // nearest first, after the documents themselves; at most `limit` in all
+    expand(docs: number[], hops: number, limit = Infinity): number[] {
+        const seen = new Set(docs);
+        const result = [...docs];
+        let frontier = docs;
+        for (let hop = 0; hop < hops && frontier.length > 0 && result.length < limit; hop++) {
+            const next: number[] = [];
+            for (const doc of frontier) {
+                for (const neighbour of [...this.callees(doc), ...this.callers(doc)]) {
+                    if (!seen.has(neighbour) && result.length < limit) {
+                        seen.add(neighbour);
+                        result.push(neighbour);
+                        next.push(neighbour);
+                    }
+                }
+            }
+            frontier = next;
+        }
+        return result;
+    }
+}
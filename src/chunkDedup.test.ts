@@ -0,0 +1,34 @@
+import { ChunkDeduplicator, estimatedSimilarity, minHashSignature } from './chunkDedup';
+import { chunkTextHash } from './embeddingStore';
+
+describe('ChunkDeduplicator', () => {
+  const body = Array.from({ length: 30 }, (_, i) => `    total = total + values[${i}] * weight_${i}`).join('\n');
+  const original = `def weighted_sum(values):\n    total = 0\n${body}\n    return total`;
+  const renamed = original.replace('weighted_sum', 'weighted_total');
+  const unrelated = Array.from({ length: 30 }, (_, i) => `  const item${i} = await fetch(url${i}).then(r => r.json());`).join('\n');
+
+  const add = (dedup: ChunkDeduplicator, id: number, text: string) => dedup.add(id, chunkTextHash(text), text);
+
+  it('estimates the similarity of near-duplicates', () => {
+    const a = minHashSignature(original)!;
+    expect(estimatedSimilarity(a, minHashSignature(renamed)!)).toBeGreaterThan(0.9);
+    expect(estimatedSimilarity(a, minHashSignature(unrelated)!)).toBeLessThan(0.2);
+    expect(minHashSignature('def f(): pass')).toBeNull();
+  });
+
+  it('aliases exact and near copies to the first chunk', () => {
+    const dedup = new ChunkDeduplicator();
+    expect(add(dedup, 0, original)).toBeNull();
+    expect(add(dedup, 1, unrelated)).toBeNull();
+    expect(add(dedup, 2, `${original}\r\n`)).toBe(0);
+    expect(add(dedup, 2, renamed)).toBe(0);
+    expect(dedup.counts).toEqual({ exact: 1, near: 1 });
+  });
+
+  it('only deduplicates short chunks exactly', () => {
+    const dedup = new ChunkDeduplicator();
+    expect(add(dedup, 0, 'def get_x(self):\n    return self.x')).toBeNull();
+    expect(add(dedup, 1, 'def get_y(self):\n    return self.y')).toBeNull();
+    expect(add(dedup, 2, 'def get_x(self):\n    return self.x')).toBe(0);
+  });
+});
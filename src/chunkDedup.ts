@@ -0,0 +1,179 @@
+import { normaliseChunkText } from "./embeddingStore";
+
+// Detects chunks that repeat an earlier chunk of the same repository, so
+// that vendored copies, generated code and copy-pasted modules are embedded
+// and indexed once. The first chunk seen becomes the representative; later
+// copies become aliases pointing to it.
+//
+// Exact copies are found by their normalised text hash (chunkTextHash).
+// Near-duplicates are found by MinHash over token shingles with LSH
+// banding: a chunk whose signature shares a band with a representative's
+// is compared with it, and is an alias if their estimated Jaccard
+// similarity reaches the threshold. With 16 bands of 4 rows, chunks at 0.9
+// similarity share a band with probability above 0.999, and chunks at 0.5
+// are compared at all about 64% of the time.
+
+const NUM_HASHES = 64;
+const BAND_ROWS = 4;
+const SHINGLE_TOKENS = 4;
+// Chunks shorter than this many shingles are only deduplicated exactly:
+// small functions that differ in a name look alike but are not copies
+const MIN_SHINGLES = 16;
+export const DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.9;
+
+const TOKEN = /\w+|[^\s\w]/g;
+
+// 32-bit FNV-1a of a string
+function fnv1a(text: string): number {
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193);
+    }
+    return hash >>> 0;
+}
+
+// MurmurHash3's finaliser, used to derive one hash function per seed
+function mix(hash: number): number {
+    hash ^= hash >>> 16;
+    hash = Math.imul(hash, 0x85ebca6b);
+    hash ^= hash >>> 13;
+    hash = Math.imul(hash, 0xc2b2ae35);
+    hash ^= hash >>> 16;
+    return hash >>> 0;
+}
+
+const SEEDS = Array.from({ length: NUM_HASHES }, (_, i) => mix(i + 1));
+
+// The MinHash signature of a text, or null if it is too short to have one
+export function minHashSignature(text: string): Uint32Array | null {
+    const tokens = normaliseChunkText(text).match(TOKEN) ?? [];
+    const shingles = new Set<number>();
+    for (let i = 0; i + SHINGLE_TOKENS <= tokens.length; i++) {
+        shingles.add(fnv1a(tokens.slice(i, i + SHINGLE_TOKENS).join(" ")));
+    }
+    if (shingles.size < MIN_SHINGLES) {
+        return null;
+    }
+    const signature = new Uint32Array(NUM_HASHES).fill(0xffffffff);
+    for (const shingle of shingles) {
+        for (let h = 0; h < NUM_HASHES; h++) {
+            const value = mix(shingle ^ SEEDS[h]);
+            if (value < signature[h]) {
+                signature[h] = value;
+            }
+        }
+    }
+    return signature;
+}
+
+// Share of equal positions, an estimate of the texts' Jaccard similarity
+export function estimatedSimilarity(a: Uint32Array, b: Uint32Array): number {
+    let equal = 0;
+    for (let h = 0; h < a.length; h++) {
+        if (a[h] === b[h]) {
+            equal += 1;
+        }
+    }
+    return equal / a.length;
+}
+
+export type DuplicateKind = "exact" | "near";
+
+// A representative costs under 1KB of memory: its exact hash, 256 bytes of
+// signature and its band entries. Signatures share one growing buffer, a
+// band bucket holds a bare id until a second one joins it, and band keys
+// are cut to 30 bits so that V8 stores them as small integers.
+export class ChunkDeduplicator {
+    private exact = new Map<string, number>();
+    // Signature of the i-th representative with one, at i * NUM_HASHES
+    private signatures = new Uint32Array(1024 * NUM_HASHES);
+    private signatureCount = 0;
+    private signatureSlots = new Map<number, number>();
+    // One map per band from the band's key to the representatives in it
+    private bands: Map<number, number | number[]>[] = Array.from({ length: NUM_HASHES / BAND_ROWS }, () => new Map());
+    readonly counts: Record<DuplicateKind, number> = { exact: 0, near: 0 };
+
+    constructor(readonly threshold = DEFAULT_NEAR_DUPLICATE_THRESHOLD) {}
+
+    // The representative `text` (with normalised text hash `hash`) repeats,
+    // or null if it has none, in which case it becomes the representative
+    // `id` for the chunks after it
+    add(id: number, hash: string, text: string): number | null {
+        const exact = this.exact.get(hash);
+        if (exact !== undefined) {
+            this.counts.exact += 1;
+            return exact;
+        }
+        const signature = minHashSignature(text);
+        if (signature) {
+            const near = this.nearest(signature);
+            if (near !== null) {
+                this.counts.near += 1;
+                return near;
+            }
+        }
+
+        this.exact.set(hash, id);
+        if (signature) {
+            this.storeSignature(id, signature);
+            this.bands.forEach((band, b) => {
+                const key = this.bandKey(signature, b);
+                const bucket = band.get(key);
+                if (bucket === undefined) {
+                    band.set(key, id);
+                } else if (typeof bucket === "number") {
+                    band.set(key, [bucket, id]);
+                } else {
+                    bucket.push(id);
+                }
+            });
+        }
+        return null;
+    }
+
+    private storeSignature(id: number, signature: Uint32Array) {
+        if ((this.signatureCount + 1) * NUM_HASHES > this.signatures.length) {
+            const grown = new Uint32Array(this.signatures.length * 2);
+            grown.set(this.signatures);
+            this.signatures = grown;
+        }
+        this.signatures.set(signature, this.signatureCount * NUM_HASHES);
+        this.signatureSlots.set(id, this.signatureCount++);
+    }
+
+    private storedSignature(id: number): Uint32Array {
+        const start = this.signatureSlots.get(id)! * NUM_HASHES;
+        return this.signatures.subarray(start, start + NUM_HASHES);
+    }
+
+    private bandKey(signature: Uint32Array, band: number): number {
+        let key = 0;
+        for (let row = band * BAND_ROWS; row < (band + 1) * BAND_ROWS; row++) {
+            key = mix(key ^ signature[row]);
+        }
+        return key & 0x3fffffff;
+    }
+
+    // The most similar representative at or above the threshold
+    private nearest(signature: Uint32Array): number | null {
+        let best: number | null = null;
+        let bestSimilarity = this.threshold;
+        const compared = new Set<number>();
+        this.bands.forEach((band, b) => {
+            const bucket = band.get(this.bandKey(signature, b));
+            for (const candidate of typeof bucket === "number" ? [bucket] : bucket ?? []) {
+                if (compared.has(candidate)) {
+                    continue;
+                }
+                compared.add(candidate);
+                const similarity = estimatedSimilarity(signature, this.storedSignature(candidate));
+                if (similarity >= bestSimilarity && (best === null || similarity > bestSimilarity || candidate < best)) {
+                    best = candidate;
+                    bestSimilarity = similarity;
+                }
+            }
+        });
+        return best;
+    }
+}
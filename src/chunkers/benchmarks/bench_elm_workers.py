@@ -0,0 +1,64 @@
+"""Compare a fresh node process per Elm file with the persistent worker pool.
+
+Usage: python bench_elm_workers.py [--files N] [--functions N]
+
+Generates N synthetic Elm modules and parses them twice: once starting a new
+elm_parser_worker.js per file, which re-initialises the compiled Elm runtime
+every time (what parse_elm_file used to do), and once through one
+ElmParserPool that keeps its worker alive.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elm_ast_parser import ElmParserPool, ElmParserWorker  # noqa: E402
+
+
+def generate_module(index: int, functions: int) -> str:
+    lines = [f"module Module{index} exposing (..)", "", "import String", ""]
+    for j in range(functions):
+        lines += [f"func{j} : Int -> String", f"func{j} x =", f"    String.fromInt (x + {j})", ""]
+    return "\n".join(lines)
+
+
+def run_process_per_file(sources: list) -> int:
+    chunks = 0
+    for source in sources:
+        worker = ElmParserWorker()
+        try:
+            chunks += len(worker.parse(source))
+        finally:
+            worker.close()
+    return chunks
+
+
+def run_pool(sources: list) -> int:
+    pool = ElmParserPool()
+    try:
+        return sum(len(pool.parse(source)) for source in sources)
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--functions", type=int, default=20)
+    args = parser.parse_args()
+
+    sources = [generate_module(i, args.functions) for i in range(args.files)]
+    results = {}
+    for name, run in (("process-per-file", run_process_per_file), ("pool", run_pool)):
+        start = time.perf_counter()
+        chunks = run(sources)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"{name:>16}: {elapsed:7.2f}s  {len(sources) / elapsed:8.1f} files/s  ({chunks} chunks)")
+    print(f"{'speedup':>16}: {results['process-per-file'] / results['pool']:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Benchmark every parser entry point on synthetic corpora and check for regressions.
+
+Usage: python bench_parsers.py [--sizes 100,1000,...] [--only SUBSTRING] [--repeat N]
+                               [--check] [--threshold 0.25] [--update-baselines]
+
+Each case (entry point x corpus x size in lines) runs in a fresh interpreter
+so that its peak RSS is its own. Wall time is the best of --repeat runs.
+With --check, a case fails if its time or its RSS growth exceeds the stored
+baseline by more than --threshold (and by more than a small absolute noise
+floor), and the run exits with status 1. --update-baselines stores the
+results in baselines.json instead. Baselines are machine specific: refresh
+them on the machine that runs --check.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from corpus import CORPORA, elm_pipeline_ast  # noqa: E402
+
+BASELINES_PATH = os.path.join(BENCHMARKS_DIR, "baselines.json")
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+# Differences below these are noise, whatever the relative threshold says
+TIME_NOISE_SECONDS = 0.005
+RSS_NOISE_MB = 8.0
+
+
+def _python_source(source):
+    from py_ast_parser import parse_python_source
+    return len(parse_python_source(source))
+
+
+def _elm_scanner(source):
+    from elm_scanner import scan_elm_source
+    return len(scan_elm_source(source))
+
+
+_elm_pool = None
+
+
+def _elm_full_parse(source):
+    global _elm_pool
+    from elm_ast_parser import ElmParserPool
+    if _elm_pool is None:
+        _elm_pool = ElmParserPool(timeout=600)
+        # Start the worker outside the timed region
+        _elm_pool.parse("module Warmup exposing (x)\n\nx = 1\n")
+    return len(_elm_pool.parse(source))
+
+
+def _elm_get_calls(ast):
+    from elm_ast_parser import ElmCodeChunkVisitor
+    return len(ElmCodeChunkVisitor("").get_calls(ast))
+
+
+# name -> (function, corpora, largest size it is run at, required executable)
+ENTRY_POINTS = {
+    "py_ast_parser.parse_python_source": (
+        _python_source, ["python_flat", "python_deep_nesting", "python_huge_class"], None, None),
+    "elm_scanner.scan_elm_source": (_elm_scanner, ["elm_flat", "elm_pipelines"], None, None),
+    # The node parser is far slower; 100k-line modules would take minutes
+    "elm_ast_parser.ElmParserPool.parse": (_elm_full_parse, ["elm_flat", "elm_pipelines"], 10000, "node"),
+    # Counts calls in one pipeline of `size` stages rather than a file of `size` lines
+    "elm_ast_parser.get_calls": (_elm_get_calls, ["elm_pipeline_ast"], None, None),
+}
+
+
+def list_cases(sizes):
+    cases = []
+    for entry, (_, corpora, max_size, executable) in ENTRY_POINTS.items():
+        if executable and shutil.which(executable) is None:
+            print(f"Skipping {entry}: {executable} is not installed", file=sys.stderr)
+            continue
+        for corpus in corpora:
+            for size in sizes:
+                if max_size is None or size <= max_size:
+                    cases.append(f"{entry}|{corpus}|{size}")
+    return cases
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_case(case: str, repeat: int) -> dict:
+    """Run one case in this process and return its measurements"""
+    entry, corpus, size = case.split("|")
+    function = ENTRY_POINTS[entry][0]
+    data = elm_pipeline_ast(int(size)) if corpus == "elm_pipeline_ast" else CORPORA[corpus](int(size))
+    # Silence the parsers' debug output
+    sys.stderr = open(os.devnull, "w")
+    rss_before = _max_rss_mb()
+    function(data)
+    best = float("inf")
+    chunks = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = function(data)
+        best = min(best, time.perf_counter() - start)
+    peak = _max_rss_mb()
+    return {"seconds": best, "chunks": chunks, "chunksPerSecond": chunks / best if best else 0.0,
+            "peakRssMb": peak, "rssGrowthMb": peak - rss_before}
+
+
+def measure(case: str, repeat: int) -> dict:
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", case, "--repeat", str(repeat)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{case} failed: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def regressions(case: str, result: dict, baseline: dict, threshold: float) -> list:
+    found = []
+    if (result["seconds"] > baseline["seconds"] * (1 + threshold)
+            and result["seconds"] - baseline["seconds"] > TIME_NOISE_SECONDS):
+        found.append(f"{case}: {result['seconds']:.4f}s vs baseline {baseline['seconds']:.4f}s")
+    if (result["rssGrowthMb"] > baseline["rssGrowthMb"] * (1 + threshold)
+            and result["rssGrowthMb"] - baseline["rssGrowthMb"] > RSS_NOISE_MB):
+        found.append(f"{case}: RSS grew {result['rssGrowthMb']:.1f} MB vs baseline {baseline['rssGrowthMb']:.1f} MB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated corpus sizes in lines")
+    parser.add_argument("--only", default="", help="run only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="fail on regressions against baselines.json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown or RSS growth")
+    parser.add_argument("--update-baselines", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.repeat)))
+        return
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    cases = [case for case in list_cases([int(s) for s in args.sizes.split(",")]) if args.only in case]
+    print(f"{'case':<64} {'seconds':>9} {'chunks/s':>11} {'peak MB':>8} {'grew MB':>8}")
+    results = {}
+    failures = []
+    for case in cases:
+        result = measure(case, args.repeat)
+        results[case] = result
+        print(f"{case:<64} {result['seconds']:>9.4f} {result['chunksPerSecond']:>11.0f} "
+              f"{result['peakRssMb']:>8.1f} {result['rssGrowthMb']:>8.1f}", flush=True)
+        if args.check and case in baselines:
+            failures += regressions(case, result, baselines[case], args.threshold)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Updated {len(results)} baselines in {BASELINES_PATH}")
+
+    if failures:
+        print(f"\n{len(failures)} regressions beyond {args.threshold:.0%}:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
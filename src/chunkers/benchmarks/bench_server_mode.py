@@ -0,0 +1,72 @@
+"""Compare spawn-per-file chunking with the long-lived ``--server`` mode.
+
+Usage: python bench_server_mode.py [--files N] [--functions N]
+
+Writes N synthetic Python modules to a temporary directory and chunks them
+twice with py_ast_parser.py: once starting a fresh interpreter per file (what
+``chunkPyFile`` does) and once streaming every path through a single
+``--server`` process (what ``PythonParserPool`` does).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PARSER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "py_ast_parser.py")
+
+
+def write_corpus(directory: str, files: int, functions: int) -> list:
+    paths = []
+    for i in range(files):
+        lines = ["import os", "import json", ""]
+        for j in range(functions):
+            lines += [f"def func_{i}_{j}(x):", f"    return os.path.join(str(x), json.dumps({j}))", ""]
+        path = os.path.join(directory, f"module_{i}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        paths.append(path)
+    return paths
+
+
+def run_spawn_per_file(paths: list) -> int:
+    chunks = 0
+    for path in paths:
+        result = subprocess.run([sys.executable, PARSER, path], capture_output=True, text=True, check=True)
+        chunks += len(json.loads(result.stdout))
+    return chunks
+
+
+def run_server(paths: list) -> int:
+    requests = "".join(json.dumps({"path": path}) + "\n" for path in paths)
+    result = subprocess.run([sys.executable, PARSER, "--server"], input=requests,
+                            capture_output=True, text=True, check=True)
+    chunks = 0
+    for line in result.stdout.splitlines():
+        if "record" not in json.loads(line):
+            chunks += 1
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--functions", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_corpus(directory, args.files, args.functions)
+        results = {}
+        for name, run in (("spawn-per-file", run_spawn_per_file), ("server", run_server)):
+            start = time.perf_counter()
+            chunks = run(paths)
+            elapsed = time.perf_counter() - start
+            results[name] = elapsed
+            print(f"{name:>15}: {elapsed:7.2f}s  {len(paths) / elapsed:8.1f} files/s  ({chunks} chunks)")
+        print(f"{'speedup':>15}: {results['spawn-per-file'] / results['server']:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
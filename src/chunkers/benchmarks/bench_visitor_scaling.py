@@ -0,0 +1,67 @@
+"""Show how CodeChunkVisitor scales with file size.
+
+Usage: python bench_visitor_scaling.py [--max-lines N] [--repeat N]
+
+Generates modules of doubling size, each made of many small functions and
+one class per 50 functions, and reports the time spent in ast.parse and in
+the visitor. Linear scaling shows up as a flat microseconds-per-line column.
+"""
+import argparse
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py_ast_parser import CodeChunkVisitor  # noqa: E402
+
+
+def generate_module(functions: int) -> str:
+    lines = ["import os", ""]
+    for i in range(functions):
+        if i % 50 == 0:
+            lines += [f"class Group{i}:", "    def method(self):", "        return os.getcwd()", ""]
+        lines += [f"def func_{i}(x):", f"    y = helper(x, {i})", "    return str(y).strip()", ""]
+    return "\n".join(lines)
+
+
+def best_of(repeat: int, run) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-lines", type=int, default=128000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'lines':>8} {'chunks':>7} {'parse ms':>9} {'visit ms':>9} {'visit us/line':>14}")
+    functions = 250
+    while True:
+        source = generate_module(functions)
+        line_count = source.count("\n") + 1
+        if line_count > args.max_lines:
+            break
+        tree = ast.parse(source)
+        parse_time = best_of(args.repeat, lambda: ast.parse(source))
+
+        def visit():
+            visitor = CodeChunkVisitor(source)
+            visitor.visit(tree)
+            return visitor
+
+        visit_time = best_of(args.repeat, visit)
+        chunks = len(visit().chunks)
+        print(f"{line_count:>8} {chunks:>7} {parse_time * 1e3:>9.1f} {visit_time * 1e3:>9.1f} "
+              f"{visit_time * 1e6 / line_count:>14.2f}")
+        functions *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Deterministic synthetic Python and Elm sources for the parser benchmarks.
+
+Every generator takes a target line count and returns source of about that
+many lines (never fewer). The output depends only on the arguments, so the
+same corpus is benchmarked on every run and on every machine.
+"""
+import random
+from typing import Callable, Dict, List
+
+
+def _fill(target_lines: int, unit: Callable[[int], List[str]], header: List[str]) -> str:
+    lines = list(header)
+    i = 0
+    while len(lines) < target_lines:
+        lines += unit(i)
+        i += 1
+    return "\n".join(lines) + "\n"
+
+
+def python_flat(target_lines: int) -> str:
+    """Many small top-level functions, with a class every 50 functions"""
+    def unit(i: int) -> List[str]:
+        lines = []
+        if i % 50 == 0:
+            lines += [f"class Group{i}:", "    def method(self):", "        return os.getcwd()", ""]
+        return lines + [f"def func_{i}(x):", f"    y = helper(x, {i})", "    return str(y).strip()", ""]
+    return _fill(target_lines, unit, ["import os", "import json", ""])
+
+
+def python_deep_nesting(target_lines: int) -> str:
+    """Functions made of deeply nested blocks, closures and call chains"""
+    rng = random.Random(target_lines)
+
+    def unit(i: int) -> List[str]:
+        depth = rng.randint(6, 18)
+        lines = [f"def nested_{i}(items):"]
+        for d in range(depth):
+            indent = "    " * (d + 1)
+            lines.append(f"{indent}{'for' if d % 2 else 'if'} {'v' + str(d) + ' in items' if d % 2 else 'items'}:")
+        indent = "    " * (depth + 1)
+        call = "x"
+        for d in range(rng.randint(5, 15)):
+            call = f"f{d}({call}, g{d}(h{d}({d})))"
+        lines += [f"{indent}x = {call}", f"{indent}def inner(y):", f"{indent}    return y.strip().lower()",
+                  f"{indent}items = inner(x)", "    return items", ""]
+        return lines
+    return _fill(target_lines, unit, ["import functools", ""])
+
+
+def python_huge_class(target_lines: int) -> str:
+    """One class holding every method, so it has to be split by the token budget"""
+    def unit(i: int) -> List[str]:
+        return [f"    def method_{i}(self, value):", f"        result = self.compute(value, {i})",
+                "        if result:", f"            return self.store(result, key={i})", "        return None", ""]
+    return _fill(target_lines, unit, ["import os", "", "class Huge:", '    """A very large class."""', "",
+                                      "    size = 0", ""])
+
+
+def elm_flat(target_lines: int) -> str:
+    """Documented functions, type aliases and custom types"""
+    def unit(i: int) -> List[str]:
+        lines = [f"{{-| Function {i}", "-}", f"func{i} : Int -> String", f"func{i} x =",
+                 f"    String.fromInt (x + {i})", ""]
+        if i % 10 == 0:
+            lines += [f"type alias Record{i} =", "    { name : String", "    , count : Int", "    }", "",
+                      f"type Msg{i}", f"    = Clicked{i}", f"    | Changed{i} String", ""]
+        return lines
+    return _fill(target_lines, unit, ["module Flat exposing (..)", "", "import String", "import Html exposing (Html)", ""])
+
+
+def elm_pipelines(target_lines: int) -> str:
+    """Functions whose bodies are long |> pipelines and nested case trees"""
+    rng = random.Random(target_lines)
+
+    def unit(i: int) -> List[str]:
+        lines = [f"pipeline{i} : List Int -> List String", f"pipeline{i} items =", "    items"]
+        for d in range(rng.randint(20, 60)):
+            lines.append(f"        |> List.map (\\x -> x + {d})")
+        lines += ["        |> List.map String.fromInt", "", f"classify{i} : Int -> String", f"classify{i} n =",
+                  "    case n of"]
+        for d in range(rng.randint(5, 15)):
+            lines += [f"        {d} ->", f"            \"value {d}\"", ""]
+        lines += ["        _ ->", "            \"other\"", ""]
+        return lines
+    return _fill(target_lines, unit, ["module Pipelines exposing (..)", "", "import List", "import String", ""])
+
+
+def elm_pipeline_ast(length: int) -> Dict:
+    """The elm-syntax style AST of a single |> pipeline of the given length"""
+    node: Dict = {"type": "FunctionOrValue", "name": "items"}
+    for d in range(length):
+        node = {
+            "type": "OperatorApplication",
+            "operator": "|>",
+            "left": node,
+            "right": {
+                "type": "Application",
+                "function": {"type": "FunctionOrValue", "module": ["List"], "name": "map"},
+                "arguments": [{"type": "Integer", "value": d}],
+            },
+        }
+    return {"type": "FunctionDeclaration", "name": "pipeline", "expression": node}
+
+
+CORPORA = {
+    "python_flat": python_flat,
+    "python_deep_nesting": python_deep_nesting,
+    "python_huge_class": python_huge_class,
+    "elm_flat": elm_flat,
+    "elm_pipelines": elm_pipelines,
+}
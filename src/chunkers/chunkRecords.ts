@@ -0,0 +1,96 @@
+import { PythonChunk } from "./pythonParserPool";
+
+// First record of every file in the output of the Python chunkers (see
+// chunk_records.py): the fields all of the file's chunks share.
+export interface FileHeader {
+    record: "header";
+    filePath: string;
+    language: string;
+    imports: string[];
+    hash: string;
+}
+
+export type ExpandedChunk = PythonChunk & { language: string };
+
+// Turns the compact chunk records of chunk_records.py back into full chunks,
+// one record at a time, by re-attaching the fields of the last header seen.
+export class ChunkRecordReader {
+    private header: FileHeader | null = null;
+
+    // Returns the full chunk for a chunk record, and null for header, end and
+    // error records.
+    expand(record: any): ExpandedChunk | null {
+        if (record.record === "header") {
+            this.header = record;
+            return null;
+        }
+        if (record.record !== undefined) {
+            return null;
+        }
+        return {
+            ...record,
+            imports: record.imports ?? this.header?.imports ?? [],
+            filePath: this.header?.filePath ?? record.filePath,
+            language: this.header?.language ?? record.language
+        };
+    }
+}
+
+// One file's record on the metrics channel of the Python chunkers
+// (--metrics-fd, see chunker_log.py). Timings are in milliseconds.
+export interface FileMetrics {
+    record: "metrics";
+    filePath: string;
+    language: string;
+    cached: boolean;
+    bytes: number;
+    lines: number;
+    nodes: number | null;
+    chunks: number;
+    // Why the file was chunked by line windows, or null if it was parsed
+    fallback: string | null;
+    timings: Record<string, number>;
+}
+
+// Totals over the metrics records of many files
+export class MetricsSummary {
+    files = 0;
+    cached = 0;
+    lines = 0;
+    chunks = 0;
+    fallbacks = 0;
+    timings: Record<string, number> = {};
+
+    add(metrics: FileMetrics) {
+        this.files += 1;
+        this.cached += metrics.cached ? 1 : 0;
+        this.lines += metrics.lines;
+        this.chunks += metrics.chunks;
+        this.fallbacks += metrics.fallback ? 1 : 0;
+        for (const [phase, ms] of Object.entries(metrics.timings)) {
+            this.timings[phase] = (this.timings[phase] ?? 0) + ms;
+        }
+    }
+
+    // Adds the metrics record on one line of the channel, ignoring anything else
+    addLine(line: string) {
+        if (line.trim().length === 0) {
+            return;
+        }
+        try {
+            const record = JSON.parse(line);
+            if (record.record === "metrics") {
+                this.add(record);
+            }
+        } catch {
+            // The metrics channel is diagnostics only
+        }
+    }
+
+    toString(): string {
+        const phases = Object.entries(this.timings)
+            .map(([phase, ms]) => `${phase} ${ms.toFixed(1)}ms`)
+            .join(", ");
+        return `${this.files} files (${this.cached} cached), ${this.lines} lines, ${this.chunks} chunks, ${this.fallbacks} by line windows; ${phases}`;
+    }
+}
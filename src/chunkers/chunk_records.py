@@ -0,0 +1,77 @@
+"""Streaming record format shared by the chunker scripts.
+
+Each parsed file is written as a header record holding the fields every
+chunk of the file shares, one record per chunk without those fields, and an
+end record:
+
+    {"record": "header", "filePath": ..., "language": ..., "imports": [...], "hash": ...}
+    {"type": "function", "name": ..., "code": ..., ...}
+    {"record": "end", "filePath": ..., "chunks": n, ...}
+
+A file that fails is a single {"record": "error", "filePath", "error"}
+instead. Readers put filePath, language and imports back on each chunk; a
+chunk whose imports differ from the header's keeps its own. Records are
+encoded as NDJSON, or as a stream of msgpack maps when msgpack is installed.
+"""
+import hashlib
+import json
+from typing import IO, Dict, Iterator, List
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ("json", "ndjson", "msgpack")
+
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def file_records(file_path: str, language: str, source: str, chunks: List[Dict]) -> Iterator[Dict]:
+    """Yield the header record and the compact chunk records of one file"""
+    imports = chunks[0].get("imports", []) if chunks else []
+    yield {"record": "header", "filePath": file_path, "language": language, "imports": imports,
+           "hash": source_hash(source)}
+    for chunk in chunks:
+        yield {
+            key: value for key, value in chunk.items()
+            if key not in ("filePath", "language") and not (key == "imports" and value == imports)
+        }
+
+
+def expand_records(records: Iterator[Dict]) -> Iterator[Dict]:
+    """Undo file_records: yield full chunks and the end and error records"""
+    header: Dict = {}
+    for record in records:
+        kind = record.get("record")
+        if kind == "header":
+            header = record
+            continue
+        if kind is None:
+            record.setdefault("imports", header.get("imports", []))
+            record["filePath"] = header.get("filePath")
+            record["language"] = header.get("language")
+        yield record
+
+
+class RecordWriter:
+    """Writes records to a binary stream as NDJSON or msgpack"""
+
+    def __init__(self, out: IO[bytes], fmt: str = "ndjson"):
+        if fmt == "msgpack" and msgpack is None:
+            raise RuntimeError("msgpack output requires the msgpack package (pip install msgpack)")
+        self.out = out
+        self.fmt = fmt
+        self.packer = msgpack.Packer() if fmt == "msgpack" else None
+
+    def write(self, record: Dict):
+        if self.packer is not None:
+            self.out.write(self.packer.pack(record))
+        else:
+            self.out.write(json.dumps(record).encode("utf-8"))
+            self.out.write(b"\n")
+
+    def flush(self):
+        self.out.flush()
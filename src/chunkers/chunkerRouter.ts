@@ -1,24 +1,18 @@
-import { spawnSync } from "child_process";
+import { spawn, spawnSync } from "child_process";
 import fs from "fs";
 import path from "path";
+import { createInterface } from "readline";
+import { Readable } from "stream";
 import { CodeChunk, chunkTSFile } from "./tsChunker";
 import { chunkElmFile } from "./elmChunker";
+import { PARSER_TIMEOUT_MS, PythonChunk, PythonParserPool } from "./pythonParserPool";
+import { ChunkRecordReader, MetricsSummary } from "./chunkRecords";
+import { DiscoveryOptions, FileDiscovery, SkippedFile, summariseSkipped } from "./fileDiscovery";
 
 // Import the debugLogger
 import { debugLogger } from "../index";
 
-interface PythonChunk {
-    type: "function" | "class";
-    name: string;
-    code: string;
-    filePath: string;
-    startLine: number;
-    endLine: number;
-    calls: string[];
-    imports: string[];
-}
-
-export function chunkPyFile(filePath: string): CodeChunk[] {
+export function chunkPyFile(filePath: string, maxTokens?: number): CodeChunk[] {
     const scriptPath = path.join(__dirname, "py_ast_parser.py");
     debugLogger.log(`Using Python parser script: ${scriptPath}`);
     
@@ -28,40 +22,94 @@ export function chunkPyFile(filePath: string): CodeChunk[] {
     }
     
     try {
-        const result = spawnSync("python3", [scriptPath, filePath]);
+        const args = [scriptPath, filePath, "--format", "ndjson", "--metrics-fd", "3"];
+        if (maxTokens !== undefined) {
+            args.push("--max-tokens", String(maxTokens));
+        }
+        const result = spawnSync("python3", args, {
+            stdio: ["ignore", "pipe", "pipe", "pipe"],
+            timeout: PARSER_TIMEOUT_MS
+        });
     
         if (result.error) {
             debugLogger.log(`Error running Python parser: ${result.error.message}`);
             return [];
         }
+        // stderr only carries log messages; failures arrive as error records
         if (result.stderr.length > 0) {
             debugLogger.log(`Python parser stderr: ${result.stderr.toString()}`);
-            return [];
         }
     
-        const pythonChunks: PythonChunk[] = JSON.parse(result.stdout.toString());
+        const pythonChunks: PythonChunk[] = [];
+        const records = new ChunkRecordReader();
+        for (const line of result.stdout.toString().split("\n")) {
+            if (line.trim().length === 0) {
+                continue;
+            }
+            const record = JSON.parse(line);
+            if (record.record === "error") {
+                debugLogger.log(`Error processing file ${filePath}: ${record.error}`);
+                return [];
+            }
+            if (record.record === "end" && record.fallback) {
+                debugLogger.log(`Chunked ${filePath} by lines: ${record.fallback}`);
+            }
+            const chunk = records.expand(record);
+            if (chunk) {
+                pythonChunks.push(chunk);
+            }
+        }
+        if (result.status !== 0) {
+            debugLogger.log(`Python parser exited with code ${result.status}`);
+            return [];
+        }
+        const metrics = new MetricsSummary();
+        (result.output[3]?.toString() ?? "").split("\n").forEach(line => metrics.addLine(line));
+        if (metrics.files > 0) {
+            debugLogger.log(`Python parser metrics: ${metrics}`);
+        }
         debugLogger.log(`Found ${pythonChunks.length} Python chunks`);
         
-        // Convert Python chunks to CodeChunks
-        return pythonChunks.map(chunk => ({
-            type: chunk.type,
-            name: chunk.name,
-            code: chunk.code,
-            filePath: chunk.filePath,
-            startLine: chunk.startLine,
-            endLine: chunk.endLine,
-            language: "python",
-            calls: chunk.calls,
-            imports: chunk.imports
-        }));
+        return toCodeChunks(pythonChunks);
     } catch (error) {
         debugLogger.log(`Error processing Python file: ${error}`);
         return [];
     }
 }
+
+// Same as chunkPyFile, but sends the file to a warm parser from `pool`
+// instead of starting a new Python interpreter.
+export async function chunkPyFileWithPool(filePath: string, pool: PythonParserPool): Promise<CodeChunk[]> {
+    try {
+        const pythonChunks = await pool.parse(filePath);
+        debugLogger.log(`Found ${pythonChunks.length} Python chunks`);
+        return toCodeChunks(pythonChunks);
+    } catch (error) {
+        debugLogger.log(`Error processing Python file: ${error}`);
+        return [];
+    }
+}
+
+// Convert Python chunks to CodeChunks
+function toCodeChunks(pythonChunks: PythonChunk[], language: string = "python"): CodeChunk[] {
+    return pythonChunks.map(chunk => ({
+        type: chunk.type,
+        name: chunk.name,
+        code: chunk.code,
+        filePath: chunk.filePath,
+        startLine: chunk.startLine,
+        endLine: chunk.endLine,
+        language,
+        calls: chunk.calls,
+        imports: chunk.imports,
+        id: chunk.id,
+        parentId: chunk.parentId,
+        fallback: chunk.fallback
+    }));
+}
   
   
-export function chunkFileByExtension(filePath: string): CodeChunk[] {
+export async function chunkFileByExtension(filePath: string, pool?: PythonParserPool): Promise<CodeChunk[]> {
     try {
       debugLogger.log(`Processing file: ${filePath}`);
       const ext = path.extname(filePath);
@@ -86,7 +134,7 @@ export function chunkFileByExtension(filePath: string): CodeChunk[] {
         chunks = chunkTSFile(filePath);
       } else if (ext === ".py") {
         debugLogger.log('Processing Python file');
-        chunks = chunkPyFile(filePath);
+        chunks = pool ? await chunkPyFileWithPool(filePath, pool) : chunkPyFile(filePath);
       } else if (ext === ".elm") {
         debugLogger.log('Processing Elm file');
         chunks = chunkElmFile(filePath);
@@ -113,78 +161,145 @@ export function chunkFileByExtension(filePath: string): CodeChunk[] {
     }
   }
   
-export function walkAndChunkDirectory(dirPath: string): CodeChunk[] {
-    try {
-      debugLogger.log(`Starting to walk directory: ${dirPath}`);
-      
-      if (!fs.existsSync(dirPath)) {
-        throw new Error(`Directory does not exist: ${dirPath}`);
-      }
+export interface RepositoryChunkOptions {
+    // Worker processes used by repo_chunker.py; defaults to one per CPU.
+    workers?: number;
+    // Token budget for Python chunks; larger definitions are split.
+    maxTokens?: number;
+    // Ignore files and size limits deciding which files are chunked
+    discovery?: DiscoveryOptions;
+}
 
-      const stats = fs.statSync(dirPath);
-      if (!stats.isDirectory()) {
-        throw new Error(`Path is not a directory: ${dirPath}`);
-      }
+const TS_EXTENSIONS = [".ts", ".tsx", ".js", ".jsx"];
 
-      let chunks: CodeChunk[] = [];
-      const entries = fs.readdirSync(dirPath, { withFileTypes: true });
-      
-      debugLogger.log(`Found ${entries.length} entries in directory: ${dirPath}`);
-      debugLogger.log('Entries:', entries.map(e => `${e.isDirectory() ? '[DIR]' : '[FILE]'} ${e.name}`).join('\n'));
-      
-      if (entries.length === 0) {
-        debugLogger.log(`Directory is empty: ${dirPath}`);
-        return chunks;
-      }
+// Every extension chunkFileByExtension has a chunker for
+export const SUPPORTED_EXTENSIONS = [...TS_EXTENSIONS, ".py", ".elm"];
 
-      for (const entry of entries) {
-        const fullPath = path.join(dirPath, entry.name);
-        try {
-          if (entry.isDirectory()) {
-            debugLogger.log(`Processing directory: ${fullPath}`);
-            const subChunks = walkAndChunkDirectory(fullPath);
-            if (subChunks && subChunks.length > 0) {
-              chunks = chunks.concat(subChunks);
-              debugLogger.log(`Added ${subChunks.length} chunks from directory ${fullPath}`);
-            }
-          } else if ([".ts", ".tsx", ".js", ".jsx", ".py", ".elm"].includes(path.extname(fullPath))) {
-            debugLogger.log(`Processing supported file: ${fullPath}`);
-            try {
-              const fileChunks = chunkFileByExtension(fullPath);
-              if (fileChunks && Array.isArray(fileChunks)) {
-                if (fileChunks.length > 0) {
-                  chunks = chunks.concat(fileChunks);
-                  debugLogger.log(`Added ${fileChunks.length} chunks from ${fullPath}`);
-                } else {
-                  debugLogger.log(`No chunks extracted from ${fullPath}`);
-                }
-              } else {
-                debugLogger.log(`Invalid chunks returned from ${fullPath}:`, JSON.stringify(fileChunks, null, 2));
-              }
-            } catch (err) {
-              debugLogger.log(`Error processing file ${fullPath}:`, err);
-              if (err instanceof Error) {
-                debugLogger.log('Error stack:', err.stack);
-              }
-            }
-          } else {
-            debugLogger.log(`Skipping unsupported file: ${fullPath}`);
-          }
-        } catch (err) {
-          debugLogger.log(`Error processing ${fullPath}:`, err);
-          if (err instanceof Error) {
-            debugLogger.log('Error stack:', err.stack);
+// Logs every file discovery skipped, and a count per reason
+export function logSkippedFiles(skipped: SkippedFile[]) {
+    for (const file of skipped) {
+      debugLogger.log(`Skipped ${file.filePath}: ${file.reason} (${file.detail})`);
+    }
+    debugLogger.log(`Skipped ${skipped.length} files: ${summariseSkipped(skipped)}`);
+  }
+
+// Streams the chunks of the given Python and Elm files from repo_chunker.py,
+// which parses them on a process pool and emits them in the given order.
+async function* streamPythonSideChunks(dirPath: string, files: string[], options: RepositoryChunkOptions): AsyncGenerator<CodeChunk> {
+    if (files.length === 0) {
+      return;
+    }
+    const scriptPath = path.join(__dirname, "repo_chunker.py");
+    const args = [scriptPath, dirPath, "--files-from", "-"];
+    if (options.workers) {
+      args.push("--workers", String(options.workers));
+    }
+    if (options.maxTokens !== undefined) {
+      args.push("--max-tokens", String(options.maxTokens));
+    }
+    args.push("--metrics-fd", "3");
+    const proc = spawn("python3", args, { stdio: ["pipe", "pipe", "inherit", "pipe"] });
+    // A failed spawn is reported through the exit code below
+    proc.stdin!.on("error", () => {});
+    proc.stdin!.end(files.map(file => `${file}\n`).join(""));
+    const metrics = new MetricsSummary();
+    createInterface({ input: proc.stdio[3] as Readable }).on("line", line => metrics.addLine(line));
+    const exitCode = new Promise<number | null>((resolve) => {
+      proc.on("error", (error) => {
+        debugLogger.log(`Error running repo_chunker.py: ${error.message}`);
+        resolve(null);
+      });
+      proc.on("exit", resolve);
+    });
+
+    const records = new ChunkRecordReader();
+    try {
+      for await (const line of createInterface({ input: proc.stdout! })) {
+        if (line.trim().length === 0) {
+          continue;
+        }
+        const record = JSON.parse(line);
+        if (record.record === "error") {
+          debugLogger.log(`Error processing file ${record.filePath}: ${record.error}`);
+        } else if (record.record === "end") {
+          const note = record.fallback ? ` (by lines: ${record.fallback})` : record.cached ? ' (parse cache)' : '';
+          debugLogger.log(`Added ${record.chunks} chunks from ${record.filePath}${note}`);
+        } else {
+          const chunk = records.expand(record);
+          if (chunk) {
+            yield toCodeChunks([chunk], chunk.language)[0];
           }
         }
       }
 
-      debugLogger.log(`Total chunks collected: ${chunks.length}`);
-      return chunks;
-    } catch (error) {
-      debugLogger.log(`Error in walkAndChunkDirectory: ${error}`);
-      if (error instanceof Error) {
-        debugLogger.log('Error stack:', error.stack);
+      const code = await exitCode;
+      if (code !== 0) {
+        throw new Error(`repo_chunker.py exited with code ${code}`);
+      }
+      debugLogger.log(`repo_chunker.py metrics: ${metrics}`);
+    } finally {
+      if (proc.exitCode === null && proc.signalCode === null) {
+        proc.kill();
+      }
+    }
+  }
+
+// Chunks a whole repository: TypeScript/JavaScript files are chunked in this
+// process while repo_chunker.py parses Python and Elm files on all cores.
+export async function* streamRepositoryChunks(dirPath: string, options: RepositoryChunkOptions = {}): AsyncGenerator<CodeChunk> {
+    if (!fs.existsSync(dirPath) || !fs.statSync(dirPath).isDirectory()) {
+      throw new Error(`Path is not a directory: ${dirPath}`);
+    }
+
+    const { files, skipped } = new FileDiscovery(dirPath, options.discovery).walk(SUPPORTED_EXTENSIONS);
+    logSkippedFiles(skipped);
+    yield* streamFileChunks(dirPath, files, options);
+  }
+
+// Chunks the given files of the repository at `dirPath`, TS/JS files in this
+// process and the rest on repo_chunker.py's pool, both at once.
+async function* streamFileChunks(dirPath: string, files: string[], options: RepositoryChunkOptions): AsyncGenerator<CodeChunk> {
+    const tsFiles = files.filter(file => TS_EXTENSIONS.includes(path.extname(file)));
+    const pythonSideFiles = files.filter(file => !TS_EXTENSIONS.includes(path.extname(file)));
+
+    // Start the Python side first so it works while the TS files are chunked.
+    const pythonSide = streamPythonSideChunks(dirPath, pythonSideFiles, options);
+    const firstPythonChunk = pythonSide.next();
+    // Errors are re-raised when the result is awaited below.
+    firstPythonChunk.catch(() => {});
+
+    for (const filePath of tsFiles) {
+      try {
+        yield* chunkTSFile(filePath);
+      } catch (err) {
+        debugLogger.log(`Error processing file ${filePath}:`, err);
       }
-      throw error;
     }
-  }
\ No newline at end of file
+
+    for (let next = await firstPythonChunk; !next.done; next = await pythonSide.next()) {
+      yield next.value;
+    }
+  }
+
+export async function chunkRepository(dirPath: string, options: RepositoryChunkOptions = {}): Promise<CodeChunk[]> {
+    const chunks: CodeChunk[] = [];
+    for await (const chunk of streamRepositoryChunks(dirPath, options)) {
+      chunks.push(chunk);
+    }
+    debugLogger.log(`Total chunks collected: ${chunks.length}`);
+    return chunks;
+  }
+
+// Chunks an explicit list of files of the repository at `dirPath`, e.g. the
+// ones changed since it was last indexed, the same way as a whole
+// repository: Python and Elm files go to one repo_chunker.py run. Unsupported
+// or missing files yield no chunks.
+export async function chunkFiles(dirPath: string, filePaths: string[], options: RepositoryChunkOptions = {}): Promise<CodeChunk[]> {
+    const files = filePaths.filter(filePath => SUPPORTED_EXTENSIONS.includes(path.extname(filePath)) && fs.existsSync(filePath));
+    const chunks: CodeChunk[] = [];
+    for await (const chunk of streamFileChunks(dirPath, files, options)) {
+      chunks.push(chunk);
+    }
+    debugLogger.log(`Total chunks collected from ${filePaths.length} files: ${chunks.length}`);
+    return chunks;
+  }
@@ -0,0 +1,105 @@
+"""Leveled logging and per-file metrics for the chunker scripts.
+
+Diagnostics go through the standard logging module under the "chunkers"
+logger. Messages use lazy %-formatting, so a disabled level costs one level
+check. The scripts log warnings and errors only, unless --log-level or
+CHUNKER_LOG_LEVEL asks for more.
+
+Metrics are a separate channel: with --metrics-fd N, every file processed
+produces one JSON line on file descriptor N:
+
+    {"record": "metrics", "filePath": ..., "language": ..., "cached": ...,
+     "bytes": ..., "lines": ..., "nodes": ..., "chunks": ..., "fallback": ...,
+     "timings": {"read": ms, "cache": ms, "parse": ms, "visit": ms, "serialise": ms}}
+
+A phase that did not run is left out of timings (a cache hit has no parse or
+visit). nodes is the number of AST nodes, or null for parsers that do not
+build an AST. fallback is null, or why the file was chunked by line windows
+instead of parsed (see file_budget). Chunk output on stdout is never mixed with either channel.
+"""
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+LOG_LEVEL_ENV = "CHUNKER_LOG_LEVEL"
+LOG_LEVELS = ("debug", "info", "warning", "error")
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"chunkers.{name}")
+
+
+def configure_logging(level: Optional[str] = None):
+    """Send chunker logs at level (default: $CHUNKER_LOG_LEVEL or warning) to stderr"""
+    level = (level or os.environ.get(LOG_LEVEL_ENV) or "warning").upper()
+    logger = logging.getLogger("chunkers")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+class FileStats:
+    """Phase timings (in milliseconds) and counts gathered while chunking one file.
+
+    Counting AST nodes takes an extra walk, so parsers only do it when
+    count_nodes is set.
+    """
+
+    def __init__(self, count_nodes: bool = False):
+        self.count_nodes = count_nodes
+        self.timings: Dict[str, float] = {}
+        self.nodes: Optional[int] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 3)
+
+
+def metrics_record(file_path: str, language: str, source: str, chunks: int, cached: bool,
+                   stats: FileStats, fallback: Optional[str] = None) -> Dict:
+    return {
+        "record": "metrics",
+        "filePath": file_path,
+        "language": language,
+        "cached": cached,
+        "bytes": len(source.encode("utf-8", "surrogatepass")),
+        "lines": source.count("\n") + (0 if source.endswith("\n") or not source else 1),
+        "nodes": stats.nodes,
+        "chunks": chunks,
+        "fallback": fallback,
+        "timings": dict(stats.timings),
+    }
+
+
+class MetricsWriter:
+    """Writes metrics records as NDJSON to an inherited file descriptor"""
+
+    def __init__(self, fd: int):
+        self.out = os.fdopen(fd, "w", encoding="utf-8", closefd=False)
+
+    def write(self, record: Dict):
+        self.out.write(json.dumps(record))
+        self.out.write("\n")
+        self.out.flush()
+
+
+def open_metrics(fd: Optional[int]) -> Optional[MetricsWriter]:
+    return MetricsWriter(fd) if fd is not None else None
+
+
+def read_source(file_path: str, stats: FileStats) -> str:
+    with stats.phase("read"):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
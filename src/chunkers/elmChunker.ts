@@ -1,6 +1,7 @@
 import { execSync } from "child_process";
 import path from "path";
 import fs from "fs";
+import { PARSER_TIMEOUT_MS } from "./pythonParserPool";
 
 interface RAGChunk {
   type: string;
@@ -36,7 +37,8 @@ export function chunkElmFile(filePath: string, logger: { log: (message: string)
     logger.log('Executing Elm parser...');
     const result = execSync(`python3 "${scriptPath}" "${filePath}"`, {
       encoding: "utf-8",
-      stdio: ['pipe', 'pipe', 'pipe']
+      stdio: ['pipe', 'pipe', 'pipe'],
+      timeout: PARSER_TIMEOUT_MS
     });
     
     logger.log('Parsing JSON result...');
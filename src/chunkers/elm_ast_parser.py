@@ -1,10 +1,51 @@
+import argparse
+import atexit
 import json
 import sys
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
+import queue
 import subprocess
-import tempfile
+import threading
+import time
 import os
 
+try:
+    from .parse_cache import DEFAULT_CACHE_PATH, ParseCache
+    from .elm_scanner import SCANNER_VERSION, scan_elm_source
+    from .chunk_records import FORMATS, RecordWriter, file_records
+    from .file_budget import DEFAULT_MEMORY_BUDGET, DEFAULT_TIME_BUDGET, limit_memory, parse_within_budget
+    from .chunker_log import (LOG_LEVELS, FileStats, configure_logging, get_logger, metrics_record,
+                              open_metrics, read_source)
+except ImportError:
+    from parse_cache import DEFAULT_CACHE_PATH, ParseCache
+    from elm_scanner import SCANNER_VERSION, scan_elm_source
+    from chunk_records import FORMATS, RecordWriter, file_records
+    from file_budget import DEFAULT_MEMORY_BUDGET, DEFAULT_TIME_BUDGET, limit_memory, parse_within_budget
+    from chunker_log import (LOG_LEVELS, FileStats, configure_logging, get_logger, metrics_record,
+                             open_metrics, read_source)
+
+# Bump whenever the chunks produced for the same source change, so that
+# cached results of older versions are not reused.
+PARSER_VERSION = "1"
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'elm_parser', 'elm_parser_worker.js')
+DEFAULT_TIMEOUT = 30.0
+# Workers whose resident set grows past this are replaced after their request
+DEFAULT_MAX_RSS = 512 * 1024 * 1024
+
+# Fields of AST nodes that hold names, positions, documentation, types or
+# patterns but never expressions, so get_calls does not descend into them
+NON_EXPRESSION_FIELDS = frozenset({
+    'start', 'end', 'range', 'name', 'module', 'moduleName', 'operator',
+    'documentation', 'signature', 'typeAnnotation', 'pattern', 'patterns',
+})
+
+# Expression types that cannot contain calls
+LEAF_EXPRESSIONS = frozenset({
+    'FunctionOrValue', 'Literal', 'CharLiteral', 'Integer', 'Hex', 'Floatable',
+    'PrefixOperator', 'Operator', 'GLSLExpression', 'UnitExpr', 'RecordAccessFunction',
+})
+
 class ElmParserError(Exception):
     """Base exception for Elm parser errors"""
     pass
@@ -21,8 +62,7 @@ class SubprocessError(ElmParserError):
     """Raised when there's an error running the elm-ast-parser subprocess"""
     pass
 
-def debug(*args):
-    print(*args, file=sys.stderr)
+log = get_logger("elm")
 
 class ElmCodeChunkVisitor:
     def __init__(self, source_code: str):
@@ -46,7 +86,7 @@ class ElmCodeChunkVisitor:
             try:
                 self.visit_declaration(declaration)
             except Exception as e:
-                debug(f"Error visiting declaration: {str(e)}")
+                log.warning("Error visiting declaration: %s", e)
                 continue
 
     def visit_declaration(self, declaration_node: Dict):
@@ -72,9 +112,9 @@ class ElmCodeChunkVisitor:
             elif decl_type == 'Destructuring':
                 self.visit_destructuring(declaration_node)
             else:
-                debug(f"Unknown declaration type: {decl_type}")
+                log.warning("Unknown declaration type: %s", decl_type)
         except Exception as e:
-            debug(f"Error processing {decl_type}: {str(e)}")
+            log.warning("Error processing %s: %s", decl_type, e)
             raise
 
     def visit_function(self, function_node: Dict):
@@ -106,7 +146,7 @@ class ElmCodeChunkVisitor:
                 "imports": self.imports
             })
         except Exception as e:
-            debug(f"Error creating function chunk: {str(e)}")
+            log.warning("Error creating function chunk: %s", e)
             raise
 
     def visit_type_alias(self, type_node: Dict):
@@ -138,7 +178,7 @@ class ElmCodeChunkVisitor:
                 "imports": self.imports
             })
         except Exception as e:
-            debug(f"Error creating type alias chunk: {str(e)}")
+            log.warning("Error creating type alias chunk: %s", e)
             raise
 
     def visit_custom_type(self, type_node: Dict):
@@ -170,7 +210,7 @@ class ElmCodeChunkVisitor:
                 "imports": self.imports
             })
         except Exception as e:
-            debug(f"Error creating custom type chunk: {str(e)}")
+            log.warning("Error creating custom type chunk: %s", e)
             raise
 
     def visit_port(self, port_node: Dict):
@@ -202,7 +242,7 @@ class ElmCodeChunkVisitor:
                 "imports": self.imports
             })
         except Exception as e:
-            debug(f"Error creating port chunk: {str(e)}")
+            log.warning("Error creating port chunk: %s", e)
             raise
 
     def visit_infix(self, infix_node: Dict):
@@ -235,11 +275,16 @@ class ElmCodeChunkVisitor:
                 raise ASTParseError(f"Line numbers out of range: {start_line}-{end_line} (file has {len(lines)} lines)")
             return "\n".join(lines[start_line - 1:end_line])
         except Exception as e:
-            debug(f"Error extracting code: {str(e)}")
+            log.warning("Error extracting code: %s", e)
             raise
 
     def get_calls(self, node: Dict) -> List[str]:
-        """Extract function calls from a node"""
+        """Extract function calls from a node, in source order.
+
+        Uses an explicit stack, so arbitrarily deep expressions (long
+        pipelines, nested case trees) cannot hit the recursion limit, and
+        skips fields that never contain expressions.
+        """
         if not isinstance(node, dict):
             raise ASTParseError("Node must be a dictionary")
             
@@ -247,9 +292,6 @@ class ElmCodeChunkVisitor:
         
         def visit_application(app_node: Dict):
             """Visit an Application node (function call)"""
-            if not isinstance(app_node, dict):
-                return
-                
             function = app_node.get('function', {})
             if function.get('type') == 'FunctionOrValue':
                 module = function.get('module', [])
@@ -261,43 +303,208 @@ class ElmCodeChunkVisitor:
 
         def visit_operator_application(op_node: Dict):
             """Visit an OperatorApplication node"""
-            if not isinstance(op_node, dict):
-                return
-                
             operator = op_node.get('operator', '')
             if operator:
                 calls.append(operator)
 
-        def traverse(node: Dict):
-            """Traverse all nodes recursively"""
-            if not isinstance(node, dict):
-                return
-
-            node_type = node.get('type')
-            if node_type == 'Application':
-                visit_application(node)
-            elif node_type == 'OperatorApplication':
-                visit_operator_application(node)
-
-            # Recursively visit all values in the node
-            for value in node.values():
-                if isinstance(value, dict):
-                    traverse(value)
-                elif isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, dict):
-                            traverse(item)
-
         try:
-            traverse(node)
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                node_type = current.get('type')
+                if node_type == 'Application':
+                    visit_application(current)
+                elif node_type == 'OperatorApplication':
+                    visit_operator_application(current)
+                elif node_type in LEAF_EXPRESSIONS:
+                    continue
+
+                # Push children in reverse so they are visited in source order
+                children = []
+                for field, value in current.items():
+                    if field in NON_EXPRESSION_FIELDS:
+                        continue
+                    if isinstance(value, dict):
+                        children.append(value)
+                    elif isinstance(value, list):
+                        children.extend(item for item in value if isinstance(item, dict))
+                children.reverse()
+                stack.extend(children)
             return calls
         except Exception as e:
-            debug(f"Error getting calls: {str(e)}")
+            log.warning("Error getting calls: %s", e)
             return []
 
-def parse_elm_file(file_path: str) -> List[Dict]:
-    """Parse an Elm file and return a list of code chunks"""
-    debug(f"Reading Elm file: {file_path}")
+class ElmParserWorker:
+    """A node process that keeps Elm.ElmParser initialised between requests.
+
+    Sources are sent as JSON lines on stdin and results read back from
+    stdout by a reader thread, so that every request can be given a timeout.
+    """
+
+    def __init__(self, script_path: str = WORKER_SCRIPT):
+        self.next_id = 0
+        self.rss = 0
+        self.responses = queue.Queue()
+        try:
+            self.process = subprocess.Popen(
+                ['node', script_path],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+            )
+        except OSError as e:
+            raise SubprocessError(f"Failed to start Elm parser worker: {str(e)}")
+        self.reader = threading.Thread(target=self._read_responses, daemon=True)
+        self.reader.start()
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            self.responses.put(line)
+        # None marks the end of output: the worker has exited
+        self.responses.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def parse(self, source_code: str, timeout: float = DEFAULT_TIMEOUT) -> List[Dict]:
+        """Parse one Elm module. Raises SubprocessError if the worker dies or
+        does not finish within timeout seconds; the worker is then unusable."""
+        return list(self.iter_parse(source_code, timeout))
+
+    def iter_parse(self, source_code: str, timeout: float = DEFAULT_TIMEOUT) -> Iterator[Dict]:
+        """Yield the chunks of one Elm module as the worker streams them, one
+        declaration per line, so the module's output is never decoded at once.
+        The generator must be exhausted before the worker takes another request."""
+        self.next_id += 1
+        request_id = self.next_id
+        try:
+            self.process.stdin.write(json.dumps({"id": request_id, "source": source_code}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            raise SubprocessError(f"Elm parser worker is not running: {str(e)}")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            response = self._next_response(deadline, timeout)
+            if response.get('id') != request_id:
+                log.warning("Ignoring unexpected Elm parser worker output: %s", response)
+            elif response.get('type') == 'chunk':
+                yield response['value']
+            else:
+                break
+
+        self.rss = response.get('rss', 0)
+        if response.get('type') == 'error':
+            raise ASTParseError(f"Failed to parse Elm file: {response.get('error')}")
+
+    def _next_response(self, deadline: float, timeout: float) -> Dict:
+        try:
+            line = self.responses.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            self.close()
+            raise SubprocessError(f"Elm parser worker did not answer within {timeout} seconds")
+        if line is None:
+            self.close()
+            raise SubprocessError(f"Elm parser worker exited with code {self.process.returncode}")
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as e:
+            self.close()
+            raise ASTParseError(f"Failed to parse parser output: {str(e)}")
+
+    def close(self):
+        if self.alive:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+
+class ElmParserPool:
+    """A thread-safe pool of up to size ElmParserWorkers, started on demand.
+
+    A worker that crashes or times out is discarded, and one whose resident
+    set exceeds max_rss bytes is replaced once its request is done.
+    """
+
+    def __init__(self, size: int = 1, timeout: float = DEFAULT_TIMEOUT,
+                 max_rss: int = DEFAULT_MAX_RSS, script_path: str = WORKER_SCRIPT):
+        self.size = size
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.script_path = script_path
+        self.idle: List[ElmParserWorker] = []
+        self.started = 0
+        self.recycled = 0
+        self.available = threading.Condition()
+
+    def _acquire(self) -> ElmParserWorker:
+        with self.available:
+            while not self.idle and self.started >= self.size:
+                self.available.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+        try:
+            return ElmParserWorker(self.script_path)
+        except Exception:
+            with self.available:
+                self.started -= 1
+                self.available.notify()
+            raise
+
+    def _release(self, worker: ElmParserWorker):
+        if worker.alive and worker.rss <= self.max_rss:
+            with self.available:
+                self.idle.append(worker)
+                self.available.notify()
+            return
+        worker.close()
+        with self.available:
+            self.started -= 1
+            self.recycled += 1
+            self.available.notify()
+        log.info("Recycled Elm parser worker (rss %d bytes)", worker.rss)
+
+    def parse(self, source_code: str) -> List[Dict]:
+        worker = self._acquire()
+        try:
+            return worker.parse(source_code, self.timeout)
+        finally:
+            self._release(worker)
+
+    def close(self):
+        with self.available:
+            idle, self.idle = self.idle, []
+            self.started -= len(idle)
+        for worker in idle:
+            worker.close()
+
+
+# One default pool per process: a pool's workers belong to the process that
+# started them and must not be used from forked children.
+_default_pools: Dict[int, ElmParserPool] = {}
+
+
+def default_pool() -> ElmParserPool:
+    pid = os.getpid()
+    if pid not in _default_pools:
+        _default_pools[pid] = ElmParserPool()
+        atexit.register(_default_pools[pid].close)
+    return _default_pools[pid]
+
+
+def parse_elm_file(file_path: str, cache: Optional[ParseCache] = None,
+                   pool: Optional[ElmParserPool] = None, full_parse: bool = False) -> List[Dict]:
+    """Parse an Elm file and return a list of code chunks; see parse_elm_source"""
+    log.debug("Reading Elm file: %s", file_path)
     
     # Check if file exists
     if not os.path.exists(file_path):
@@ -306,64 +513,103 @@ def parse_elm_file(file_path: str) -> List[Dict]:
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             source_code = f.read()
-            debug(f"File contents length: {len(source_code)} characters")
-            
-            # Create a temporary file for the Elm code
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.elm', delete=False) as temp:
-                temp.write(source_code)
-                temp_path = temp.name
-
-            try:
-                # Get the directory where this script is located
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                elm_parser_path = os.path.join(script_dir, 'elm_parser.js')
-                result = subprocess.run(
-                    ['node', elm_parser_path, temp_path],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                
-                # Parse the JSON output from our parser
-                try:
-                    result_data = json.loads(result.stdout)
-                    if result_data.get('type') == 'error':
-                        raise ASTParseError(f"Failed to parse Elm file: {result_data.get('error')}")
-                    chunks = result_data.get('value', [])
-                except json.JSONDecodeError as e:
-                    raise ASTParseError(f"Failed to parse parser output: {str(e)}")
-                
-                debug(f"Found {len(chunks)} chunks in {file_path}")
-                return chunks
-                
-            finally:
-                # Clean up the temporary file
-                try:
-                    os.unlink(temp_path)
-                except Exception as e:
-                    debug(f"Warning: Failed to delete temporary file {temp_path}: {str(e)}")
-                
+        log.debug("File contents length: %d characters", len(source_code))
     except Exception as e:
-        if isinstance(e, ElmParserError):
-            raise
         raise FileReadError(f"Error reading Elm file {file_path}: {str(e)}")
 
+    return parse_elm_source(source_code, file_path, cache, pool, full_parse)
+
+
+def parse_elm_source(source_code: str, file_path: str = "<string>", cache: Optional[ParseCache] = None,
+                     pool: Optional[ElmParserPool] = None, full_parse: bool = False,
+                     stats: Optional[FileStats] = None) -> List[Dict]:
+    """Parse Elm source and return a list of code chunks, consulting cache first if given.
+
+    By default declarations are found by elm_scanner without starting node.
+    With full_parse the source is parsed by pool (or this process's default
+    pool of node workers), falling back to the scanner if that fails or
+    times out; the result is cached either way, so a file that defeats the
+    full parser does not cost a timeout on every run. Timings are recorded
+    in stats.
+    """
+    stats = stats or FileStats()
+    if cache is not None:
+        if full_parse:
+            key = ParseCache.make_key(source_code, "elm", PARSER_VERSION)
+        else:
+            key = ParseCache.make_key(source_code, "elm-scanner", SCANNER_VERSION)
+        with stats.phase("cache"):
+            chunks = cache.get(key)
+        if chunks is not None:
+            log.debug("Parse cache hit for %s", file_path)
+            return chunks
+
+    with stats.phase("parse"):
+        if full_parse:
+            try:
+                chunks = (pool or default_pool()).parse(source_code)
+            except (SubprocessError, ASTParseError) as e:
+                log.warning("Full parse of %s failed, scanning declarations instead: %s", file_path, e)
+                chunks = scan_elm_source(source_code)
+        else:
+            chunks = scan_elm_source(source_code)
+    log.debug("Found %d chunks in %s", len(chunks), file_path)
+    if cache is not None:
+        with stats.phase("cache"):
+            cache.put(key, chunks)
+    return chunks
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk an Elm source file by top-level declarations")
+    parser.add_argument("file", help="Elm file to chunk")
+    parser.add_argument("--no-cache", action="store_true", help="always parse, ignoring the parse cache")
+    parser.add_argument("--full-parse", action="store_true",
+                        help="parse with the node parser, falling back to the declaration scanner")
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="json: one array of chunks; ndjson/msgpack: header, chunk and end records")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, help="stderr log level (default: warning)")
+    parser.add_argument("--metrics-fd", type=int, help="write a metrics record for the file to this file descriptor")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET,
+                        help="seconds before the file is chunked by lines instead (0 disables)")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET,
+                        help="megabytes of address space for this process (0 disables)")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    limit_memory(args.memory_budget)
+    metrics = open_metrics(args.metrics_fd)
+    file_path = args.file
+    writer = RecordWriter(sys.stdout.buffer, args.format) if args.format != "json" else None
     try:
-        if len(sys.argv) != 2:
-            print("Usage: python elm_ast_parser.py <elm_file>", file=sys.stderr)
-            sys.exit(1)
-            
-        file_path = sys.argv[1]
-        debug(f"Processing file: {file_path}")
-        chunks = parse_elm_file(file_path)
-        for chunk in chunks:
-            chunk["filePath"] = file_path
-            chunk["language"] = "elm"
-        print(json.dumps(chunks))
-    except ElmParserError as e:
-        debug(f"Error: {str(e)}")
-        sys.exit(1)
+        log.debug("Processing file: %s", file_path)
+        cache = None if args.no_cache else ParseCache(DEFAULT_CACHE_PATH)
+        stats = FileStats()
+        if not os.path.exists(file_path):
+            raise FileReadError(f"File not found: {file_path}")
+        source_code = read_source(file_path, stats)
+        hits = cache.hits if cache is not None else 0
+        chunks, fallback = parse_within_budget(
+            lambda: parse_elm_source(source_code, file_path, cache, full_parse=args.full_parse, stats=stats),
+            source_code, file_path, args.time_budget)
+        cached = cache is not None and cache.hits > hits
+        with stats.phase("serialise"):
+            if writer is None:
+                for chunk in chunks:
+                    chunk["filePath"] = file_path
+                    chunk["language"] = "elm"
+                print(json.dumps(chunks))
+            else:
+                for record in file_records(file_path, "elm", source_code, chunks):
+                    writer.write(record)
+                end = {"record": "end", "filePath": file_path, "chunks": len(chunks), "cached": cached}
+                if fallback is not None:
+                    end["fallback"] = fallback
+                writer.write(end)
+                writer.flush()
+        if metrics is not None:
+            metrics.write(metrics_record(file_path, "elm", source_code, len(chunks), cached, stats, fallback))
     except Exception as e:
-        debug(f"Unexpected error: {str(e)}")
-        sys.exit(1) 
\ No newline at end of file
+        log.error("Error chunking %s: %s", file_path, e)
+        if writer is not None:
+            writer.write({"record": "error", "filePath": file_path, "error": str(e)})
+            writer.flush()
+        sys.exit(1)
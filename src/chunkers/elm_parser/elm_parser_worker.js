@@ -0,0 +1,62 @@
+// Long-lived Elm parser worker used by elm_ast_parser.py.
+//
+// Initialises Elm.ElmParser once and then reads one JSON request per line on
+// stdin, {"id": n, "source": "..."}. Each chunk of the result is written as
+// its own line, {"id": n, "type": "chunk", "value": chunk}, so that the caller
+// never has to decode a whole module at once. The request then ends with
+// {"id": n, "type": "ok", "chunks": count} or {"id": n, "type": "error",
+// "error": message}, both carrying the worker's resident set size in "rss" so
+// that the caller can recycle workers that grow too large. Requests are
+// parsed one at a time, in the order they arrive.
+const { createInterface } = require('readline');
+const { Elm } = require('./elm_parser.js');
+
+const app = Elm.ElmParser.init();
+const queue = [];
+let current = null;
+
+function next() {
+    if (current !== null || queue.length === 0) {
+        return;
+    }
+    current = queue.shift();
+    app.ports.parseFile.send(current.source);
+}
+
+function respond(message) {
+    message.rss = process.memoryUsage().rss;
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+app.ports.parseResult.subscribe(result => {
+    const id = current.id;
+    current = null;
+    if (result.type === 'ok') {
+        for (const chunk of result.value) {
+            process.stdout.write(JSON.stringify({ id, type: 'chunk', value: chunk }) + '\n');
+        }
+        respond({ id, type: 'ok', chunks: result.value.length });
+    } else {
+        respond({ id, type: 'error', error: result.error });
+    }
+    next();
+});
+
+createInterface({ input: process.stdin }).on('line', line => {
+    if (line.trim().length === 0) {
+        return;
+    }
+    let request;
+    try {
+        request = JSON.parse(line);
+    } catch (error) {
+        respond({ id: null, type: 'error', error: `Invalid request: ${error.message}` });
+        return;
+    }
+    if (typeof request.source !== 'string') {
+        respond({ id: request.id, type: 'error', error: 'Request has no source' });
+        return;
+    }
+    queue.push(request);
+    next();
+});
@@ -0,0 +1,174 @@
+"""Split Elm source into top-level declarations without parsing it.
+
+Elm's layout rule makes every top-level item start in column 0, and nothing
+else can start there except comments and the inside of multi-line strings or
+block comments. scan_elm_source therefore only needs to track string and
+comment state from line to line to find declaration boundaries, in one
+linear pass. It produces the same chunks as the node-based parser (calls are
+left empty and ports are skipped, as there) in a fraction of the time, and
+also works on files the full parser rejects. test_elm_scanner checks this
+against the Elm sources in this repository.
+"""
+import re
+from typing import Dict, List, Optional
+
+# Bump whenever the chunks produced for the same source change
+SCANNER_VERSION = "2"
+
+# Anything that can change string or comment state
+_SPECIAL = re.compile(r'"""|"|\'|--|\{-|-\}')
+_STRING = re.compile(r'(?:[^"\\]|\\.)*"')
+_CHAR = re.compile(r"(?:[^'\\]|\\.)*'")
+_TRIPLE_END = re.compile(r'(?:[^"\\]|\\.|"(?!""))*"""')
+_COMMENT_TOKEN = re.compile(r'\{-|-\}')
+
+_TYPE_ALIAS = re.compile(r'type\s+alias\s+([A-Z]\w*)')
+_TYPE = re.compile(r'type\s+([A-Z]\w*)')
+_PORT = re.compile(r'port\s+([a-z_]\w*)\s*:')
+_SIGNATURE = re.compile(r'([a-z_]\w*)\s*:(?![:])')
+_DEFINITION = re.compile(r'([a-z_]\w*)\b[^=]*=')
+_IMPORT = re.compile(r'import\s+([A-Z][\w.]*)')
+# Keywords only count as whole words: `imports = ...` or `moduleName : ...`
+# are ordinary declarations
+_IMPORT_KEYWORD = re.compile(r'import\s')
+_MODULE_KEYWORD = re.compile(r'(?:port\s+|effect\s+)?module\s')
+_INFIX_KEYWORD = re.compile(r'infix\s')
+
+
+def _scan_line(line: str, depth: int, in_triple: bool) -> tuple:
+    """Return the block comment depth and triple-quoted string state after line"""
+    pos = 0
+    length = len(line)
+    while pos < length:
+        if in_triple:
+            match = _TRIPLE_END.match(line, pos)
+            if match is None:
+                return depth, True
+            pos = match.end()
+            in_triple = False
+        elif depth > 0:
+            match = _COMMENT_TOKEN.search(line, pos)
+            if match is None:
+                return depth, False
+            depth += 1 if match.group() == '{-' else -1
+            pos = match.end()
+        else:
+            match = _SPECIAL.search(line, pos)
+            if match is None:
+                return 0, False
+            token = match.group()
+            pos = match.end()
+            if token == '--':
+                return 0, False
+            if token == '{-':
+                depth = 1
+            elif token == '"""':
+                in_triple = True
+            elif token == '"':
+                string = _STRING.match(line, pos)
+                pos = string.end() if string else length
+            elif token == "'":
+                char = _CHAR.match(line, pos)
+                pos = char.end() if char else length
+    return depth, in_triple
+
+
+def _classify(line: str) -> tuple:
+    """Classify a line that starts a top-level item as (kind, name)"""
+    if line.startswith('{-|'):
+        return 'doc', None
+    if line.startswith('--') or line.startswith('{-'):
+        return 'comment', None
+    if _IMPORT_KEYWORD.match(line):
+        match = _IMPORT.match(line)
+        return 'import', match.group(1) if match else None
+    if _MODULE_KEYWORD.match(line):
+        return 'module', None
+    if line.startswith('type'):
+        match = _TYPE_ALIAS.match(line) or _TYPE.match(line)
+        if match:
+            return 'class', match.group(1)
+    if _PORT.match(line) or _INFIX_KEYWORD.match(line):
+        # The node-based parser makes no chunks for ports or infix declarations
+        return 'other', None
+    match = _SIGNATURE.match(line)
+    if match:
+        return 'signature', match.group(1)
+    match = _DEFINITION.match(line)
+    if match:
+        return 'definition', match.group(1)
+    if line[0].isalpha() or line[0] == '(':
+        # A destructuring or something the scanner does not recognise
+        return 'other', None
+    return 'continuation', None
+
+
+def scan_elm_source(source_code: str) -> List[Dict]:
+    """Return the top-level declarations of an Elm module as chunks"""
+    lines = source_code.splitlines()
+    imports: List[str] = []
+    items: List[Dict] = []
+    current: Optional[Dict] = None
+    doc_start: Optional[int] = None
+    depth, in_triple = 0, False
+    # Inside a comment that started in column 0 and so belongs to no declaration
+    in_top_level_comment = False
+    # A doc comment right after the module header documents the module
+    after_module = False
+
+    for number, line in enumerate(lines, 1):
+        at_top_level = depth == 0 and not in_triple
+        starts_item = at_top_level and line[:1] not in ('', ' ', '\t')
+        if at_top_level:
+            in_top_level_comment = False
+        if depth or in_triple or _SPECIAL.search(line):
+            depth, in_triple = _scan_line(line, depth, in_triple)
+
+        if not starts_item:
+            if current is not None and not in_top_level_comment and line.strip():
+                current['end'] = number
+            continue
+
+        kind, name = _classify(line)
+        if kind == 'continuation':
+            if current is not None:
+                current['end'] = number
+            continue
+        if kind == 'comment':
+            in_top_level_comment = depth > 0
+            continue
+        if kind == 'doc':
+            in_top_level_comment = depth > 0
+            current = None
+            doc_start = None if after_module else number
+            after_module = False
+            continue
+        after_module = kind == 'module'
+        if kind == 'definition' and current is not None and current['kind'] == 'signature' and current['name'] == name:
+            current['kind'] = 'definition'
+            current['end'] = number
+            continue
+
+        if kind == 'import' and name:
+            imports.append(name)
+        start = number
+        if doc_start is not None and kind in ('class', 'signature', 'definition'):
+            start = doc_start
+        doc_start = None
+        current = {'kind': kind, 'name': name, 'start': start, 'end': number}
+        items.append(current)
+
+    chunks = []
+    for item in items:
+        if item['kind'] in ('module', 'import', 'other'):
+            continue
+        chunks.append({
+            "type": "class" if item['kind'] == 'class' else "function",
+            "name": item['name'],
+            "code": "\n".join(lines[item['start'] - 1:item['end']]),
+            "startLine": item['start'],
+            "endLine": item['end'],
+            "calls": [],
+            "imports": imports,
+        })
+    return chunks
@@ -0,0 +1,97 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { FileDiscovery, contentSkipReason, parseIgnoreRules } from './fileDiscovery';
+
+describe('FileDiscovery', () => {
+  let root: string;
+
+  const write = (name: string, content: string) => {
+    const filePath = path.join(root, name);
+    fs.mkdirSync(path.dirname(filePath), { recursive: true });
+    fs.writeFileSync(filePath, content);
+  };
+  const relative = (files: string[]) => files.map(file => path.relative(root, file).split(path.sep).join('/'));
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'file-discovery-'));
+    write('.gitignore', 'dist/\n*.gen.ts\n!keep.gen.ts\n');
+    write('src/a.ts', 'export const a = 1;\n');
+    write('src/b.gen.ts', 'export const b = 1;\n');
+    write('src/keep.gen.ts', 'export const keep = 1;\n');
+    write('src/lib/.ragignore', '/legacy.py\n');
+    write('src/lib/legacy.py', 'def legacy():\n    pass\n');
+    write('src/lib/current.py', 'def current():\n    pass\n');
+    write('dist/out.js', 'var out = 1;\n');
+    write('node_modules/dep/index.js', 'module.exports = 1;\n');
+    write('web/app.min.js', 'var a=1;\n');
+    write('web/bundle.js', `${'var x=function(a){return a+1};'.repeat(100)}\n`);
+    write('web/schema.ts', '// Code generated by protoc. DO NOT EDIT.\nexport const s = 1;\n');
+    write('web/notes.txt', 'not code\n');
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  it('honours ignore files and skips generated and minified files', () => {
+    const { files, skipped } = new FileDiscovery(root).walk(['.ts', '.js', '.py']);
+    expect(relative(files)).toEqual(['src/a.ts', 'src/keep.gen.ts', 'src/lib/current.py']);
+    const reasons = Object.fromEntries(skipped.map(file => [relative([file.filePath])[0], file.reason]));
+    expect(reasons).toEqual({
+      'dist': 'ignored',
+      'node_modules': 'ignored',
+      'src/b.gen.ts': 'ignored',
+      'src/lib/legacy.py': 'ignored',
+      'web/app.min.js': 'ignored',
+      'web/bundle.js': 'minified',
+      'web/schema.ts': 'generated'
+    });
+  });
+
+  it('enforces byte and line limits', () => {
+    write('src/long.ts', 'let x = 1;\n'.repeat(50));
+    const discovery = new FileDiscovery(root, { maxBytes: 300, maxLines: 20 });
+    const { files, skipped } = discovery.filter([path.join(root, 'src/a.ts'), path.join(root, 'src/long.ts')]);
+    expect(relative(files)).toEqual(['src/a.ts']);
+    expect(skipped.map(file => file.reason)).toEqual(['too-large']);
+    expect(new FileDiscovery(root, { maxLines: 20 }).filter([path.join(root, 'src/long.ts')]).skipped[0].reason)
+      .toBe('too-many-lines');
+  });
+
+  it('checks the directories of listed files against ignore rules', () => {
+    const { files, skipped } = new FileDiscovery(root).filter([
+      path.join(root, 'dist/out.js'),
+      path.join(root, 'src/lib/legacy.py'),
+      path.join(root, 'src/lib/current.py')
+    ]);
+    expect(relative(files)).toEqual(['src/lib/current.py']);
+    expect(skipped.map(file => file.detail)).toEqual(['directory dist', 'file']);
+  });
+
+  it('detects encoded data and binary content', () => {
+    const random = Buffer.from(Array.from({ length: 3000 }, (_, i) => (i * 7919) % 251)).toString('base64');
+    expect(contentSkipReason(Buffer.from(`const data = "${random}";\n`))?.reason).toBe('encoded-data');
+    expect(contentSkipReason(Buffer.from([0x61, 0x00, 0x62]))?.reason).toBe('binary');
+    expect(contentSkipReason(Buffer.from('def f():\n    return 1\n'))).toBeNull();
+    expect(contentSkipReason(Buffer.from('x = 1\n'.repeat(20001)))?.detail).toBe('20001 lines, limit 20000');
+    expect(contentSkipReason(Buffer.from('x = 1\n'.repeat(20000)))).toBeNull();
+  });
+
+  it('only takes generated markers from comments', () => {
+    expect(contentSkipReason(Buffer.from('#!/usr/bin/env python\n# @generated by tool\nx = 1\n'))?.detail).toBe('header says "@generated"');
+    expect(contentSkipReason(Buffer.from('/*\n * This file was generated by elm-codegen\n */\n'))?.reason).toBe('generated');
+    expect(contentSkipReason(Buffer.from('"""This file was generated by protoc."""\n'))?.reason).toBe('generated');
+    expect(contentSkipReason(Buffer.from('{- DO NOT EDIT -}\nmodule Gen exposing (..)\n'))?.reason).toBe('generated');
+    expect(contentSkipReason(Buffer.from('const banner = "DO NOT EDIT";\n'))).toBeNull();
+    expect(contentSkipReason(Buffer.from('// Skips files marked "@generated"\nexport const a = 1;\n'))).toBeNull();
+    expect(contentSkipReason(Buffer.from('def is_generated(header):\n    return "@generated" in header\n'))).toBeNull();
+  });
+
+  it('parses gitignore patterns', () => {
+    const [anchored, anywhere] = parseIgnoreRules('# comment\n/build\n*.pyc\n', '');
+    expect(anchored.pattern.test('build')).toBe(true);
+    expect(anchored.pattern.test('src/build')).toBe(false);
+    expect(anywhere.pattern.test('pkg/x.pyc')).toBe(true);
+  });
+});
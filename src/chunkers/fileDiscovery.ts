@@ -0,0 +1,323 @@
+import fs from "fs";
+import path from "path";
+
+// Decides which files of a repository are worth indexing.
+//
+// A file is skipped when
+// - an ignore file excludes it: `.gitignore` and `.ragignore` in any
+//   directory, with git's pattern syntax and precedence (a rule in a deeper
+//   directory, or later in the same file, wins; `!` re-includes), or one of
+//   DEFAULT_IGNORE_PATTERNS matches;
+// - it is larger than maxBytes or longer than maxLines;
+// - it looks binary (a NUL byte), generated (a comment near the top with a
+//   marker such as "@generated" or "DO NOT EDIT"; the same words in code or
+//   a string do not count) or minified (most of its bytes are in lines of
+//   LONG_LINE characters or more);
+// - it looks like encoded data: long lines of characters whose entropy is
+//   close to base64's. Minified code and ordinary code both measure around
+//   5 bits per character, so entropy is only used for this.
+//
+// Every skipped file is reported with its reason.
+
+export type SkipReason = "ignored" | "too-large" | "too-many-lines" | "binary" | "generated" | "minified" | "encoded-data";
+
+export interface SkippedFile {
+    filePath: string;
+    reason: SkipReason;
+    detail: string;
+}
+
+export interface DiscoveryOptions {
+    // Names of the ignore files read in every directory
+    ignoreFiles?: string[];
+    // Extra patterns, as if they were in an ignore file at the root
+    ignorePatterns?: string[];
+    maxBytes?: number;
+    maxLines?: number;
+}
+
+export interface DiscoveryReport {
+    files: string[];
+    skipped: SkippedFile[];
+}
+
+export const DEFAULT_IGNORE_FILES = [".gitignore", ".ragignore"];
+
+// Dependency, vendored and build trees that are almost never committed on
+// purpose, and bundle names that are always build output
+export const DEFAULT_IGNORE_PATTERNS = [
+    ".git/", "node_modules/", "bower_components/", "elm-stuff/", "__pycache__/", ".venv/", "venv/",
+    "*.min.js", "*.bundle.js", "*-bundle.js"
+];
+
+export const DEFAULT_MAX_BYTES = 1024 * 1024;
+// Hand-written modules stay well under the line limit: the longest in
+// CPython 3.11's Lib has under 9000 lines, and the ones past 15000 are
+// generated (pydoc_data/topics.py, SWIG wrappers). Within maxBytes, a file
+// past 20000 lines averages under 52 bytes a line: data tables, fixtures
+// and generated lists, whose chunks would crowd out the code.
+export const DEFAULT_MAX_LINES = 20000;
+
+const LONG_LINE = 500;
+// Share of a file's bytes in long lines above which it counts as minified
+const MINIFIED_SHARE = 0.5;
+// Bits per character of base64 is 6; source code is around 4.5 to 5.3
+const ENCODED_DATA_ENTROPY = 5.6;
+// A marker counts on a line that starts a comment (or a Python docstring),
+// unless it is quoted, as when a comment talks about markers
+const GENERATED_MARKERS = /^[ \t]*(?:\/\/|\/\*|\*|#|--|\{-|"""|''')(?:[^\n]*?[^"'`\n])?(@generated|DO NOT EDIT|Code generated by|auto-?generated|This file was generated)/im;
+// Bytes at the top of a file searched for generated markers
+const HEADER_BYTES = 1024;
+
+interface IgnoreRule {
+    // Directory of the ignore file, relative to the root ("" for the root)
+    base: string;
+    pattern: RegExp;
+    negate: boolean;
+    directoryOnly: boolean;
+}
+
+// Translates one gitignore glob to a regular expression source
+function globToRegExp(glob: string): string {
+    let source = "";
+    for (let i = 0; i < glob.length; i++) {
+        const c = glob[i];
+        if (glob.startsWith("**/", i)) {
+            source += "(?:.*/)?";
+            i += 2;
+        } else if (glob.startsWith("/**", i) && i + 3 === glob.length) {
+            source += "/.*";
+            i += 2;
+        } else if (glob.startsWith("**", i)) {
+            source += ".*";
+            i += 1;
+        } else if (c === "*") {
+            source += "[^/]*";
+        } else if (c === "?") {
+            source += "[^/]";
+        } else if (c === "[" && glob.indexOf("]", i + 2) > 0) {
+            const end = glob.indexOf("]", i + 2);
+            const body = glob.slice(i + 1, end).replace(/\\/g, "\\\\");
+            source += body.startsWith("!") ? `[^${body.slice(1)}]` : `[${body}]`;
+            i = end;
+        } else if (c === "\\" && i + 1 < glob.length) {
+            source += glob[i + 1].replace(/[.*+?^${}()|[\]\\/]/g, "\\$&");
+            i += 1;
+        } else {
+            source += c.replace(/[.*+?^${}()|[\]\\/]/g, "\\$&");
+        }
+    }
+    return source;
+}
+
+// The rules of one ignore file in directory `base`
+export function parseIgnoreRules(content: string, base: string): IgnoreRule[] {
+    const rules: IgnoreRule[] = [];
+    for (const rawLine of content.split(/\r?\n/)) {
+        let line = rawLine.replace(/(?<!\\)\s+$/, "");
+        if (line === "" || line.startsWith("#")) {
+            continue;
+        }
+        const negate = line.startsWith("!");
+        if (negate) {
+            line = line.slice(1);
+        } else if (line.startsWith("\\!") || line.startsWith("\\#")) {
+            line = line.slice(1);
+        }
+        const directoryOnly = line.endsWith("/");
+        if (directoryOnly) {
+            line = line.slice(0, -1);
+        }
+        // A slash anywhere but at the end anchors the pattern to `base`
+        const anchored = line.includes("/");
+        if (line.startsWith("/")) {
+            line = line.slice(1);
+        }
+        if (line === "") {
+            continue;
+        }
+        const prefix = anchored ? "^" : "^(?:.*/)?";
+        rules.push({ base, pattern: new RegExp(`${prefix}${globToRegExp(line)}$`), negate, directoryOnly });
+    }
+    return rules;
+}
+
+// Whether the last rule matching `relativePath` ignores it
+function isIgnored(rules: IgnoreRule[], relativePath: string, isDirectory: boolean): boolean {
+    let ignored = false;
+    for (const rule of rules) {
+        if (rule.directoryOnly && !isDirectory) {
+            continue;
+        }
+        if (rule.base !== "" && !relativePath.startsWith(`${rule.base}/`)) {
+            continue;
+        }
+        const within = rule.base === "" ? relativePath : relativePath.slice(rule.base.length + 1);
+        if (rule.pattern.test(within)) {
+            ignored = !rule.negate;
+        }
+    }
+    return ignored;
+}
+
+// Shannon entropy of the characters of `text`, in bits per character
+export function characterEntropy(text: string): number {
+    const counts = new Map<string, number>();
+    for (const c of text) {
+        counts.set(c, (counts.get(c) ?? 0) + 1);
+    }
+    let entropy = 0;
+    for (const count of counts.values()) {
+        const p = count / text.length;
+        entropy -= p * Math.log2(p);
+    }
+    return entropy;
+}
+
+// Why `content` should not be indexed, judging by the content alone, or null
+export function contentSkipReason(content: Buffer, maxLines = DEFAULT_MAX_LINES): { reason: SkipReason; detail: string } | null {
+    if (content.subarray(0, 8192).includes(0)) {
+        return { reason: "binary", detail: "contains NUL bytes" };
+    }
+    const text = content.toString("utf-8");
+    const marker = text.slice(0, HEADER_BYTES).match(GENERATED_MARKERS);
+    if (marker) {
+        return { reason: "generated", detail: `header says "${marker[1]}"` };
+    }
+    const lines = text.split("\n");
+    // Not counting the empty string after a final newline
+    const lineCount = text.endsWith("\n") ? lines.length - 1 : lines.length;
+    if (lineCount > maxLines) {
+        return { reason: "too-many-lines", detail: `${lineCount} lines, limit ${maxLines}` };
+    }
+    const longLines = lines.filter(line => line.length >= LONG_LINE);
+    const longBytes = longLines.reduce((sum, line) => sum + line.length, 0);
+    if (longLines.length > 0) {
+        const entropy = characterEntropy(longLines.join(""));
+        if (entropy >= ENCODED_DATA_ENTROPY) {
+            return { reason: "encoded-data", detail: `${entropy.toFixed(2)} bits per character in long lines` };
+        }
+    }
+    if (text.length > 0 && longBytes / text.length >= MINIFIED_SHARE) {
+        return { reason: "minified", detail: `${Math.round(100 * longBytes / text.length)}% of bytes in lines of ${LONG_LINE}+ characters` };
+    }
+    return null;
+}
+
+export class FileDiscovery {
+    private ignoreFiles: string[];
+    private maxBytes: number;
+    private maxLines: number;
+    // Rules in force in each directory visited, by relative path
+    private rules = new Map<string, IgnoreRule[]>();
+
+    constructor(readonly root: string, options: DiscoveryOptions = {}) {
+        this.ignoreFiles = options.ignoreFiles ?? DEFAULT_IGNORE_FILES;
+        this.maxBytes = options.maxBytes ?? DEFAULT_MAX_BYTES;
+        this.maxLines = options.maxLines ?? DEFAULT_MAX_LINES;
+        this.rules.set("", [
+            ...parseIgnoreRules([...DEFAULT_IGNORE_PATTERNS, ...(options.ignorePatterns ?? [])].join("\n"), ""),
+            ...this.readIgnoreFiles("")
+        ]);
+    }
+
+    private readIgnoreFiles(relativeDir: string): IgnoreRule[] {
+        return this.ignoreFiles.flatMap(name => {
+            const ignorePath = path.join(this.root, relativeDir, name);
+            return fs.existsSync(ignorePath) ? parseIgnoreRules(fs.readFileSync(ignorePath, "utf-8"), relativeDir) : [];
+        });
+    }
+
+    // The rules in force in a directory: its parent's and its own
+    private rulesFor(relativeDir: string): IgnoreRule[] {
+        let rules = this.rules.get(relativeDir);
+        if (!rules) {
+            const parent = relativeDir.includes("/") ? relativeDir.slice(0, relativeDir.lastIndexOf("/")) : "";
+            rules = [...this.rulesFor(parent), ...this.readIgnoreFiles(relativeDir)];
+            this.rules.set(relativeDir, rules);
+        }
+        return rules;
+    }
+
+    // Every file with one of `extensions` worth indexing, in sorted order
+    walk(extensions: string[]): DiscoveryReport {
+        const report: DiscoveryReport = { files: [], skipped: [] };
+        this.walkDirectory("", extensions, report);
+        return report;
+    }
+
+    private walkDirectory(relativeDir: string, extensions: string[], report: DiscoveryReport) {
+        const rules = this.rulesFor(relativeDir);
+        const entries = fs.readdirSync(path.join(this.root, relativeDir), { withFileTypes: true })
+            .sort((a, b) => a.name < b.name ? -1 : a.name > b.name ? 1 : 0);
+        for (const entry of entries) {
+            const relativePath = relativeDir === "" ? entry.name : `${relativeDir}/${entry.name}`;
+            if (entry.isDirectory()) {
+                if (isIgnored(rules, relativePath, true)) {
+                    report.skipped.push({ filePath: path.join(this.root, relativePath), reason: "ignored", detail: "directory" });
+                } else {
+                    this.walkDirectory(relativePath, extensions, report);
+                }
+            } else if (entry.isFile() && extensions.includes(path.extname(entry.name))) {
+                const skipped = this.check(relativePath, rules);
+                if (skipped) {
+                    report.skipped.push(skipped);
+                } else {
+                    report.files.push(path.join(this.root, relativePath));
+                }
+            }
+        }
+    }
+
+    // Splits `filePaths` (absolute, under the root) into the files worth
+    // indexing and the skipped ones, e.g. for the files changed since an
+    // index was built
+    filter(filePaths: string[]): DiscoveryReport {
+        const report: DiscoveryReport = { files: [], skipped: [] };
+        for (const filePath of filePaths) {
+            const relativePath = path.relative(this.root, filePath).split(path.sep).join("/");
+            const skipped = this.check(relativePath, null);
+            if (skipped) {
+                report.skipped.push(skipped);
+            } else {
+                report.files.push(filePath);
+            }
+        }
+        return report;
+    }
+
+    // Why the file should be skipped, or null. Without `rules` (those of its
+    // directory) every directory on its path is checked too.
+    private check(relativePath: string, rules: IgnoreRule[] | null): SkippedFile | null {
+        const filePath = path.join(this.root, relativePath);
+        const skip = (reason: SkipReason, detail: string): SkippedFile => ({ filePath, reason, detail });
+        if (rules === null) {
+            const parts = relativePath.split("/");
+            for (let depth = 1; depth < parts.length; depth++) {
+                const dir = parts.slice(0, depth).join("/");
+                if (isIgnored(this.rulesFor(parts.slice(0, depth - 1).join("/")), dir, true)) {
+                    return skip("ignored", `directory ${dir}`);
+                }
+            }
+            rules = this.rulesFor(parts.slice(0, -1).join("/"));
+        }
+        if (isIgnored(rules, relativePath, false)) {
+            return skip("ignored", "file");
+        }
+        const size = fs.statSync(filePath).size;
+        if (size > this.maxBytes) {
+            return skip("too-large", `${size} bytes, limit ${this.maxBytes}`);
+        }
+        const reason = contentSkipReason(fs.readFileSync(filePath), this.maxLines);
+        return reason ? skip(reason.reason, reason.detail) : null;
+    }
+}
+
+// One line per skip reason, with the number of files
+export function summariseSkipped(skipped: SkippedFile[]): string {
+    const counts = new Map<SkipReason, number>();
+    for (const file of skipped) {
+        counts.set(file.reason, (counts.get(file.reason) ?? 0) + 1);
+    }
+    return [...counts.entries()].map(([reason, count]) => `${reason}: ${count}`).join(", ") || "none";
+}
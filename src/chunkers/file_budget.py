@@ -0,0 +1,146 @@
+"""Time and memory budgets for chunking one file, and the line-window
+fallback used when a file exceeds them.
+
+A pathological file can stall or exhaust a parser: a huge expression makes
+ast.parse recurse past its limit or allocate without bound, and deeply
+nested code makes the chunk visitors recurse. The process parsing a file
+therefore enforces two budgets itself:
+
+- time: parse_within_budget runs the parser under an interval timer whose
+  SIGALRM raises BudgetExceeded after the given number of seconds;
+- memory: limit_memory caps the process's address space (RLIMIT_AS), so a
+  runaway allocation raises MemoryError instead of swapping the machine.
+
+A file that exceeds either budget, or the recursion limit, is cut into
+windows of lines instead, and its chunks and end record carry "fallback"
+with the reason. The timer only interrupts Python code; one long call into
+C (a single ast.parse) is interrupted when it returns, so the callers that
+spawn parser processes keep a hard timeout of their own.
+"""
+import os
+import re
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from .chunker_log import get_logger
+except ImportError:
+    from chunker_log import get_logger
+
+# Seconds of wall-clock time per file
+DEFAULT_TIME_BUDGET = 10.0
+# Megabytes of address space per parser process
+DEFAULT_MEMORY_BUDGET = 2048
+
+WINDOW_LINES = 60
+WINDOW_CHARS = 4000
+
+log = get_logger("budget")
+
+
+class BudgetExceeded(BaseException):
+    """Raised when a file takes longer than its time budget. A BaseException,
+    like KeyboardInterrupt, so that parsers catching Exception let it through."""
+
+
+FALLBACK_ERRORS = (BudgetExceeded, MemoryError, RecursionError)
+
+
+@contextmanager
+def time_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Raise BudgetExceeded in the block once it has run for seconds. Without
+    SIGALRM (Windows), off the main thread or with no budget, the block runs
+    unbounded."""
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise BudgetExceeded(f"took longer than {seconds:g}s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def limit_memory(megabytes: Optional[int]):
+    """Cap this process's address space at megabytes (no cap if 0 or None).
+    Child processes inherit the cap."""
+    if not megabytes or resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = megabytes * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def fallback_reason(error: BaseException) -> str:
+    if isinstance(error, BudgetExceeded):
+        return f"time budget: {error}"
+    if isinstance(error, MemoryError):
+        return "memory budget"
+    return "recursion limit"
+
+
+def line_window_chunks(source: str, file_path: str, reason: str) -> List[Dict]:
+    """Cut source into blocks of at most WINDOW_LINES lines and WINDOW_CHARS
+    characters; a longer single line is cut into pieces of its own"""
+    # Split as the tokenizer counts lines, not on form feeds and the like
+    lines = re.split(r"\r\n|\r|\n", source)
+    if lines[-1] == "":
+        lines.pop()
+    name = os.path.basename(file_path)
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = start + 1
+        size = len(lines[start])
+        while end < len(lines) and end - start < WINDOW_LINES and size + len(lines[end]) + 1 <= WINDOW_CHARS:
+            size += len(lines[end]) + 1
+            end += 1
+        code = "\n".join(lines[start:end])
+        pieces = [code[i:i + WINDOW_CHARS] for i in range(0, len(code), WINDOW_CHARS)]
+        for piece_index, piece in enumerate(pieces):
+            if not piece.strip():
+                continue
+            suffix = f".{piece_index + 1}" if len(pieces) > 1 else ""
+            chunks.append({
+                "type": "block",
+                "name": f"{name}:{start + 1}-{end}{suffix}",
+                "code": piece,
+                "startLine": start + 1,
+                "endLine": end,
+                "calls": [],
+                "imports": [],
+                "id": f"lines:{start + 1}{suffix}",
+                "parentId": None,
+                "fallback": reason,
+            })
+        start = end
+    return chunks
+
+
+def parse_within_budget(parse: Callable[[], List[Dict]], source: str, file_path: str,
+                        seconds: Optional[float] = DEFAULT_TIME_BUDGET) -> Tuple[List[Dict], Optional[str]]:
+    """Return parse()'s chunks and None, or, if parsing exceeds the time
+    budget, the memory budget or the recursion limit, the line windows of
+    source and the reason"""
+    try:
+        with time_budget(seconds):
+            return parse(), None
+    except FALLBACK_ERRORS as e:
+        reason = fallback_reason(e)
+        log.warning("Chunking %s by lines: %s", file_path, reason)
+        return line_window_chunks(source, file_path, reason), reason
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".github_repo_rag", "parse_cache.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Fraction of max_bytes to shrink to once the limit is exceeded, so that
+# eviction does not run again on every following insert.
+EVICTION_TARGET = 0.9
+
+
+class ParseCache:
+    """On-disk cache of parser output, keyed by source content hash and parser version.
+
+    Entries are evicted least recently used first once their total size
+    exceeds max_bytes. The cache is safe to share between processes; each
+    process must open its own ParseCache.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value) SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries"
+        )
+
+    @staticmethod
+    def make_key(source: str, parser: str, version: str, options: str = "") -> str:
+        """Cache key for the output of one parser version (and options) on one source text"""
+        digest = hashlib.sha256()
+        digest.update(f"{parser}\0{version}\0{options}\0".encode("utf-8"))
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, chunks: List[Dict]):
+        value = json.dumps(chunks)
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            total = self._add_total(size - (row[0] if row else 0))
+            if total > self.max_bytes:
+                self._evict(total)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict:
+        entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def _add_total(self, delta: int) -> int:
+        self.conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+        return self.conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _evict(self, total: int):
+        target = self.max_bytes * EVICTION_TARGET
+        freed = 0
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access, rowid"
+        ).fetchall():
+            if total - freed <= target:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            freed += size
+            self.evictions += 1
+        self._add_total(-freed)
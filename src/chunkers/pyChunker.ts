@@ -1,6 +1,7 @@
 import { execSync } from "child_process";
 import path from "path";
 import fs from "fs";
+import { PARSER_TIMEOUT_MS } from "./pythonParserPool";
 
 export interface CodeChunk {
   code: string;
@@ -35,7 +36,8 @@ export function chunkPyFile(filePath: string): CodeChunk[] {
     debug('Executing Python parser...');
     const result = execSync(`python3 "${scriptPath}" "${filePath}"`, {
       encoding: "utf-8",
-      stdio: ['pipe', 'pipe', 'pipe']
+      stdio: ['pipe', 'pipe', 'pipe'],
+      timeout: PARSER_TIMEOUT_MS
     });
     
     debug('Parsing JSON result...');
@@ -1,107 +1,406 @@
+import argparse
 import ast
 import json
+import re
 import sys
-from typing import List, Dict
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple, Union
 
+try:
+    from .parse_cache import DEFAULT_CACHE_PATH, ParseCache
+    from .chunk_records import FORMATS, RecordWriter, file_records
+    from .chunker_log import (LOG_LEVELS, FileStats, MetricsWriter, configure_logging, get_logger,
+                              metrics_record, open_metrics, read_source)
+    from .file_budget import DEFAULT_MEMORY_BUDGET, DEFAULT_TIME_BUDGET, limit_memory, parse_within_budget
+except ImportError:
+    from parse_cache import DEFAULT_CACHE_PATH, ParseCache
+    from chunk_records import FORMATS, RecordWriter, file_records
+    from chunker_log import (LOG_LEVELS, FileStats, MetricsWriter, configure_logging, get_logger,
+                             metrics_record, open_metrics, read_source)
+    from file_budget import DEFAULT_MEMORY_BUDGET, DEFAULT_TIME_BUDGET, limit_memory, parse_within_budget
 
-def debug(*args):
-    print(*args, file=sys.stderr)
+# Bump whenever the chunks produced for the same source change, so that
+# cached results of older versions are not reused.
+PARSER_VERSION = "4"
 
 
-class CodeChunkVisitor(ast.NodeVisitor):
+log = get_logger("python")
+
+
+# The line endings the Python tokenizer counts. str.splitlines() also breaks
+# on form feeds, \x1c-\x1e, \x85, \u2028 and \u2029, which would put every
+# line after one of them out of step with the line numbers of the AST.
+LINE_END = re.compile(r"\r\n|\r|\n")
+
+
+class LineIndex:
+    """Lines of a source file and the character offset each one starts at, built once per file"""
+
     def __init__(self, source_code: str):
+        self.lines = LINE_END.split(source_code)
+        self.offsets = [0] + [match.end() for match in LINE_END.finditer(source_code)]
+        if self.offsets[-1] == len(source_code):
+            # No line after the final newline
+            self.lines.pop()
+        else:
+            self.offsets.append(len(source_code))
+
+    def text(self, start_line: int, end_line: int) -> str:
+        """Source of the 1-based, inclusive line range, without the final newline"""
+        return "\n".join(self.lines[start_line - 1:end_line])
+
+    def char_count(self, start_line: int, end_line: int) -> int:
+        """Number of characters in the 1-based, inclusive line range"""
+        return self.offsets[end_line] - self.offsets[start_line - 1]
+
+
+# Token estimate shared with createEmbeddings in index.ts: about 4 characters per token.
+CHARS_PER_TOKEN = 4
+DEFAULT_MAX_TOKENS = 512
+
+DEFINITION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def iter_calls(node: ast.AST) -> Iterator[Tuple[ast.Call, str]]:
+    """Every call inside node with the name it calls, in source order"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, ast.Call):
+            func = current.func
+            if isinstance(func, ast.Name):
+                yield current, func.id
+            elif isinstance(func, ast.Attribute):
+                yield current, func.attr
+        children = list(ast.iter_child_nodes(current))
+        children.reverse()
+        stack.extend(children)
+
+
+def inner_statements(stmt: ast.stmt) -> List[ast.stmt]:
+    """Statements nested directly in a compound statement, in source order"""
+    inner = []
+    for field in ("body", "orelse", "finalbody"):
+        inner.extend(getattr(stmt, field, None) or [])
+    for clause in (getattr(stmt, "handlers", None) or []) + (getattr(stmt, "cases", None) or []):
+        inner.extend(clause.body)
+    inner.sort(key=lambda s: s.lineno)
+    return inner
+
+
+def is_docstring(stmt: ast.stmt) -> bool:
+    return (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant)
+            and isinstance(stmt.value.value, str))
+
+
+class CodeChunkVisitor(ast.NodeVisitor):
+    """Chunks a module by its top-level functions and classes.
+
+    A definition that fits in max_tokens becomes a single chunk. A larger one
+    becomes a parent chunk holding only its header (signature and docstring)
+    whose children are its nested definitions, recursively, and "block"
+    chunks packed from runs of body statements up to the budget. Children
+    carry the id of their parent in "parentId". max_tokens=None disables
+    splitting.
+    """
+
+    def __init__(self, source_code: str, max_tokens: Optional[int] = DEFAULT_MAX_TOKENS):
         self.source_code = source_code
+        self.line_index = LineIndex(source_code)
+        self.max_tokens = max_tokens
         self.chunks = []
         self.imports = []
 
     def extract_code(self, node: ast.AST) -> str:
-        lines = self.source_code.splitlines()
-        start_line = node.lineno - 1
-        end_line = node.end_lineno
-        debug(f"Extracting code from lines {start_line + 1} to {end_line}")
-        return "\n".join(lines[start_line:end_line])
+        return self.line_index.text(node.lineno, node.end_lineno)
 
     def get_calls(self, node: ast.AST) -> List[str]:
-        calls = []
+        return [name for _, name in iter_calls(node)]
 
-        class CallVisitor(ast.NodeVisitor):
-            def visit_Call(self, call_node):
-                if isinstance(call_node.func, ast.Name):
-                    calls.append(call_node.func.id)
-                    debug(f"Found function call: {call_node.func.id}")
-                elif isinstance(call_node.func, ast.Attribute):
-                    calls.append(call_node.func.attr)
-                    debug(f"Found method call: {call_node.func.attr}")
-
-        CallVisitor().visit(node)
-        return calls
+    def fits(self, start_line: int, end_line: int) -> bool:
+        if not self.max_tokens:
+            return True
+        return self.line_index.char_count(start_line, end_line) <= self.max_tokens * CHARS_PER_TOKEN
 
     def visit_Import(self, node: ast.Import):
         for name in node.names:
             self.imports.append(name.name)
-            debug(f"Found import: {name.name}")
+            log.debug("Found import: %s", name.name)
 
     def visit_ImportFrom(self, node: ast.ImportFrom):
         module = node.module or ""
         for name in node.names:
             self.imports.append(f"{module}.{name.name}")
-            debug(f"Found import from: {module}.{name.name}")
+            log.debug("Found import from: %s.%s", module, name.name)
 
     def visit_FunctionDef(self, node: ast.FunctionDef):
-        debug(f"Found function definition: {node.name}")
-        self.chunks.append({
-            "type": "function",
-            "name": node.name,
-            "code": self.extract_code(node),
-            "startLine": node.lineno,
-            "endLine": node.end_lineno,
-            "calls": self.get_calls(node),
-            "imports": self.imports
-        })
+        log.debug("Found function definition: %s", node.name)
+        self.add_definition(node)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
+        log.debug("Found function definition: %s", node.name)
+        self.add_definition(node)
 
     def visit_ClassDef(self, node: ast.ClassDef):
-        debug(f"Found class definition: {node.name}")
-        self.chunks.append({
-            "type": "class",
-            "name": node.name,
-            "code": self.extract_code(node),
-            "startLine": node.lineno,
-            "endLine": node.end_lineno,
-            "calls": self.get_calls(node),
-            "imports": self.imports
-        })
-
-
-def parse_python_file(file_path: str) -> List[Dict]:
-    debug(f"Reading Python file: {file_path}")
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            source_code = f.read()
-            debug(f"File contents length: {len(source_code)} characters")
-            
-            debug("Parsing Python AST...")
-            tree = ast.parse(source_code)
-            debug("AST parsed successfully")
-            
-            visitor = CodeChunkVisitor(source_code)
-            visitor.visit(tree)
-            chunks = visitor.chunks
-            debug(f"Found {len(chunks)} chunks in {file_path}")
+        log.debug("Found class definition: %s", node.name)
+        self.add_definition(node)
+
+    def add_definition(self, node: ast.AST):
+        """Chunk a top-level definition, then walk it once to attribute each call
+        to the innermost chunk whose lines contain it. Calls in decorators, above
+        the first line, go to the chunk holding the definition's header."""
+        base = node.lineno
+        owners: List[Optional[Dict]] = [None] * (node.end_lineno - base + 1)
+        self._add_definition(node, node.name, None, owners, base)
+        for call, name in iter_calls(node):
+            owners[max(call.lineno - base, 0)]["calls"].append(name)
+
+    def _add_chunk(self, chunk_type: str, name: str, chunk_id: str, start: int, end: int, code: str,
+                   parent: Optional[Dict], owners: List[Optional[Dict]], base: int) -> Dict:
+        chunk = {
+            "type": chunk_type,
+            "name": name,
+            "code": code,
+            "startLine": start,
+            "endLine": end,
+            "calls": [],
+            "imports": self.imports,
+            "id": chunk_id,
+            "parentId": parent["id"] if parent else None,
+        }
+        self.chunks.append(chunk)
+        for i in range(start - base, end - base + 1):
+            owners[i] = chunk
+        return chunk
+
+    def _add_definition(self, node: ast.AST, qualname: str, parent: Optional[Dict],
+                        owners: List[Optional[Dict]], base: int):
+        chunk_type = "class" if isinstance(node, ast.ClassDef) else "function"
+        chunk_id = f"{qualname}:{node.lineno}"
+        start, end = node.lineno, node.end_lineno
+        if self.fits(start, end):
+            self._add_chunk(chunk_type, node.name, chunk_id, start, end,
+                            self.line_index.text(start, end), parent, owners, base)
+            return
+
+        body = node.body
+        if is_docstring(body[0]):
+            header_end = body[0].end_lineno
+            body = body[1:]
+        else:
+            header_end = body[0].lineno - 1
+        header_end = max(header_end, start)
+        # The parent keeps only its header as code; its children re-claim the
+        # lines (and calls) of the body.
+        chunk = self._add_chunk(chunk_type, node.name, chunk_id, start, end,
+                                self.line_index.text(start, header_end), parent, owners, base)
+        self._add_statements(body, qualname, chunk, owners, base)
+
+    def _add_statements(self, statements: List[ast.stmt], qualname: str, parent: Dict,
+                        owners: List[Optional[Dict]], base: int):
+        """Emit nested definitions as child chunks and pack the remaining line
+        ranges greedily into block chunks that stay within the budget."""
+        block: Optional[List[int]] = None
+        for unit in self._statement_units(statements):
+            if isinstance(unit, tuple):
+                start, end = unit
+                if block and self.fits(block[0], end):
+                    block[1] = end
+                    continue
+                self._add_block(block, qualname, parent, owners, base)
+                block = [start, end]
+            else:
+                self._add_block(block, qualname, parent, owners, base)
+                block = None
+                self._add_definition(unit, f"{qualname}.{unit.name}", parent, owners, base)
+        self._add_block(block, qualname, parent, owners, base)
+
+    def _add_block(self, block: Optional[List[int]], qualname: str, parent: Dict,
+                   owners: List[Optional[Dict]], base: int):
+        if block:
+            start, end = block
+            self._add_chunk("block", parent["name"], f"{qualname}:{start}-{end}", start, end,
+                            self.line_index.text(start, end), parent, owners, base)
+
+    def _statement_units(self, statements: List[ast.stmt]) -> Iterator[Union[ast.AST, Tuple[int, int]]]:
+        """Yield nested definitions as nodes and everything else as (start, end)
+        line ranges, opening up compound statements that are over budget."""
+        for stmt in statements:
+            if isinstance(stmt, DEFINITION_NODES):
+                yield stmt
+                continue
+            inner = inner_statements(stmt)
+            if inner and not self.fits(stmt.lineno, stmt.end_lineno):
+                if inner[0].lineno > stmt.lineno:
+                    yield (stmt.lineno, inner[0].lineno - 1)
+                yield from self._statement_units(inner)
+            else:
+                yield (stmt.lineno, stmt.end_lineno)
+
+
+def parse_python_source(source_code: str, file_path: str = "<string>",
+                        max_tokens: Optional[int] = DEFAULT_MAX_TOKENS,
+                        cache: Optional[ParseCache] = None,
+                        stats: Optional[FileStats] = None) -> List[Dict]:
+    """Chunk Python source, consulting cache first if given. Parse and visit
+    timings (and the AST node count, if requested) are recorded in stats."""
+    stats = stats or FileStats()
+    log.debug("File contents length: %d characters", len(source_code))
+
+    if cache is not None:
+        key = ParseCache.make_key(source_code, "python", PARSER_VERSION, f"max_tokens={max_tokens or 0}")
+        with stats.phase("cache"):
+            chunks = cache.get(key)
+        if chunks is not None:
+            log.debug("Parse cache hit for %s", file_path)
             return chunks
-    except Exception as e:
-        debug(f"Error parsing Python file {file_path}: {str(e)}")
-        raise
 
+    with stats.phase("parse"):
+        tree = ast.parse(source_code, filename=file_path)
+    if stats.count_nodes:
+        stats.nodes = sum(1 for _ in ast.walk(tree))
 
-if __name__ == "__main__":
+    with stats.phase("visit"):
+        visitor = CodeChunkVisitor(source_code, max_tokens)
+        visitor.visit(tree)
+    chunks = visitor.chunks
+    log.debug("Found %d chunks in %s", len(chunks), file_path)
+    if cache is not None:
+        with stats.phase("cache"):
+            cache.put(key, chunks)
+    return chunks
+
+
+def parse_python_file(file_path: str, max_tokens: Optional[int] = DEFAULT_MAX_TOKENS,
+                      cache: Optional[ParseCache] = None) -> List[Dict]:
+    log.debug("Reading Python file: %s", file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        source_code = f.read()
+    return parse_python_source(source_code, file_path, max_tokens, cache)
+
+
+def write_file_records(write: Callable[[Dict], None], file_path: str, source: Optional[str] = None,
+                       max_tokens: Optional[int] = DEFAULT_MAX_TOKENS, cache: Optional[ParseCache] = None,
+                       metrics: Optional[MetricsWriter] = None,
+                       time_budget: Optional[float] = DEFAULT_TIME_BUDGET):
+    """Chunk one file (read from disk unless source is given) and pass its
+    header, chunk and end records to write; then send its metrics record to
+    metrics, if given. Exceptions propagate; nothing is written for a file
+    that fails to parse. A file over its time budget, or out of memory or
+    stack, is chunked by line windows and its end record says why (see
+    file_budget)."""
+    stats = FileStats(count_nodes=metrics is not None)
+    if source is None:
+        source = read_source(file_path, stats)
+    hits = cache.hits if cache is not None else 0
+    chunks, fallback = parse_within_budget(lambda: parse_python_source(source, file_path, max_tokens, cache, stats),
+                                           source, file_path, time_budget)
+    cached = cache is not None and cache.hits > hits
+    with stats.phase("serialise"):
+        for record in file_records(file_path, "python", source, chunks):
+            write(record)
+        end = {"record": "end", "filePath": file_path, "chunks": len(chunks), "cached": cached}
+        if fallback is not None:
+            end["fallback"] = fallback
+        write(end)
+    if metrics is not None:
+        metrics.write(metrics_record(file_path, "python", source, len(chunks), cached, stats, fallback))
+
+
+def _read_request(line: str) -> Dict:
+    """Decode one server request: a JSON path string, a {"path", "source"} object, or a bare path"""
     try:
-        file_path = sys.argv[1]
-        debug(f"Processing file: {file_path}")
-        chunks = parse_python_file(file_path)
+        request = json.loads(line)
+    except json.JSONDecodeError:
+        return {"path": line}
+    if isinstance(request, str):
+        return {"path": request}
+    if not isinstance(request, dict) or not isinstance(request.get("path"), str):
+        raise ValueError(f"Invalid request: {line}")
+    return request
+
+
+def _write_record(out: TextIO, record: Dict):
+    out.write(json.dumps(record))
+    out.write("\n")
+
+
+def serve(inp: TextIO = sys.stdin, out: TextIO = sys.stdout, max_tokens: Optional[int] = DEFAULT_MAX_TOKENS,
+          cache: Optional[ParseCache] = None, metrics: Optional[MetricsWriter] = None,
+          time_budget: Optional[float] = DEFAULT_TIME_BUDGET):
+    """Answer NDJSON parse requests until stdin is closed.
+
+    Every file is answered with a ``{"record": "header"}`` line, one line
+    per chunk and an ``{"record": "end"}`` line (or a single
+    ``{"record": "error"}`` line), as described in chunk_records, so a
+    client can pipeline many requests through one warm interpreter.
+    """
+    for line in inp:
+        line = line.strip()
+        if not line:
+            continue
+        file_path: Optional[str] = None
+        try:
+            request = _read_request(line)
+            file_path = request["path"]
+            write_file_records(lambda record: _write_record(out, record), file_path, request.get("source"),
+                               max_tokens, cache, metrics, time_budget)
+        except Exception as e:
+            log.warning("Error chunking %s: %s", file_path, e)
+            _write_record(out, {"record": "error", "filePath": file_path, "error": str(e)})
+        out.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk Python source files by top-level definitions")
+    parser.add_argument("file", nargs="?", help="Python file to chunk")
+    parser.add_argument("--server", action="store_true",
+                        help="read NDJSON requests from stdin and stream chunk records to stdout")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS,
+                        help="split definitions larger than this many tokens (0 disables splitting)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="parse cache database")
+    parser.add_argument("--no-cache", action="store_true", help="always parse, ignoring the parse cache")
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="json: one array of chunks; ndjson/msgpack: header, chunk and end records")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, help="stderr log level (default: warning)")
+    parser.add_argument("--metrics-fd", type=int, help="write one metrics record per file to this file descriptor")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET,
+                        help="seconds per file before it is chunked by lines instead (0 disables)")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET,
+                        help="megabytes of address space for this process (0 disables)")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    limit_memory(args.memory_budget)
+    metrics = open_metrics(args.metrics_fd)
+    cache = None if args.no_cache else ParseCache(args.cache_path)
+    if args.server:
+        serve(max_tokens=args.max_tokens, cache=cache, metrics=metrics, time_budget=args.time_budget)
+        if cache is not None:
+            log.info("Parse cache: %s", json.dumps(cache.stats()))
+        sys.exit(0)
+    if not args.file:
+        parser.error("a file path is required unless --server is given")
+    file_path = args.file
+    log.debug("Processing file: %s", file_path)
+    if args.format == "json":
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            chunks, _ = parse_within_budget(lambda: parse_python_source(source, file_path, args.max_tokens, cache),
+                                            source, file_path, args.time_budget)
+        except Exception as e:
+            log.error("Error chunking %s: %s", file_path, e)
+            sys.exit(1)
         for chunk in chunks:
             chunk["filePath"] = file_path
             chunk["language"] = "python"
         print(json.dumps(chunks))
-    except Exception as e:
-        debug(f"Error: {str(e)}")
-        sys.exit(1)
+    else:
+        writer = RecordWriter(sys.stdout.buffer, args.format)
+        try:
+            write_file_records(writer.write, file_path, None, args.max_tokens, cache, metrics, args.time_budget)
+        except Exception as e:
+            log.error("Error chunking %s: %s", file_path, e)
+            writer.write({"record": "error", "filePath": file_path, "error": str(e)})
+            writer.flush()
+            sys.exit(1)
+        writer.flush()
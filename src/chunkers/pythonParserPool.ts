@@ -0,0 +1,202 @@
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import os from "os";
+import path from "path";
+import { createInterface } from "readline";
+import { Readable } from "stream";
+import { ChunkRecordReader, MetricsSummary } from "./chunkRecords";
+
+export interface PythonChunk {
+    type: "function" | "class" | "block";
+    name: string;
+    code: string;
+    filePath: string;
+    startLine: number;
+    endLine: number;
+    calls: string[];
+    imports: string[];
+    id?: string;
+    parentId?: string | null;
+    // Why the file was cut into line windows instead of parsed (see file_budget.py)
+    fallback?: string;
+}
+
+// Hard limit on one file in a parser process. The parsers fall back to line
+// windows after their own time budget (10s); this only catches a parser
+// stuck in C code that its timer cannot interrupt.
+export const PARSER_TIMEOUT_MS = 60_000;
+
+export interface PythonParserPoolOptions {
+    // Number of warm parser processes; defaults to min(4, CPUs).
+    size?: number;
+    // Token budget passed to py_ast_parser.py --max-tokens.
+    maxTokens?: number;
+    scriptPath?: string;
+}
+
+interface PendingRequest {
+    filePath: string;
+    chunks: PythonChunk[];
+    resolve: (chunks: PythonChunk[]) => void;
+    reject: (error: Error) => void;
+}
+
+// A single `py_ast_parser.py --server` process. Requests are answered in the
+// order they were written, so pending requests are kept in a FIFO queue.
+class PythonParserWorker {
+    private proc: ChildProcessWithoutNullStreams;
+    private pending: PendingRequest[] = [];
+    private records = new ChunkRecordReader();
+    private exited: Promise<void>;
+    private timer: NodeJS.Timeout | null = null;
+    alive = true;
+
+    constructor(scriptPath: string, metrics: MetricsSummary, maxTokens?: number) {
+        const args = [scriptPath, "--server", "--metrics-fd", "3"];
+        if (maxTokens !== undefined) {
+            args.push("--max-tokens", String(maxTokens));
+        }
+        this.proc = spawn("python3", args, {
+            stdio: ["pipe", "pipe", "inherit", "pipe"]
+        }) as ChildProcessWithoutNullStreams;
+        createInterface({ input: this.proc.stdio[3] as Readable }).on("line", line => metrics.addLine(line));
+
+        const lines = createInterface({ input: this.proc.stdout });
+        lines.on("line", (line) => this.handleLine(line));
+
+        this.proc.stdin.on("error", (error) => this.failAll(error));
+
+        this.exited = new Promise((resolve) => {
+            this.proc.on("exit", (code) => {
+                this.alive = false;
+                this.clearTimer();
+                this.failAll(new Error(`Python parser exited with code ${code}`));
+                resolve();
+            });
+            this.proc.on("error", (error) => {
+                this.alive = false;
+                this.clearTimer();
+                this.failAll(error);
+                resolve();
+            });
+        });
+    }
+
+    get load(): number {
+        return this.pending.length;
+    }
+
+    parse(filePath: string): Promise<PythonChunk[]> {
+        return new Promise((resolve, reject) => {
+            this.pending.push({ filePath, chunks: [], resolve, reject });
+            this.proc.stdin.write(JSON.stringify({ path: filePath }) + "\n");
+            if (this.pending.length === 1) {
+                this.startTimer();
+            }
+        });
+    }
+
+    // Kills the process if the request at the head of the queue takes longer
+    // than PARSER_TIMEOUT_MS; the pool replaces dead workers.
+    private startTimer() {
+        this.clearTimer();
+        const request = this.pending[0];
+        if (!request) {
+            return;
+        }
+        this.timer = setTimeout(() => {
+            // Dead from now on, so that no request is sent to it before it exits
+            this.alive = false;
+            this.failAll(new Error(`Python parser timed out on ${request.filePath}`));
+            this.proc.kill();
+        }, PARSER_TIMEOUT_MS);
+    }
+
+    private clearTimer() {
+        if (this.timer) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+    }
+
+    async close(): Promise<void> {
+        this.proc.stdin.end();
+        await this.exited;
+    }
+
+    private handleLine(line: string) {
+        const request = this.pending[0];
+        if (!request || line.trim().length === 0) {
+            return;
+        }
+        let record: any;
+        try {
+            record = JSON.parse(line);
+        } catch (error) {
+            this.pending.shift();
+            this.startTimer();
+            request.reject(new Error(`Invalid parser output for ${request.filePath}: ${line}`));
+            return;
+        }
+        if (record.record === "end") {
+            this.pending.shift();
+            this.startTimer();
+            request.resolve(request.chunks);
+        } else if (record.record === "error") {
+            this.pending.shift();
+            this.startTimer();
+            request.reject(new Error(`Python parser failed for ${request.filePath}: ${record.error}`));
+        } else {
+            const chunk = this.records.expand(record);
+            if (chunk) {
+                request.chunks.push(chunk);
+            }
+        }
+    }
+
+    private failAll(error: Error) {
+        const pending = this.pending;
+        this.pending = [];
+        pending.forEach(request => request.reject(error));
+    }
+}
+
+// Keeps a few warm Python parsers alive for a whole directory walk instead of
+// starting one interpreter per file. Workers are spawned lazily on first use.
+export class PythonParserPool {
+    private workers: PythonParserWorker[] = [];
+    private size: number;
+    private maxTokens?: number;
+    private scriptPath: string;
+    // Phase timings and counts reported by every worker of this pool
+    readonly metrics = new MetricsSummary();
+
+    constructor(options: PythonParserPoolOptions = {}) {
+        this.size = options.size ?? Math.max(1, Math.min(4, os.cpus().length));
+        this.maxTokens = options.maxTokens;
+        this.scriptPath = options.scriptPath ?? path.join(__dirname, "py_ast_parser.py");
+    }
+
+    parse(filePath: string): Promise<PythonChunk[]> {
+        return this.nextWorker().parse(filePath);
+    }
+
+    async close(): Promise<void> {
+        const workers = this.workers;
+        this.workers = [];
+        await Promise.all(workers.map(worker => worker.close()));
+    }
+
+    private nextWorker(): PythonParserWorker {
+        this.workers = this.workers.filter(worker => worker.alive);
+        const idle = this.workers.find(worker => worker.load === 0);
+        if (idle) {
+            return idle;
+        }
+        if (this.workers.length < this.size) {
+            const worker = new PythonParserWorker(this.scriptPath, this.metrics, this.maxTokens);
+            this.workers.push(worker);
+            return worker;
+        }
+        return this.workers.reduce((least, worker) => worker.load < least.load ? worker : least);
+    }
+}
@@ -0,0 +1,200 @@
+import argparse
+import functools
+import multiprocessing
+import os
+import sys
+from typing import Dict, Iterator, List, Optional
+
+try:
+    from .py_ast_parser import DEFAULT_MAX_TOKENS, parse_python_source
+    from .elm_ast_parser import parse_elm_source
+    from .parse_cache import DEFAULT_CACHE_PATH, ParseCache
+    from .chunk_records import RecordWriter, file_records
+    from .chunker_log import (LOG_LEVELS, FileStats, configure_logging, get_logger, metrics_record,
+                              open_metrics, read_source)
+    from .file_budget import DEFAULT_MEMORY_BUDGET, DEFAULT_TIME_BUDGET, limit_memory, parse_within_budget
+except ImportError:
+    from py_ast_parser import DEFAULT_MAX_TOKENS, parse_python_source
+    from elm_ast_parser import parse_elm_source
+    from parse_cache import DEFAULT_CACHE_PATH, ParseCache
+    from chunk_records import RecordWriter, file_records
+    from chunker_log import (LOG_LEVELS, FileStats, configure_logging, get_logger, metrics_record,
+                             open_metrics, read_source)
+    from file_budget import DEFAULT_MEMORY_BUDGET, DEFAULT_TIME_BUDGET, limit_memory, parse_within_budget
+
+
+# File extension -> language
+LANGUAGES = {
+    ".py": "python",
+    ".elm": "elm",
+}
+
+SKIPPED_DIRECTORIES = {".git"}
+
+# Parse caches opened by this process, keyed by (pid, path): SQLite
+# connections must not be shared with forked workers.
+_caches: Dict[tuple, ParseCache] = {}
+
+
+log = get_logger("repo")
+
+
+def discover_files(root: str) -> List[str]:
+    """Return every file under root that has a parser, in a stable sorted order"""
+    found = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(d for d in dir_names if d not in SKIPPED_DIRECTORIES)
+        for file_name in sorted(file_names):
+            if os.path.splitext(file_name)[1] in LANGUAGES:
+                found.append(os.path.join(dir_path, file_name))
+    return found
+
+
+def open_cache(path: Optional[str]) -> Optional[ParseCache]:
+    if path is None:
+        return None
+    key = (os.getpid(), path)
+    if key not in _caches:
+        _caches[key] = ParseCache(path)
+    return _caches[key]
+
+
+def chunk_file(file_path: str, max_tokens: Optional[int] = DEFAULT_MAX_TOKENS,
+               cache_path: Optional[str] = None, elm_full_parse: bool = False,
+               metrics: bool = False, time_budget: Optional[float] = DEFAULT_TIME_BUDGET) -> List[Dict]:
+    """Parse one file and return its records: a header, the chunks and an end
+    record, or a single error record (see chunk_records), followed by a
+    metrics record (see chunker_log) if metrics is set. Runs inside a worker
+    process. A file that takes longer than time_budget seconds to parse, or
+    runs out of memory or stack, is chunked by line windows and its end
+    record says why (see file_budget)."""
+    language = LANGUAGES[os.path.splitext(file_path)[1]]
+    stats = FileStats(count_nodes=metrics)
+    try:
+        source = read_source(file_path, stats)
+        cache = open_cache(cache_path)
+        hits = cache.hits if cache is not None else 0
+        if language == "python":
+            parse = functools.partial(parse_python_source, source, file_path, max_tokens, cache, stats)
+        else:
+            parse = functools.partial(parse_elm_source, source, file_path, cache, full_parse=elm_full_parse,
+                                      stats=stats)
+        chunks, fallback = parse_within_budget(parse, source, file_path, time_budget)
+        cached = cache is not None and cache.hits > hits
+    except Exception as e:
+        log.warning("Error chunking %s: %s", file_path, e)
+        return [{"record": "error", "filePath": file_path, "error": str(e)}]
+    records = list(file_records(file_path, language, source, chunks))
+    end = {"record": "end", "filePath": file_path, "chunks": len(chunks), "cached": cached}
+    if fallback is not None:
+        end["fallback"] = fallback
+    records.append(end)
+    if metrics:
+        records.append(metrics_record(file_path, language, source, len(chunks), cached, stats, fallback))
+    return records
+
+
+def read_file_list(stream) -> List[str]:
+    """Return the paths listed one per line in stream, skipping blank lines"""
+    return [line.rstrip("\r\n") for line in stream if line.strip()]
+
+
+def chunk_repository(root: str, workers: Optional[int] = None,
+                     max_tokens: Optional[int] = DEFAULT_MAX_TOKENS,
+                     cache_path: Optional[str] = None, elm_full_parse: bool = False,
+                     metrics: bool = False, files: Optional[List[str]] = None,
+                     time_budget: Optional[float] = DEFAULT_TIME_BUDGET) -> Iterator[Dict]:
+    """Chunk every supported file under root on a pool of worker processes.
+
+    Records are yielded as soon as each file is parsed, but always in the
+    order of discover_files, so the output does not depend on scheduling.
+    Given files, only those are chunked, in the given order; the caller
+    has decided which files are worth indexing (see fileDiscovery.ts), and
+    the ones without a parser are left out.
+    Files whose content is already in the parse cache at cache_path are
+    not parsed again. Elm files are only given to the node parser when
+    elm_full_parse is set; otherwise elm_scanner finds their declarations.
+    With metrics, each file's records end with its metrics record.
+    Each file is parsed under time_budget (see chunk_file).
+    """
+    if files is None:
+        files = discover_files(root)
+    else:
+        files = [f for f in files if os.path.splitext(f)[1] in LANGUAGES]
+    workers = min(workers or os.cpu_count() or 1, max(len(files), 1))
+    log.info("Chunking %d files under %s with %d workers", len(files), root, workers)
+
+    chunk = functools.partial(chunk_file, max_tokens=max_tokens, cache_path=cache_path,
+                              elm_full_parse=elm_full_parse, metrics=metrics, time_budget=time_budget)
+    if workers == 1:
+        results = map(chunk, files)
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(chunk, files)
+
+    cached = 0
+    try:
+        for records in results:
+            cached += any(record.get("record") == "end" and record["cached"] for record in records)
+            yield from records
+    finally:
+        if workers > 1:
+            pool.terminate()
+    if cache_path is not None:
+        log.info("Parse cache: %d of %d files reused", cached, len(files))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk every Python and Elm file in a repository")
+    parser.add_argument("root", help="repository directory")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS,
+                        help="split Python definitions larger than this many tokens (0 disables splitting)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="parse cache database")
+    parser.add_argument("--no-cache", action="store_true", help="always parse, ignoring the parse cache")
+    parser.add_argument("--elm-full-parse", action="store_true",
+                        help="parse Elm files with the node parser instead of the declaration scanner")
+    parser.add_argument("--format", choices=("ndjson", "msgpack"), default="ndjson", help="record encoding")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, help="stderr log level (default: warning)")
+    parser.add_argument("--metrics-fd", type=int, help="write one metrics record per file to this file descriptor")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET,
+                        help="seconds per file before it is chunked by lines instead (0 disables)")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET,
+                        help="megabytes of address space per process (0 disables)")
+    parser.add_argument("--files-from", metavar="PATH",
+                        help="chunk only the files listed one per line in PATH ('-' for stdin) instead of discovering them")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    # Set before the pool starts, so every worker inherits it
+    limit_memory(args.memory_budget)
+    try:
+        writer = RecordWriter(sys.stdout.buffer, args.format)
+        metrics = open_metrics(args.metrics_fd)
+        cache_path = None if args.no_cache else args.cache_path
+        files = None
+        if args.files_from == "-":
+            files = read_file_list(sys.stdin)
+        elif args.files_from:
+            with open(args.files_from, encoding="utf-8") as f:
+                files = read_file_list(f)
+        serialise = FileStats()
+        for record in chunk_repository(args.root, args.workers, args.max_tokens, cache_path,
+                                       args.elm_full_parse, metrics is not None, files, args.time_budget):
+            kind = record.get("record")
+            if kind == "metrics":
+                # Records are encoded here rather than in the worker
+                record["timings"].update(serialise.timings)
+                serialise = FileStats()
+                metrics.write(record)
+                continue
+            with serialise.phase("serialise"):
+                writer.write(record)
+                if kind in ("end", "error"):
+                    writer.flush()
+            if kind == "error":
+                # Failed files have no metrics record
+                serialise = FileStats()
+    except Exception as e:
+        log.error("Error: %s", e)
+        sys.exit(1)
@@ -0,0 +1,53 @@
+import io
+import json
+import unittest
+from chunkers.chunk_records import RecordWriter, expand_records, file_records, msgpack, source_hash
+
+
+class TestChunkRecords(unittest.TestCase):
+    def setUp(self):
+        self.chunks = [
+            {"type": "function", "name": "f", "code": "def f(): pass", "calls": [], "imports": ["os", "sys"]},
+            {"type": "function", "name": "g", "code": "def g(): pass", "calls": ["f"], "imports": ["os", "sys"]},
+            {"type": "function", "name": "h", "code": "def h(): pass", "calls": [], "imports": ["json"]},
+        ]
+
+    def test_imports_move_to_header(self):
+        """Test that shared imports are written once, in the header"""
+        records = list(file_records("m.py", "python", "source", self.chunks))
+        self.assertEqual(records[0], {"record": "header", "filePath": "m.py", "language": "python",
+                                      "imports": ["os", "sys"], "hash": source_hash("source")})
+        self.assertNotIn("imports", records[1])
+        self.assertEqual(records[3]["imports"], ["json"])
+
+    def test_round_trip(self):
+        """Test that expanding the records restores every chunk"""
+        records = list(file_records("m.py", "python", "source", [dict(c) for c in self.chunks]))
+        records.append({"record": "end", "filePath": "m.py", "chunks": 3})
+        expanded = list(expand_records(records))
+        for chunk, original in zip(expanded, self.chunks):
+            self.assertEqual(chunk, dict(original, filePath="m.py", language="python"))
+        self.assertEqual(expanded[-1]["record"], "end")
+
+    def test_ndjson_writer(self):
+        """Test that the NDJSON writer emits one line per record"""
+        out = io.BytesIO()
+        writer = RecordWriter(out)
+        for record in file_records("m.py", "python", "source", self.chunks):
+            writer.write(record)
+        lines = out.getvalue().decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line).get("name") for line in lines], [None, "f", "g", "h"])
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_writer(self):
+        """Test that msgpack output decodes to the same records"""
+        out = io.BytesIO()
+        writer = RecordWriter(out, "msgpack")
+        records = list(file_records("m.py", "python", "source", self.chunks))
+        for record in records:
+            writer.write(record)
+        self.assertEqual(list(msgpack.Unpacker(io.BytesIO(out.getvalue()))), records)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 from chunkers.elm_ast_parser import ElmCodeChunkVisitor, ElmParserError, FileReadError, ASTParseError, SubprocessError
+from chunkers.elm_ast_parser import ElmParserPool, parse_elm_file
+import shutil
 import tempfile
 import os
 
@@ -145,6 +147,30 @@ main =
         calls = self.visitor.get_calls(op_node)
         self.assertIn('++', calls)
 
+    def test_get_calls_deep_expression(self):
+        """Test that expressions deeper than the recursion limit are traversed in source order"""
+        node = {'type': 'FunctionOrValue', 'name': 'x'}
+        for i in range(5000):
+            node = {
+                'type': 'OperatorApplication',
+                'operator': '|>',
+                'left': node,
+                'right': {'type': 'Application', 'function': {'type': 'FunctionOrValue', 'name': f'f{i}'}}
+            }
+        calls = self.visitor.get_calls(node)
+        self.assertEqual(len(calls), 10000)
+        self.assertEqual(calls[:2], ['|>', '|>'])
+        self.assertEqual(calls[-2:], ['f4998', 'f4999'])
+
+    def test_get_calls_skips_non_expression_fields(self):
+        """Test that signatures and positions are not searched for calls"""
+        node = {
+            'type': 'FunctionDeclaration',
+            'signature': {'type': 'Application', 'function': {'type': 'FunctionOrValue', 'name': 'typeLevel'}},
+            'expression': {'type': 'Application', 'function': {'type': 'FunctionOrValue', 'name': 'valueLevel'}}
+        }
+        self.assertEqual(self.visitor.get_calls(node), ['valueLevel'])
+
     def test_extract_code(self):
         """Test code extraction"""
         node = {
@@ -319,5 +345,81 @@ main =
         self.visitor.visit_declaration(declaration_node)
         self.assertEqual(len(self.visitor.chunks), 0)
 
+@unittest.skipUnless(shutil.which('node'), "node is not installed")
+class TestElmParserPool(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = "module Main exposing (add)\n\nimport Html\n\nadd : Int -> Int -> Int\nadd x y =\n    x + y\n"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_script(self, code):
+        path = os.path.join(self.temp_dir.name, "worker.js")
+        with open(path, "w") as f:
+            f.write(code)
+        return path
+
+    def test_worker_is_reused(self):
+        """Test that consecutive files are parsed by one long-lived worker"""
+        pool = ElmParserPool()
+        try:
+            for _ in range(3):
+                chunks = pool.parse(self.source)
+                self.assertEqual([c["name"] for c in chunks], ["add"])
+                self.assertEqual(chunks[0]["imports"], ["Html"])
+            self.assertEqual(pool.started, 1)
+            self.assertEqual(pool.recycled, 0)
+        finally:
+            pool.close()
+
+    def test_chunks_are_streamed(self):
+        """Test that chunks arrive one declaration at a time"""
+        pool = ElmParserPool()
+        try:
+            worker = pool._acquire()
+            chunks = worker.iter_parse(self.source + "\nsub : Int -> Int -> Int\nsub x y =\n    x - y\n")
+            self.assertEqual(next(chunks)["name"], "add")
+            self.assertEqual(next(chunks)["name"], "sub")
+            self.assertEqual(list(chunks), [])
+            pool._release(worker)
+        finally:
+            pool.close()
+
+    def test_parse_elm_file(self):
+        """Test parsing a file from disk through the pool"""
+        path = os.path.join(self.temp_dir.name, "Main.elm")
+        with open(path, "w") as f:
+            f.write(self.source)
+        pool = ElmParserPool()
+        try:
+            self.assertEqual(parse_elm_file(path, pool=pool, full_parse=True)[0]["startLine"], 5)
+        finally:
+            pool.close()
+
+    def test_timeout_discards_worker(self):
+        """Test that a worker that does not answer is killed and replaced"""
+        pool = ElmParserPool(timeout=0.5, script_path=self.write_script("process.stdin.resume();\n"))
+        with self.assertRaises(SubprocessError):
+            pool.parse(self.source)
+        self.assertEqual(pool.recycled, 1)
+        self.assertEqual(pool.started, 0)
+
+    def test_crash_discards_worker(self):
+        """Test that a worker that exits fails its request and is replaced"""
+        pool = ElmParserPool(script_path=self.write_script("process.exit(3);\n"))
+        with self.assertRaises(SubprocessError):
+            pool.parse(self.source)
+        self.assertEqual(pool.recycled, 1)
+
+    def test_large_worker_is_recycled(self):
+        """Test that a worker over the memory limit is replaced after its request"""
+        pool = ElmParserPool(max_rss=0)
+        try:
+            self.assertEqual(len(pool.parse(self.source)), 1)
+            self.assertEqual(pool.recycled, 1)
+        finally:
+            pool.close()
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
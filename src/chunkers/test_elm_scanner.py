@@ -0,0 +1,122 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from chunkers.elm_ast_parser import ElmParserPool, parse_elm_file
+from chunkers.elm_scanner import scan_elm_source
+
+
+class TestElmScanner(unittest.TestCase):
+    def setUp(self):
+        """Set up a module with comments and strings that look like declarations"""
+        self.source = (
+            'module Main exposing (..)\n'
+            '\n'
+            'import Html exposing (Html)\n'
+            'import Json.Decode\n'
+            '\n'
+            '{-| Adds numbers.\n'
+            'type NotAType = X\n'
+            '-}\n'
+            'add : Int -> Int -> Int\n'
+            'add x y =\n'
+            '    x + y -- trailing {- comment\n'
+            '\n'
+            '-- a line comment\n'
+            'text : String\n'
+            'text =\n'
+            '    """\n'
+            'notAFunction = 1\n'
+            '"""\n'
+            '\n'
+            '{- a block\n'
+            'comment -}\n'
+            'type alias Person =\n'
+            '    { name : String }\n'
+            '\n'
+            'type Color\n'
+            '    = Red\n'
+            '    | Blue\n'
+            '\n'
+            'port send : String -> Cmd msg\n'
+            '\n'
+            'quote = \'"\'\n'
+        )
+
+    def test_declarations(self):
+        """Test that declaration names, types and line ranges are found"""
+        chunks = scan_elm_source(self.source)
+        self.assertEqual(
+            [(c["type"], c["name"], c["startLine"], c["endLine"]) for c in chunks],
+            [
+                ("function", "add", 6, 11),
+                ("function", "text", 14, 18),
+                ("class", "Person", 22, 23),
+                ("class", "Color", 25, 27),
+                ("function", "quote", 31, 31),
+            ],
+        )
+        self.assertEqual(chunks[0]["code"].splitlines()[0], "{-| Adds numbers.")
+        self.assertEqual(chunks[0]["imports"], ["Html", "Json.Decode"])
+        self.assertEqual(chunks[0]["calls"], [])
+
+    def test_keywords_and_module_doc(self):
+        """Test that names starting with keywords are declarations and that the
+        module's doc comment belongs to no declaration"""
+        source = (
+            'module Names exposing (..)\n'
+            '\n'
+            '{-| The module.\n'
+            '-}\n'
+            '\n'
+            '\n'
+            'moduleName : String\n'
+            'moduleName =\n'
+            '    "Names"\n'
+            '\n'
+            'imports = []\n'
+            '\n'
+            'infixLeft = 1\n'
+            '\n'
+            'infix left 0 (|>) = apR\n'
+        )
+        chunks = scan_elm_source(source)
+        self.assertEqual([(c["name"], c["startLine"], c["endLine"]) for c in chunks],
+                         [("moduleName", 7, 9), ("imports", 11, 11), ("infixLeft", 13, 13)])
+
+    @unittest.skipUnless(shutil.which('node'), "node is not installed")
+    def test_matches_full_parser(self):
+        """Test that the scanner and the node-based parser chunk this
+        repository's Elm sources the same way"""
+        src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = sorted(p for p in glob.glob(os.path.join(src, '**', '*.elm'), recursive=True)
+                       if 'node_modules' not in p and 'elm-stuff' not in p)
+        self.assertTrue(paths)
+        pool = ElmParserPool()
+        try:
+            for path in paths:
+                with open(path, encoding='utf-8') as f:
+                    source = f.read()
+                with self.subTest(path=os.path.relpath(path, src)):
+                    self.assertEqual(scan_elm_source(source), pool.parse(source))
+        finally:
+            pool.close()
+
+    def test_parse_elm_file_uses_scanner(self):
+        """Test that parse_elm_file scans by default and falls back to the scanner"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "Main.elm")
+            with open(path, "w") as f:
+                f.write(self.source)
+            self.assertEqual(parse_elm_file(path), scan_elm_source(self.source))
+
+            script = os.path.join(directory, "worker.js")
+            with open(script, "w") as f:
+                f.write("process.exit(1);\n")
+            pool = ElmParserPool(script_path=script)
+            self.assertEqual(parse_elm_file(path, pool=pool, full_parse=True), scan_elm_source(self.source))
+
+
+if __name__ == '__main__':
+    unittest.main()
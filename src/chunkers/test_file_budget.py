@@ -0,0 +1,49 @@
+import os
+import tempfile
+import time
+import unittest
+from chunkers.file_budget import WINDOW_CHARS, WINDOW_LINES, line_window_chunks, parse_within_budget
+from chunkers.repo_chunker import chunk_file
+
+
+class TestFileBudget(unittest.TestCase):
+    def test_line_windows(self):
+        """Test that windows cover every line and split overlong lines"""
+        source = "\n".join(f"x{i} = {i}" for i in range(WINDOW_LINES + 10)) + "\n" + "y" * (WINDOW_CHARS + 1)
+        chunks = line_window_chunks(source, "/tmp/big.py", "time budget")
+        self.assertEqual([(c["startLine"], c["endLine"]) for c in chunks],
+                         [(1, WINDOW_LINES), (WINDOW_LINES + 1, WINDOW_LINES + 10),
+                          (WINDOW_LINES + 11, WINDOW_LINES + 11), (WINDOW_LINES + 11, WINDOW_LINES + 11)])
+        self.assertEqual(chunks[0]["name"], f"big.py:1-{WINDOW_LINES}")
+        self.assertEqual([c["id"] for c in chunks[2:]], [f"lines:{WINDOW_LINES + 11}.1", f"lines:{WINDOW_LINES + 11}.2"])
+        self.assertTrue(all(c["type"] == "block" and c["fallback"] == "time budget" for c in chunks))
+
+    def test_time_budget(self):
+        """Test that a parse running past its budget falls back to line windows"""
+        def parse():
+            while True:
+                time.sleep(0.01)
+
+        chunks, fallback = parse_within_budget(parse, "a = 1\n", "slow.py", 0.05)
+        self.assertTrue(fallback.startswith("time budget"))
+        self.assertEqual([c["code"] for c in chunks], ["a = 1"])
+
+        chunks, fallback = parse_within_budget(lambda: [{"name": "a"}], "a = 1\n", "fast.py", 0.05)
+        self.assertEqual((chunks, fallback), ([{"name": "a"}], None))
+
+    def test_recursion_fallback(self):
+        """Test that a file too deeply nested for ast.parse is chunked by lines"""
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "deep.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("def f():\n    pass\n\nx = " + "+".join(["a"] * 200000) + "\n")
+            records = chunk_file(path, metrics=True)
+        end = next(r for r in records if r.get("record") == "end")
+        self.assertEqual(end["fallback"], "recursion limit")
+        chunks = [r for r in records if "record" not in r]
+        self.assertTrue(chunks and all(c["type"] == "block" for c in chunks))
+        self.assertEqual(records[-1]["fallback"], "recursion limit")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from chunkers.parse_cache import ParseCache
+from chunkers.py_ast_parser import parse_python_file
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        """Open a cache in a temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, "cache", "parse_cache.sqlite3")
+        self.cache = ParseCache(self.cache_path)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_get_and_put(self):
+        """Test a miss, a put and a hit, with counters"""
+        key = ParseCache.make_key("def f(): pass", "python", "1")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, [{"name": "f"}])
+        self.assertEqual(self.cache.get(key), [{"name": "f"}])
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+        self.assertEqual(stats["hitRate"], 0.5)
+
+    def test_key_depends_on_parser_version_and_options(self):
+        """Test that a new parser version or option set does not reuse old entries"""
+        keys = {
+            ParseCache.make_key("x", "python", "1"),
+            ParseCache.make_key("x", "python", "2"),
+            ParseCache.make_key("x", "elm", "1"),
+            ParseCache.make_key("x", "python", "1", "max_tokens=512"),
+            ParseCache.make_key("y", "python", "1"),
+        }
+        self.assertEqual(len(keys), 5)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entries are evicted once the size limit is hit"""
+        cache = ParseCache(os.path.join(self.temp_dir.name, "small.sqlite3"), max_bytes=250)
+        value = [{"code": "x" * 60}]
+        for name in "abc":
+            cache.put(name, value)
+        cache.get("a")  # "b" is now the least recently used
+        cache.put("d", value)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("d"))
+        self.assertGreater(cache.stats()["evictions"], 0)
+        self.assertLessEqual(cache.stats()["bytes"], 250)
+        cache.close()
+
+    def test_shared_between_connections(self):
+        """Test that entries persist for a second connection to the same file"""
+        self.cache.put("k", [])
+        other = ParseCache(self.cache_path)
+        self.assertEqual(other.get("k"), [])
+        other.close()
+
+    def test_parse_python_file_uses_cache(self):
+        """Test that an unchanged file is served from the cache"""
+        file_path = os.path.join(self.temp_dir.name, "module.py")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("def f():\n    return g()\n")
+        first = parse_python_file(file_path, cache=self.cache)
+        second = parse_python_file(file_path, cache=self.cache)
+        self.assertEqual(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import ast
+import io
+import json
+import os
+import tempfile
+import unittest
+from chunkers.py_ast_parser import CodeChunkVisitor, LineIndex, parse_python_source, serve
+
+
+class TestServeMode(unittest.TestCase):
+    def setUp(self):
+        """Write a small Python module to disk"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "sample.py")
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            f.write("import os\n\ndef add(x, y):\n    return os.path.join(x, y)\n\nclass Greeter:\n    pass\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_server(self, *requests):
+        out = io.StringIO()
+        serve(io.StringIO("".join(line + "\n" for line in requests)), out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_path_request(self):
+        """Test that a path request streams a header, one line per chunk and an end record"""
+        records = self.run_server(json.dumps({"path": self.file_path}))
+        header = records[0]
+        self.assertEqual(header["record"], "header")
+        self.assertEqual(header["filePath"], self.file_path)
+        self.assertEqual(header["language"], "python")
+        self.assertEqual(header["imports"], ["os"])
+        self.assertEqual([r.get("name") for r in records[1:3]], ["add", "Greeter"])
+        self.assertNotIn("imports", records[1])
+        self.assertEqual(records[-1], {"record": "end", "filePath": self.file_path, "chunks": 2, "cached": False})
+
+    def test_source_request(self):
+        """Test that inline source is parsed without touching the filesystem"""
+        records = self.run_server(json.dumps({"path": "inline.py", "source": "def f():\n    g()\n"}))
+        self.assertEqual(records[1]["calls"], ["g"])
+        self.assertEqual(records[-1]["record"], "end")
+
+    def test_error_does_not_stop_server(self):
+        """Test that a failing request yields an error record and later requests still run"""
+        records = self.run_server(
+            json.dumps({"path": "broken.py", "source": "def f(:\n"}),
+            json.dumps(self.file_path),
+        )
+        self.assertEqual(records[0]["record"], "error")
+        self.assertEqual(records[0]["filePath"], "broken.py")
+        self.assertEqual(records[-1]["record"], "end")
+
+    def test_parse_python_source(self):
+        """Test parsing source directly"""
+        chunks = parse_python_source("class A:\n    def m(self):\n        return 1\n")
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]["type"], "class")
+
+
+class TestCodeChunkVisitor(unittest.TestCase):
+    def test_line_index(self):
+        """Test line extraction and character counts"""
+        index = LineIndex("a = 1\nbb = 2\r\nccc = 3\n")
+        self.assertEqual(index.text(2, 3), "bb = 2\nccc = 3")
+        self.assertEqual(index.char_count(1, 1), 6)
+        self.assertEqual(index.char_count(2, 3), 16)
+
+    def test_line_index_follows_ast_line_numbers(self):
+        """Test that form feeds and other characters str.splitlines() breaks on do not start lines"""
+        source = "def a():\n    return 1\n\x0c\ns = '\x85\u2028'\n\ndef b():\n    return 2"
+        index = LineIndex(source)
+        self.assertEqual(len(index.lines), 7)
+        self.assertEqual(index.char_count(1, 7), len(source))
+        b = ast.parse(source).body[-1]
+        self.assertEqual(index.text(b.lineno, b.end_lineno), "def b():\n    return 2")
+
+    def test_calls_attributed_to_enclosing_chunk(self):
+        """Test that every call, including nested ones, lands in its own chunk in source order"""
+        chunks = parse_python_source(
+            "setup()\n"
+            "def f(x):\n"
+            "    return outer(inner(x)).strip()\n"
+            "class A:\n"
+            "    def m(self):\n"
+            "        self.g()\n"
+        )
+        self.assertEqual(chunks[0]["calls"], ["strip", "outer", "inner"])
+        self.assertEqual(chunks[1]["calls"], ["g"])
+
+    def test_extract_code(self):
+        """Test code extraction for a definition"""
+        visitor = CodeChunkVisitor("x = 1\n\ndef f():\n    return x\n")
+        visitor.visit(ast.parse(visitor.source_code))
+        self.assertEqual(visitor.chunks[0]["code"], "def f():\n    return x")
+
+
+class TestTokenBudget(unittest.TestCase):
+    def setUp(self):
+        """Build a class that is too large for a small budget"""
+        methods = "".join(
+            f"    def method_{i}(self):\n        value = compute({i})\n        return value\n\n"
+            for i in range(6)
+        )
+        self.source = f'class Big:\n    """Docs."""\n    size = 1\n\n{methods}def small():\n    return 1\n'
+
+    def test_small_definitions_stay_whole(self):
+        """Test that nothing is split when the budget is large enough"""
+        chunks = parse_python_source(self.source, max_tokens=10000)
+        self.assertEqual([c["name"] for c in chunks], ["Big", "small"])
+        self.assertIsNone(chunks[0]["parentId"])
+
+    def test_oversized_class_is_split(self):
+        """Test that an oversized class becomes a header chunk with method and block children"""
+        chunks = parse_python_source(self.source, max_tokens=40)
+        big = chunks[0]
+        self.assertEqual(big["code"], 'class Big:\n    """Docs."""')
+        self.assertEqual(big["endLine"], 27)
+        children = [c for c in chunks if c["parentId"] == big["id"]]
+        self.assertEqual(children[0]["type"], "block")
+        self.assertEqual(children[0]["code"], "    size = 1")
+        self.assertEqual([c["name"] for c in children[1:]], [f"method_{i}" for i in range(6)])
+        self.assertEqual(children[1]["calls"], ["compute"])
+        self.assertEqual(big["calls"], [])
+        self.assertIsNone(chunks[-1]["parentId"])
+
+    def test_oversized_function_is_split_on_statements(self):
+        """Test that long bodies are packed into blocks that fit the budget"""
+        body = "".join(f"    x{i} = step({i})\n" for i in range(40))
+        chunks = parse_python_source(f"def long():\n{body}", max_tokens=50)
+        blocks = chunks[1:]
+        self.assertTrue(all(c["type"] == "block" for c in blocks))
+        self.assertTrue(all(len(c["code"]) <= 200 for c in blocks))
+        self.assertEqual(sum(len(c["calls"]) for c in blocks), 40)
+        self.assertEqual(blocks[0]["startLine"], 2)
+        self.assertEqual(blocks[-1]["endLine"], 41)
+
+    def test_split_function_decorator_calls(self):
+        """Test that calls in the decorators of a split function go to its header"""
+        body = "".join(f"    x{i} = step({i})\n" for i in range(40))
+        chunks = parse_python_source(f"@deco(make())\ndef long():\n{body}", max_tokens=50)
+        self.assertEqual(chunks[0]["calls"], ["deco", "make"])
+        self.assertEqual([name for c in chunks[1:] for name in c["calls"]], ["step"] * 40)
+
+    def test_budget_disabled(self):
+        """Test that max_tokens=None keeps every definition whole"""
+        chunks = parse_python_source(self.source, max_tokens=None)
+        self.assertEqual(len(chunks), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import io
+import os
+import tempfile
+import unittest
+from chunkers.repo_chunker import chunk_repository, discover_files, read_file_list
+
+
+class TestRepoChunker(unittest.TestCase):
+    def setUp(self):
+        """Create a small repository with nested Python files"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        files = {
+            "b.py": "def b():\n    pass\n",
+            "a.py": "def a1():\n    pass\n\ndef a2():\n    pass\n",
+            "pkg/c.py": "class C:\n    pass\n",
+            "pkg/broken.py": "def broken(:\n",
+            "notes.txt": "not code",
+            ".git/hooks/d.py": "def d():\n    pass\n",
+        }
+        for name, source in files.items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_discover_files(self):
+        """Test that discovery is sorted, filtered by extension and skips .git"""
+        found = [os.path.relpath(p, self.root) for p in discover_files(self.root)]
+        self.assertEqual(found, ["a.py", "b.py", os.path.join("pkg", "broken.py"), os.path.join("pkg", "c.py")])
+
+    def test_deterministic_order(self):
+        """Test that the record order is the same for any number of workers"""
+        serial = list(chunk_repository(self.root, workers=1))
+        parallel = list(chunk_repository(self.root, workers=3))
+        self.assertEqual(serial, parallel)
+        names = [r["name"] for r in serial if "record" not in r]
+        self.assertEqual(names, ["a1", "a2", "b", "C"])
+
+    def test_error_record(self):
+        """Test that a file that fails to parse yields an error record"""
+        records = list(chunk_repository(self.root, workers=2))
+        errors = [r for r in records if r.get("record") == "error"]
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0]["filePath"].endswith("broken.py"))
+
+    def test_given_files(self):
+        """Test that only the given files are chunked, in the given order, without unsupported ones"""
+        files = [os.path.join(self.root, name) for name in ("pkg/c.py", "b.py", "notes.txt")]
+        records = list(chunk_repository(self.root, workers=2, files=files))
+        names = [r["name"] for r in records if "record" not in r]
+        self.assertEqual(names, ["C", "b"])
+
+    def test_read_file_list(self):
+        """Test that a file list is read one path per line, skipping blank lines"""
+        self.assertEqual(read_file_list(io.StringIO("a.py\r\n\npkg/c.py\n")), ["a.py", "pkg/c.py"])
+
+    def test_metrics_records(self):
+        """Test that metrics=True adds one metrics record with phase timings per parsed file"""
+        records = list(chunk_repository(self.root, workers=2, metrics=True))
+        metrics = {os.path.basename(r["filePath"]): r for r in records if r.get("record") == "metrics"}
+        self.assertEqual(sorted(metrics), ["a.py", "b.py", "c.py"])
+        self.assertEqual(metrics["a.py"]["chunks"], 2)
+        self.assertEqual(metrics["a.py"]["lines"], 5)
+        self.assertGreater(metrics["a.py"]["nodes"], 0)
+        self.assertIn("parse", metrics["a.py"]["timings"])
+        self.assertFalse(metrics["a.py"]["cached"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,11 +4,19 @@ import fs from "fs";
 export interface CodeChunk {
   code: string;
   filePath: string;
-  type: "function" | "class";
+  type: "function" | "class" | "block";
   name: string;
   language: string;
   calls: string[];
   imports: string[];
+  startLine?: number;
+  endLine?: number;
+  // Set by the Python chunker, which splits oversized definitions into a
+  // parent chunk and child chunks that point back to it.
+  id?: string;
+  parentId?: string | null;
+  // Set when the file exceeded its parse budget and was cut into line windows
+  fallback?: string;
 }
 
 // Add debug logging function that uses stderr
@@ -0,0 +1,152 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { EmbeddingStore, chunkTextHash } from './embeddingStore';
+
+describe('EmbeddingStore', () => {
+  let root: string;
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'embedding-store-'));
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  it('keys chunks by their normalised text', () => {
+    expect(chunkTextHash('def f():\r\n    pass  \r\n')).toBe(chunkTextHash('def f():\n    pass'));
+    expect(chunkTextHash('def f():\n    pass')).not.toBe(chunkTextHash('def g():\n    pass'));
+  });
+
+  it('persists vectors and counts hits and misses', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('a', [0.5, 1, 2]);
+    expect(store.lookup(['a', 'b'])).toEqual([[0.5, 1, 2], null]);
+    await store.save();
+
+    const reopened = new EmbeddingStore(root, 'xenova:model');
+    reopened.put('b', [3, 4, 5]);
+    expect(reopened.lookup(['b', 'a'])).toEqual([[3, 4, 5], [0.5, 1, 2]]);
+    expect(reopened.stats()).toEqual({ lookups: 2, hits: 2, misses: 0, hitRate: 1, vectors: 2 });
+  });
+
+  it('keeps models apart', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('a', [1, 2]);
+    await store.save();
+    expect(new EmbeddingStore(root, 'openai:other').lookup(['a'])).toEqual([null]);
+  });
+
+  it('collects vectors no owner references', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('shared', [1, 1]);
+    store.put('only-a', [2, 2]);
+    store.put('only-b', [3, 3]);
+    store.retain('repo-a', ['shared', 'only-a']);
+    store.retain('repo-b', ['shared', 'only-b']);
+    await store.save();
+    expect(store.referenceCount('shared')).toBe(2);
+
+    await EmbeddingStore.releaseEverywhere(root, 'repo-a');
+    const reopened = new EmbeddingStore(root, 'xenova:model');
+    expect(reopened.owners()).toEqual(['repo-b']);
+    expect(reopened.lookup(['shared', 'only-a', 'only-b'])).toEqual([[1, 1], null, [3, 3]]);
+    expect(fs.readdirSync(reopened.dir).filter(name => name.endsWith('.f32'))).toEqual(['vectors.1.f32']);
+    expect(fs.statSync(path.join(reopened.dir, 'vectors.1.f32')).size).toBe(2 * 2 * 4);
+  });
+
+  it('keeps models whose ids read alike apart', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('a', [1, 2]);
+    await store.save();
+    const other = new EmbeddingStore(root, 'xenova/model');
+    expect(other.dir).not.toBe(store.dir);
+    expect(other.lookup(['a'])).toEqual([null]);
+    other.put('a', [3, 4]);
+    await other.save();
+    expect(new EmbeddingStore(root, 'xenova:model').lookup(['a'])).toEqual([[1, 2]]);
+  });
+
+  it('appends flushed vectors without rewriting index.json', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('a', [1, 1]);
+    await store.save();
+    const indexPath = path.join(store.dir, 'index.json');
+    const written = fs.readFileSync(indexPath, 'utf-8');
+    const reader = new EmbeddingStore(root, 'xenova:model');
+    store.put('b', [2, 2]);
+    await store.flush();
+    store.put('c', [3, 3]);
+    await store.flush();
+    expect(fs.readFileSync(indexPath, 'utf-8')).toBe(written);
+    expect(fs.readFileSync(path.join(store.dir, 'rows.log'), 'utf-8')).toBe('a\nb\nc\n');
+    expect(reader.lookup(['c', 'b', 'a'])).toEqual([[3, 3], [2, 2], [1, 1]]);
+  });
+
+  it('ignores a line of the log still being written', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('a', [1, 1]);
+    await store.save();
+    fs.appendFileSync(path.join(store.dir, 'rows.log'), 'tor');
+    const reader = new EmbeddingStore(root, 'xenova:model');
+    expect(reader.lookup(['a', 'tor'])).toEqual([[1, 1], null]);
+    reader.put('b', [2, 2]);
+    await reader.flush();
+    expect(fs.readFileSync(path.join(store.dir, 'rows.log'), 'utf-8')).toBe('a\nb\n');
+  });
+
+  it('converts a store written before the log', async () => {
+    const legacyDir = path.join(root, 'xenova_model');
+    fs.mkdirSync(legacyDir);
+    fs.writeFileSync(path.join(legacyDir, 'vectors.f32'), Buffer.from(new Float32Array([1, 1, 0, 0, 2, 2]).buffer));
+    fs.writeFileSync(path.join(legacyDir, 'index.json'), JSON.stringify({
+      modelId: 'xenova:model', dimension: 2, generation: 0, rows: { a: 0, b: 2 }, owners: { repo: ['a'] }
+    }));
+    const store = new EmbeddingStore(root, 'xenova:model');
+    expect(fs.existsSync(legacyDir)).toBe(false);
+    expect(store.lookup(['a', 'b'])).toEqual([[1, 1], [2, 2]]);
+    store.put('c', [3, 3]);
+    await store.save();
+    expect(fs.readFileSync(path.join(store.dir, 'rows.log'), 'utf-8')).toBe('a\n\nb\nc\n');
+    const reopened = new EmbeddingStore(root, 'xenova:model');
+    expect(reopened.lookup(['a', 'b', 'c'])).toEqual([[1, 1], [2, 2], [3, 3]]);
+    expect(reopened.owners()).toEqual(['repo']);
+  });
+
+  it('shares one store per model in a process', () => {
+    expect(EmbeddingStore.open(root, 'xenova:model')).toBe(EmbeddingStore.open(root, 'xenova:model'));
+    expect(EmbeddingStore.open(root, 'xenova:model')).not.toBe(EmbeddingStore.open(root, 'openai:other'));
+  });
+
+  it('merges concurrent writers and survives a collection by another writer', async () => {
+    // Two instances stand in for two processes
+    const a = new EmbeddingStore(root, 'xenova:model');
+    const b = new EmbeddingStore(root, 'xenova:model');
+    a.put('a1', [1, 1]);
+    a.put('a2', [2, 2]);
+    b.put('b0', [3, 3]);
+    b.put('b1', [4, 4]);
+    await Promise.all([a.save(), b.save()]);
+    expect(b.lookup(['a1', 'a2', 'b0', 'b1'])).toEqual([[1, 1], [2, 2], [3, 3], [4, 4]]);
+
+    a.retain('repo-a', ['a1', 'a2']);
+    b.retain('repo-b', ['b1']);
+    await b.save();
+    // a collects b0 and renumbers the row of b1 that b read before
+    expect(await a.gc()).toBe(1);
+    expect(b.lookup(['a1', 'b0', 'b1'])).toEqual([[1, 1], null, [4, 4]]);
+    expect(new EmbeddingStore(root, 'xenova:model').owners().sort()).toEqual(['repo-a', 'repo-b']);
+  });
+
+  it('keeps vectors put but not yet retained', async () => {
+    const store = new EmbeddingStore(root, 'xenova:model');
+    store.put('old', [1, 1]);
+    await store.save();
+    const other = new EmbeddingStore(root, 'xenova:model');
+    other.put('building', [2, 2]);
+    await other.flush();
+    expect(await other.gc()).toBe(1);
+    expect(other.lookup(['old', 'building'])).toEqual([null, [2, 2]]);
+  });
+});
@@ -0,0 +1,565 @@
+import crypto from "crypto";
+import fs from "fs";
+import path from "path";
+import { FileLock } from "./fileLock";
+
+// Persistent, content-addressed cache of chunk embeddings shared by every
+// indexed repository. Each embedding model has its own directory under the
+// store root, named after the model and a hash of its exact id, holding
+//
+//   vectors[.N].f32  the vectors as consecutive float32 rows (native byte order)
+//   rows[.N].log     the hash of each row of that file, one per line
+//   index.json       { modelId, dimension, generation, owners: { owner: [hash] } }
+//
+// A vector is keyed by the SHA-256 of its normalised chunk text, so the same
+// code in a fork, a vendored copy or an unchanged file of the next re-index
+// is embedded once. Owners (repository URLs) hold references to the hashes
+// their index uses; gc() drops the vectors no owner references any more.
+//
+// Writers in any number of processes share the store. New vectors and owner
+// changes are kept in memory until flush()/save(), which take the store's
+// lock, read what other writers appended to the log since, and append the
+// vectors after the last row and then their hashes to the log. A flush
+// writes only the new rows; index.json is replaced, by an atomic rename,
+// when the owners, the dimension or the generation change. gc() never
+// rewrites a file in place: it compacts the vectors and the log into the
+// files of the next generation, points index.json at them and deletes the
+// old ones. Rows therefore never change meaning within a generation, and
+// readers, who do not lock, always find their rows in the files their copy
+// of index.json names, reading only the whole lines of the log, whose rows
+// were written before them. Use EmbeddingStore.open, which keeps one store
+// per model in a process.
+//
+// gc() keeps the vectors this process put but no owner retained yet. Those
+// of a build running in another process may be dropped; that build then
+// misses them in the store next time and embeds them again.
+
+export interface EmbeddingStoreStats {
+    lookups: number;
+    hits: number;
+    misses: number;
+    hitRate: number;
+    vectors: number;
+}
+
+// Rows copied at a time when gc() compacts the store
+const GC_BLOCK_ROWS = 4096;
+
+interface StoreIndex {
+    modelId: string;
+    dimension: number;
+    // Names the vectors file and the log: vectors.f32 and rows.log for 0,
+    // else vectors.<generation>.f32 and rows.<generation>.log
+    generation: number;
+    owners: Record<string, string[]>;
+    // Row of each hash, in stores written before the log
+    rows?: Record<string, number>;
+}
+
+// Directory of a model's store: readable, and never shared by two models
+function storeDirectoryName(modelId: string): string {
+    const hash = crypto.createHash("sha256").update(modelId).digest("hex").slice(0, 16);
+    return `${legacyStoreDirectoryName(modelId)}-${hash}`;
+}
+
+// Stores used to be named after the model alone, so that ids differing only
+// in the characters replaced here shared one
+function legacyStoreDirectoryName(modelId: string): string {
+    return modelId.replace(/[^A-Za-z0-9._-]/g, "_");
+}
+
+function statStamp(stat: fs.Stats): string {
+    return `${stat.mtimeMs}:${stat.size}:${stat.ino}`;
+}
+
+// Line endings and trailing whitespace do not change what a chunk means
+export function normaliseChunkText(text: string): string {
+    return text.replace(/\r\n?/g, "\n").split("\n").map(line => line.trimEnd()).join("\n").trim();
+}
+
+export function chunkTextHash(text: string): string {
+    return crypto.createHash("sha256").update(normaliseChunkText(text)).digest("hex");
+}
+
+export class EmbeddingStore {
+    private static stores = new Map<string, EmbeddingStore>();
+
+    readonly dir: string;
+    private modelId: string;
+    private lock: FileLock;
+    // index.json as last read
+    private index!: StoreIndex;
+    private indexStamp = "";
+    // Row of each hash in the generation's vectors file, the number of lines
+    // of its log read so far and their length in bytes
+    private rows = new Map<string, number>();
+    private rowCount = 0;
+    private logBytes = 0;
+    // Vectors and owner changes not written yet
+    private pending = new Map<string, Float32Array>();
+    private ownerChanges = new Map<string, string[] | null>();
+    // Hashes put in this process that no owner has retained yet
+    private fresh = new Set<string>();
+    private hits = 0;
+    private misses = 0;
+
+    constructor(root: string, modelId: string) {
+        this.dir = path.join(root, storeDirectoryName(modelId));
+        this.modelId = modelId;
+        EmbeddingStore.moveLegacyStore(root, modelId, this.dir);
+        fs.mkdirSync(this.dir, { recursive: true });
+        this.lock = new FileLock(path.join(this.dir, "store.lock"));
+        this.reload();
+    }
+
+    // Moves the store of `modelId` from the directory it had before
+    // directories were keyed on the exact model id, unless it belongs to
+    // another model whose id reads alike
+    private static moveLegacyStore(root: string, modelId: string, dir: string) {
+        const legacyDir = path.join(root, legacyStoreDirectoryName(modelId));
+        if (fs.existsSync(dir) || !fs.existsSync(legacyDir)) {
+            return;
+        }
+        try {
+            if (JSON.parse(fs.readFileSync(path.join(legacyDir, "index.json"), "utf-8")).modelId === modelId) {
+                fs.renameSync(legacyDir, dir);
+            }
+        } catch {
+            // Unreadable, or moved by another process meanwhile
+        }
+    }
+
+    // The store of `modelId` under `root` shared by this process
+    static open(root: string, modelId: string): EmbeddingStore {
+        const key = `${path.resolve(root)}\0${modelId}`;
+        let store = EmbeddingStore.stores.get(key);
+        if (!store) {
+            store = new EmbeddingStore(root, modelId);
+            EmbeddingStore.stores.set(key, store);
+        }
+        return store;
+    }
+
+    private get indexPath(): string {
+        return path.join(this.dir, "index.json");
+    }
+
+    private vectorsPath(generation: number): string {
+        return path.join(this.dir, generation > 0 ? `vectors.${generation}.f32` : "vectors.f32");
+    }
+
+    private logPath(generation: number): string {
+        return path.join(this.dir, generation > 0 ? `rows.${generation}.log` : "rows.log");
+    }
+
+    // Reads index.json and the log of its generation from the start
+    private reload() {
+        this.readIndex();
+        this.readLog();
+    }
+
+    private readIndex() {
+        this.rows = new Map();
+        this.rowCount = 0;
+        this.logBytes = 0;
+        let index: StoreIndex;
+        try {
+            const stat = fs.statSync(this.indexPath);
+            index = JSON.parse(fs.readFileSync(this.indexPath, "utf-8"));
+            this.indexStamp = statStamp(stat);
+        } catch {
+            // Missing or unreadable: start empty
+            this.indexStamp = "";
+            this.index = { modelId: this.modelId, dimension: 0, generation: 0, owners: {} };
+            return;
+        }
+        if (index.modelId !== this.modelId) {
+            throw new Error(`Embedding store ${this.dir} holds model ${index.modelId}, not ${this.modelId}`);
+        }
+        index.generation = index.generation ?? 0;
+        for (const [hash, row] of Object.entries(index.rows ?? {})) {
+            this.rows.set(hash, row);
+            this.rowCount = Math.max(this.rowCount, row + 1);
+        }
+        this.index = index;
+    }
+
+    // Reads the lines appended to the log since it was last read. A line
+    // still being written is left for the next read.
+    private readLog() {
+        if (this.index.rows) {
+            // Written before the log; the next write converts it
+            return;
+        }
+        let fd: number;
+        try {
+            fd = fs.openSync(this.logPath(this.index.generation), "r");
+        } catch (error: any) {
+            if (error.code === "ENOENT") {
+                return;
+            }
+            throw error;
+        }
+        try {
+            const size = fs.fstatSync(fd).size;
+            if (size <= this.logBytes) {
+                return;
+            }
+            const buffer = Buffer.alloc(size - this.logBytes);
+            fs.readSync(fd, buffer, 0, buffer.length, this.logBytes);
+            const end = buffer.lastIndexOf("\n") + 1;
+            if (end === 0) {
+                return;
+            }
+            for (const hash of buffer.toString("utf-8", 0, end - 1).split("\n")) {
+                // An empty line is a row with no vector
+                if (hash !== "") {
+                    this.rows.set(hash, this.rowCount);
+                }
+                this.rowCount += 1;
+            }
+            this.logBytes += end;
+        } finally {
+            fs.closeSync(fd);
+        }
+    }
+
+    // Re-reads index.json if another writer replaced it, and the rows other
+    // writers appended since
+    private refresh() {
+        let stamp = "";
+        try {
+            stamp = statStamp(fs.statSync(this.indexPath));
+        } catch {
+            // No index yet
+        }
+        if (stamp !== this.indexStamp) {
+            this.readIndex();
+        }
+        this.readLog();
+    }
+
+    private get dimension(): number {
+        return this.index.dimension || (this.pending.values().next().value?.length ?? 0);
+    }
+
+    // The stored vector of each hash, or null where there is none
+    lookup(hashes: string[]): (number[] | null)[] {
+        this.refresh();
+        let vectors: (number[] | null)[];
+        try {
+            vectors = this.read(hashes);
+        } catch (error: any) {
+            if (error.code !== "ENOENT") {
+                throw error;
+            }
+            // Collected by another process since index.json was read
+            this.reload();
+            vectors = this.read(hashes);
+        }
+        for (const vector of vectors) {
+            if (vector === null) {
+                this.misses += 1;
+            } else {
+                this.hits += 1;
+            }
+        }
+        return vectors;
+    }
+
+    private read(hashes: string[]): (number[] | null)[] {
+        const dimension = this.index.dimension;
+        const rowBytes = dimension * 4;
+        const buffer = Buffer.alloc(rowBytes);
+        const vectors: (number[] | null)[] = [];
+        let fd = -1;
+        try {
+            for (const hash of hashes) {
+                const pending = this.pending.get(hash);
+                const row = this.rows.get(hash);
+                if (pending) {
+                    vectors.push(Array.from(pending));
+                } else if (row === undefined) {
+                    vectors.push(null);
+                } else {
+                    if (fd < 0) {
+                        fd = fs.openSync(this.vectorsPath(this.index.generation), "r");
+                    }
+                    const read = fs.readSync(fd, buffer, 0, rowBytes, row * rowBytes);
+                    vectors.push(read === rowBytes
+                        ? Array.from(new Float32Array(buffer.buffer, buffer.byteOffset, dimension))
+                        : null);
+                }
+            }
+        } finally {
+            if (fd >= 0) {
+                fs.closeSync(fd);
+            }
+        }
+        return vectors;
+    }
+
+    put(hash: string, vector: number[]) {
+        const dimension = this.dimension;
+        if (dimension !== 0 && vector.length !== dimension) {
+            throw new Error(`Embedding has dimension ${vector.length}, store ${this.dir} holds ${dimension}`);
+        }
+        if (this.rows.has(hash) || this.pending.has(hash)) {
+            return;
+        }
+        this.pending.set(hash, Float32Array.from(vector));
+        this.fresh.add(hash);
+    }
+
+    // Replaces the hashes `owner` references
+    retain(owner: string, hashes: string[]) {
+        const unique = [...new Set(hashes)].sort();
+        this.ownerChanges.set(owner, unique);
+        unique.forEach(hash => this.fresh.delete(hash));
+    }
+
+    release(owner: string) {
+        this.ownerChanges.set(owner, null);
+    }
+
+    // The owners and their hashes, including the changes not saved yet
+    private currentOwners(): Record<string, string[]> {
+        const owners = { ...this.index.owners };
+        for (const [owner, hashes] of this.ownerChanges) {
+            if (hashes === null) {
+                delete owners[owner];
+            } else {
+                owners[owner] = hashes;
+            }
+        }
+        return owners;
+    }
+
+    owners(): string[] {
+        return Object.keys(this.currentOwners());
+    }
+
+    referenceCount(hash: string): number {
+        return Object.values(this.currentOwners()).filter(hashes => hashes.includes(hash)).length;
+    }
+
+    stats(): EmbeddingStoreStats {
+        const lookups = this.hits + this.misses;
+        const unsaved = [...this.pending.keys()].filter(hash => !this.rows.has(hash)).length;
+        return {
+            lookups,
+            hits: this.hits,
+            misses: this.misses,
+            hitRate: lookups > 0 ? this.hits / lookups : 0,
+            vectors: this.rows.size + unsaved
+        };
+    }
+
+    // Writes new vectors and owner changes
+    async save() {
+        await this.lock.run(() => this.write(true));
+    }
+
+    // Writes new vectors, so that they are no longer held in memory
+    async flush() {
+        if (this.pending.size > 0) {
+            await this.lock.run(() => this.write(false));
+        }
+    }
+
+    // Under the lock: appends this store's vectors to the files of the
+    // current generation, and writes index.json if anything in it changed
+    private write(withOwners: boolean) {
+        this.refresh();
+        let indexChanged = false;
+        if (this.index.rows) {
+            this.writeLog();
+            delete this.index.rows;
+            indexChanged = true;
+        }
+        const generation = this.index.generation;
+        const added = [...this.pending].filter(([hash]) => !this.rows.has(hash));
+        if (added.length > 0) {
+            const dimension = this.dimension;
+            const rowBytes = dimension * 4;
+            // After the last row in the log: the vectors of a write
+            // interrupted before its log lines are overwritten
+            const vectorsPath = this.vectorsPath(generation);
+            const fd = fs.openSync(vectorsPath, fs.existsSync(vectorsPath) ? "r+" : "w+");
+            try {
+                added.forEach(([, vector], i) => {
+                    fs.writeSync(fd, Buffer.from(vector.buffer, vector.byteOffset, vector.byteLength), 0, rowBytes,
+                        (this.rowCount + i) * rowBytes);
+                });
+                fs.fsyncSync(fd);
+            } finally {
+                fs.closeSync(fd);
+            }
+            this.appendLog(added.map(([hash]) => hash));
+            if (this.index.dimension !== dimension) {
+                this.index.dimension = dimension;
+                indexChanged = true;
+            }
+        }
+        this.pending.clear();
+        if (withOwners && this.ownerChanges.size > 0) {
+            this.index.owners = this.currentOwners();
+            this.ownerChanges.clear();
+            indexChanged = true;
+        }
+        if (indexChanged) {
+            this.writeIndex();
+            this.removeOtherGenerations();
+        }
+    }
+
+    // Appends rows to the log after its last whole line, replacing a line
+    // an interrupted write left unfinished
+    private appendLog(hashes: string[]) {
+        const logPath = this.logPath(this.index.generation);
+        const lines = Buffer.from(hashes.map(hash => `${hash}\n`).join(""));
+        const fd = fs.openSync(logPath, fs.existsSync(logPath) ? "r+" : "w+");
+        try {
+            fs.ftruncateSync(fd, this.logBytes);
+            fs.writeSync(fd, lines, 0, lines.length, this.logBytes);
+            fs.fsyncSync(fd);
+        } finally {
+            fs.closeSync(fd);
+        }
+        hashes.forEach((hash, i) => this.rows.set(hash, this.rowCount + i));
+        this.rowCount += hashes.length;
+        this.logBytes += lines.length;
+    }
+
+    // Writes the log of the current generation from the rows in memory
+    private writeLog() {
+        const lines: string[] = new Array(this.rowCount).fill("");
+        for (const [hash, row] of this.rows) {
+            lines[row] = hash;
+        }
+        const content = Buffer.from(lines.map(line => `${line}\n`).join(""));
+        const fd = fs.openSync(this.logPath(this.index.generation), "w");
+        try {
+            fs.writeSync(fd, content);
+            fs.fsyncSync(fd);
+        } finally {
+            fs.closeSync(fd);
+        }
+        this.logBytes = content.length;
+    }
+
+    private writeIndex() {
+        const tmpPath = `${this.indexPath}.${process.pid}.tmp`;
+        fs.writeFileSync(tmpPath, JSON.stringify(this.index));
+        fs.renameSync(tmpPath, this.indexPath);
+        this.indexStamp = statStamp(fs.statSync(this.indexPath));
+    }
+
+    // Deletes the vectors files and logs of generations index.json no longer
+    // names. A reader that still has one open keeps reading it until it
+    // closes it.
+    private removeOtherGenerations() {
+        const current = [this.vectorsPath(this.index.generation), this.logPath(this.index.generation)]
+            .map(file => path.basename(file));
+        for (const name of fs.readdirSync(this.dir)) {
+            if (/^(vectors(\.\d+)?\.f32|rows(\.\d+)?\.log)$/.test(name) && !current.includes(name)) {
+                fs.rmSync(path.join(this.dir, name), { force: true });
+            }
+        }
+    }
+
+    // Drops every vector no owner references once they make up more than
+    // `minGarbage` of the store, compacting the live vectors into the next
+    // generation's file GC_BLOCK_ROWS rows at a time, and their rows into its
+    // log. Saves the store's
+    // changes first. Returns the number of vectors dropped.
+    async gc(minGarbage = 0): Promise<number> {
+        return this.lock.run(() => {
+            this.write(true);
+            const live = new Set([...Object.values(this.index.owners).flat(), ...this.fresh]);
+            const hashes = [...this.rows.keys()];
+            const dead = hashes.filter(hash => !live.has(hash)).length;
+            if (dead === 0 || dead <= minGarbage * hashes.length) {
+                return 0;
+            }
+
+            const dimension = this.index.dimension;
+            const rowBytes = dimension * 4;
+            const oldPath = this.vectorsPath(this.index.generation);
+            const rowCount = Math.min(this.rowCount, Math.floor(fs.statSync(oldPath).size / rowBytes));
+            const hashOfRow: (string | undefined)[] = new Array(rowCount);
+            for (const [hash, row] of this.rows) {
+                if (live.has(hash) && row < rowCount) {
+                    hashOfRow[row] = hash;
+                }
+            }
+            const generation = this.index.generation + 1;
+            const input = Buffer.alloc(GC_BLOCK_ROWS * rowBytes);
+            const output = Buffer.alloc(GC_BLOCK_ROWS * rowBytes);
+            const rows = new Map<string, number>();
+            let kept = 0;
+            let buffered = 0;
+            const inFd = fs.openSync(oldPath, "r");
+            const outFd = fs.openSync(this.vectorsPath(generation), "w");
+            try {
+                for (let start = 0; start < rowCount; start += GC_BLOCK_ROWS) {
+                    const count = Math.min(GC_BLOCK_ROWS, rowCount - start);
+                    fs.readSync(inFd, input, 0, count * rowBytes, start * rowBytes);
+                    for (let i = 0; i < count; i++) {
+                        const hash = hashOfRow[start + i];
+                        if (hash === undefined) {
+                            continue;
+                        }
+                        input.copy(output, buffered * rowBytes, i * rowBytes, (i + 1) * rowBytes);
+                        rows.set(hash, kept++);
+                        if (++buffered === GC_BLOCK_ROWS) {
+                            fs.writeSync(outFd, output, 0, buffered * rowBytes);
+                            buffered = 0;
+                        }
+                    }
+                    this.lock.touch();
+                }
+                fs.writeSync(outFd, output, 0, buffered * rowBytes);
+                fs.fsyncSync(outFd);
+            } finally {
+                fs.closeSync(inFd);
+                fs.closeSync(outFd);
+            }
+            const dropped = hashes.length - kept;
+            this.index = { ...this.index, generation };
+            this.rows = rows;
+            this.rowCount = kept;
+            this.writeLog();
+            this.writeIndex();
+            this.removeOtherGenerations();
+            return dropped;
+        });
+    }
+
+    // Releases `owner` in the store of every model under `root` but
+    // `exceptModelId`, collecting the garbage this leaves.
+    static async releaseEverywhere(root: string, owner: string, exceptModelId?: string) {
+        if (!fs.existsSync(root)) {
+            return;
+        }
+        for (const entry of fs.readdirSync(root, { withFileTypes: true })) {
+            const indexPath = path.join(root, entry.name, "index.json");
+            if (!entry.isDirectory() || !fs.existsSync(indexPath)) {
+                continue;
+            }
+            let modelId: string;
+            let owners: Record<string, string[]>;
+            try {
+                ({ modelId, owners } = JSON.parse(fs.readFileSync(indexPath, "utf-8")));
+            } catch {
+                continue;
+            }
+            if (modelId === exceptModelId || !(owner in owners)) {
+                continue;
+            }
+            const store = EmbeddingStore.open(root, modelId);
+            store.release(owner);
+            await store.gc();
+        }
+    }
+}
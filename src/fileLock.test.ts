@@ -0,0 +1,43 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { FileLock } from './fileLock';
+
+describe('FileLock', () => {
+  let root: string;
+  let lockPath: string;
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'file-lock-'));
+    lockPath = path.join(root, 'test.lock');
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  it('runs holders one at a time', async () => {
+    let running = 0;
+    let most = 0;
+    const hold = () => new FileLock(lockPath).run(async () => {
+      running += 1;
+      most = Math.max(most, running);
+      await new Promise(resolve => setTimeout(resolve, 5));
+      running -= 1;
+    });
+    await Promise.all(Array.from({ length: 5 }, hold));
+    expect(most).toBe(1);
+    expect(fs.existsSync(lockPath)).toBe(false);
+  });
+
+  it('breaks a stale lock but not a fresh one', async () => {
+    fs.writeFileSync(lockPath, '12345:dead');
+    const old = new Date(Date.now() - 60000);
+    fs.utimesSync(lockPath, old, old);
+    expect(await new FileLock(lockPath).run(() => 'taken')).toBe('taken');
+
+    fs.writeFileSync(lockPath, '12345:alive');
+    await expect(new FileLock(lockPath, { timeoutMs: 50 }).run(() => 'taken')).rejects.toThrow('Timed out');
+    expect(fs.readFileSync(lockPath, 'utf-8')).toBe('12345:alive');
+  });
+});
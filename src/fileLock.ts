@@ -0,0 +1,147 @@
+import crypto from "crypto";
+import fs from "fs";
+import path from "path";
+
+// An exclusive lock shared by the processes of one machine: a lock file
+// created with O_EXCL that holds a token unique to each acquisition.
+// Waiters in other processes poll for it; callers in this process queue in
+// memory first, so they take turns without polling.
+//
+// A lock file older than `staleMs` is taken to be left behind by a crashed
+// process and broken. Holders of long operations call touch() to keep it
+// fresh. Breaking renames the file to a name of the breaker's own and
+// compares the token it moved with the one it judged stale: if another
+// waiter broke the stale lock and took a new one in between, the breaker has
+// moved a live lock and links it back instead of deleting it.
+
+export interface FileLockOptions {
+    retryMs?: number;
+    timeoutMs?: number;
+    staleMs?: number;
+}
+
+function sleep(ms: number): Promise<void> {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+export class FileLock {
+    // Tail of the queue of this process's callers, by lock path
+    private static queues = new Map<string, Promise<void>>();
+    private token: string | null = null;
+    private retryMs: number;
+    private timeoutMs: number;
+    private staleMs: number;
+
+    constructor(readonly lockPath: string, options: FileLockOptions = {}) {
+        this.lockPath = path.resolve(lockPath);
+        this.retryMs = options.retryMs ?? 25;
+        this.timeoutMs = options.timeoutMs ?? 60000;
+        this.staleMs = options.staleMs ?? 30000;
+    }
+
+    // Runs `action` while holding the lock
+    async run<T>(action: () => T | Promise<T>): Promise<T> {
+        const previous = FileLock.queues.get(this.lockPath) ?? Promise.resolve();
+        let done!: () => void;
+        const tail = previous.then(() => new Promise<void>(resolve => { done = resolve; }));
+        FileLock.queues.set(this.lockPath, tail);
+        await previous;
+        try {
+            await this.acquire();
+            try {
+                return await action();
+            } finally {
+                this.release();
+            }
+        } finally {
+            done();
+            if (FileLock.queues.get(this.lockPath) === tail) {
+                FileLock.queues.delete(this.lockPath);
+            }
+        }
+    }
+
+    // Marks the held lock as alive
+    touch() {
+        const now = new Date();
+        try {
+            fs.utimesSync(this.lockPath, now, now);
+        } catch {
+            // Not held: nothing to refresh
+        }
+    }
+
+    private async acquire() {
+        fs.mkdirSync(path.dirname(this.lockPath), { recursive: true });
+        const token = `${process.pid}:${crypto.randomBytes(8).toString("hex")}`;
+        const deadline = Date.now() + this.timeoutMs;
+        for (;;) {
+            try {
+                const fd = fs.openSync(this.lockPath, "wx");
+                try {
+                    fs.writeSync(fd, token);
+                } finally {
+                    fs.closeSync(fd);
+                }
+                this.token = token;
+                return;
+            } catch (error: any) {
+                if (error.code !== "EEXIST") {
+                    throw error;
+                }
+            }
+            if (this.breakIfStale(token)) {
+                continue;
+            }
+            if (Date.now() > deadline) {
+                throw new Error(`Timed out waiting for the lock ${this.lockPath}`);
+            }
+            await sleep(this.retryMs);
+        }
+    }
+
+    // Removes the lock file only if it is still ours
+    private release() {
+        try {
+            if (fs.readFileSync(this.lockPath, "utf-8") === this.token) {
+                fs.rmSync(this.lockPath, { force: true });
+            }
+        } catch {
+            // Already gone
+        } finally {
+            this.token = null;
+        }
+    }
+
+    // Breaks the lock if it is stale. Returns true if the caller should try
+    // to take it again at once.
+    private breakIfStale(token: string): boolean {
+        let holder: string;
+        try {
+            holder = fs.readFileSync(this.lockPath, "utf-8");
+            if (Date.now() - fs.statSync(this.lockPath).mtimeMs <= this.staleMs) {
+                return false;
+            }
+        } catch {
+            // Released between our open and the check
+            return true;
+        }
+        const moved = `${this.lockPath}.${token.replace(":", ".")}.stale`;
+        try {
+            fs.renameSync(this.lockPath, moved);
+        } catch {
+            return true;
+        }
+        try {
+            if (fs.readFileSync(moved, "utf-8") !== holder) {
+                // Someone else broke the stale lock and took it in between
+                fs.linkSync(moved, this.lockPath);
+            }
+        } catch {
+            // Taken yet again: its holder will find it is not theirs on release
+        } finally {
+            fs.rmSync(moved, { force: true });
+        }
+        return true;
+    }
+}
@@ -8,39 +8,127 @@ import { simpleGit } from 'simple-git';
 import os from 'os';
 import path from 'path';
 import { pipeline } from '@xenova/transformers';
-import faiss from 'faiss-node';
 import { createInterface } from 'readline';
-import { walkAndChunkDirectory } from './chunkers/chunkerRouter';
+import { chunkFiles, logSkippedFiles, streamRepositoryChunks, SUPPORTED_EXTENSIONS } from './chunkers/chunkerRouter';
+import { FileDiscovery } from './chunkers/fileDiscovery';
 import { CodeChunk } from './chunkers/tsChunker';
+import { EmbeddingStore, chunkTextHash } from './embeddingStore';
+import { IndexCache } from './indexCache';
+import { IndexTypeOptions, buildFaissIndexFrom } from './indexTypes';
+import { JsonArrayWriter, VectorSpill, batched } from './indexPipeline';
+import { ChunkDeduplicator } from './chunkDedup';
+import { LexicalDocument, LexicalIndex, reciprocalRankFusion } from './lexicalIndex';
+import { CallGraph, CallGraphDocument } from './callGraph';
+import { CatalogEntry, RepositoryCatalog } from './repositoryCatalog';
+import { LoadedIndex, SearchHit, indexVersion, isLegacyIndex, loadIndex, loadLegacyIndex, readIndexTexts, searchLoadedIndex } from './indexSearch';
+import { SearchWorkerPool } from './searchWorkers';
 
 // Types
 interface RepositoryConfig {
   storagePath: string;
   repoUrl: string;
   embeddingConfig?: EmbeddingProviderConfig;
+  // Update an existing index from the git diff since it was built instead of
+  // rebuilding it from scratch. Defaults to true.
+  incremental?: boolean;
+  // FAISS index type, chosen by corpus size unless given
+  indexOptions?: IndexTypeOptions;
 }
 
 interface EmbeddingProviderConfig {
   provider: 'openai' | 'huggingface' | 'xenova';
   model?: string;
   tokenLimit?: number;
+  // Texts per forward pass of the local (xenova) model
+  batchSize?: number;
 }
 
-interface EmbeddingResult {
-  embeddings: number[][];
-  texts: string[];
+// One text to embed and index, with what the lexical index and the call
+// graph record about the chunk it was cut from
+interface IndexItem {
+  text: string;
+  // Repository-relative path of the file it came from
+  source: string;
+  document: LexicalDocument;
+  graphDocument: CallGraphDocument;
 }
 
-interface SearchResult {
-  distances: number[];
-  labels: number[];
+// Stored next to the index as `${indexPath}.meta.json`
+interface IndexMetadata {
+  // Commit the index was built from
+  commit: string | null;
+  embeddingProvider: EmbeddingProviderConfig['provider'];
+  embeddingModel: string | null;
+  // FAISS factory descriptor of the index, e.g. "Flat" or "HNSW32,Flat"
+  indexType: string;
+  builtAt: string;
+  // Repository-relative path of the file each stored vector came from
+  sources: string[];
+  // Texts not embedded because they repeat an indexed one, see
+  // `${indexPath}.aliases.json`
+  aliases?: number;
+}
+
+// A text that repeats (exactly or nearly) the indexed text `of`, stored in
+// `${indexPath}.aliases.json` instead of being embedded
+interface ChunkAlias {
+  of: number;
+  source: string;
+  text: string;
+  name: string;
+  symbols: string[];
+  calls: string[];
+}
+
+interface RepositoryChanges {
+  // Added or modified files (repository-relative), to be chunked again
+  changed: string[];
+  // Deleted files, or the old side of a rename
+  removed: string[];
 }
 
 // Default storage path
 const DEFAULT_STORAGE_PATH = path.join(os.homedir(), '.github_repo_rag');
 
-// Add this after the DEFAULT_STORAGE_PATH constant
-const REPOSITORY_MAP_PATH = path.join(DEFAULT_STORAGE_PATH, 'repository_map.json');
+// Processed repositories, see repositoryCatalog.ts
+const catalog = new RepositoryCatalog(DEFAULT_STORAGE_PATH);
+
+// Embeddings shared by all repositories, see embeddingStore.ts
+const EMBEDDING_STORE_PATH = path.join(DEFAULT_STORAGE_PATH, 'embeddings');
+
+// Share of unreferenced vectors above which the embedding store is compacted
+const EMBEDDING_STORE_MAX_GARBAGE = 0.25;
+
+// Memory budget for the indexes kept loaded between questions
+const INDEX_CACHE_BYTES = Number(process.env.INDEX_CACHE_MB || 1024) * 1024 * 1024;
+
+// Memory budget for cached query embeddings and search results
+const QUERY_CACHE_BYTES = Number(process.env.QUERY_CACHE_MB || 64) * 1024 * 1024;
+
+// Texts embedded and appended to a new index at a time. The xenova provider
+// sorts them by length before cutting its batches, so that a batch is
+// padded to texts about as long as its own: the more texts it sorts at once
+// the less padding, at a few MB of memory per thousand texts.
+const PIPELINE_BATCH_SIZE = 2048;
+
+// New embeddings the store holds in memory before writing them out
+const STORE_FLUSH_ROWS = 4096;
+
+// Model ask-question embeds questions with
+const QUERY_EMBEDDING_MODEL = 'Xenova/all-MiniLM-L6-v2';
+
+// Indexes loaded by ask-question, kept for the lifetime of the server
+const indexCache = new IndexCache<LoadedIndex>(INDEX_CACHE_BYTES);
+
+// Threads that search-repositories searches several indexes on at once,
+// with a cache of the same size for the indexes they load; see
+// searchWorkers.ts
+const searchWorkers = new SearchWorkerPool({ cacheBytes: INDEX_CACHE_BYTES });
+
+// Query embeddings by normalised question, and search results by index
+// version, k and normalised question
+const queryEmbeddingCache = new IndexCache<number[]>(QUERY_CACHE_BYTES / 2);
+const resultCache = new IndexCache<SearchHit[]>(QUERY_CACHE_BYTES / 2);
 
 // Create readline interface for user input
 const rl = createInterface({
@@ -62,10 +150,11 @@ function debug(...args: any[]) {
   console.error(...args);
 }
 
-// Function to clone repository
-async function cloneRepository(repoUrl: string, storagePath: string): Promise<string> {
+// Function to clone repository, or fast-forward an existing clone to the
+// latest remote commit. Returns the clone's path and its HEAD commit.
+async function syncRepository(repoUrl: string, storagePath: string): Promise<{ repoPath: string; commit: string }> {
   try {
-    debug(`Starting repository clone from ${repoUrl} to ${storagePath}`);
+    debug(`Syncing repository ${repoUrl} into ${storagePath}`);
     
     if (!fs.existsSync(storagePath)) {
       debug(`Creating storage directory: ${storagePath}`);
@@ -76,16 +165,27 @@ async function cloneRepository(repoUrl: string, storagePath: string): Promise<st
     const repoPath = path.join(storagePath, repoName);
     debug(`Repository path will be: ${repoPath}`);
 
+    if (fs.existsSync(path.join(repoPath, '.git'))) {
+      try {
+        debug('Fetching existing clone...');
+        const git = simpleGit(repoPath);
+        await git.fetch('origin');
+        await git.reset(['--hard', 'origin/HEAD']);
+        const commit = (await git.revparse(['HEAD'])).trim();
+        debug(`Updated existing clone at ${repoPath} to ${commit}`);
+        return { repoPath, commit };
+      } catch (error) {
+        debug('Failed to update existing clone, cloning again:', error);
+      }
+    }
+
     if (fs.existsSync(repoPath)) {
       debug(`Removing existing repository at: ${repoPath}`);
       fs.rmSync(repoPath, { recursive: true, force: true });
     }
 
-    debug('Initializing git...');
-    const git = simpleGit();
-    
     debug('Starting clone...');
-    await git.clone(repoUrl, repoPath);
+    await simpleGit().clone(repoUrl, repoPath);
     
     // Verify the clone was successful
     if (!fs.existsSync(repoPath)) {
@@ -97,11 +197,11 @@ async function cloneRepository(repoUrl: string, storagePath: string): Promise<st
       throw new Error(`Cloned repository is empty at ${repoPath}`);
     }
     
-    debug(`Successfully cloned repository to ${repoPath}`);
-    debug(`Repository contents: ${entries.join(', ')}`);
-    return repoPath;
+    const commit = (await simpleGit(repoPath).revparse(['HEAD'])).trim();
+    debug(`Successfully cloned repository to ${repoPath} at ${commit}`);
+    return { repoPath, commit };
   } catch (error) {
-    debug('Error in cloneRepository:', error);
+    debug('Error in syncRepository:', error);
     if (error instanceof Error) {
       debug('Error stack:', error.stack);
     }
@@ -109,77 +209,135 @@ async function cloneRepository(repoUrl: string, storagePath: string): Promise<st
   }
 }
 
-// Function to extract text from repository
-async function extractRepositoryText(repoPath: string): Promise<string[]> {
+// Files added, modified, renamed or deleted between two commits, or null if
+// the diff cannot be computed (e.g. the old commit was force-pushed away).
+async function diffRepository(repoPath: string, fromCommit: string, toCommit: string): Promise<RepositoryChanges | null> {
   try {
-    debug('Starting text extraction from:', repoPath);
-    
-    if (!fs.existsSync(repoPath)) {
-      throw new Error(`Repository path does not exist: ${repoPath}`);
-    }
-    
-    const stats = fs.statSync(repoPath);
-    if (!stats.isDirectory()) {
-      throw new Error(`Repository path is not a directory: ${repoPath}`);
-    }
-    
-    debug('Walking and chunking directory...');
-    const chunks = walkAndChunkDirectory(repoPath);
-    debug(`Found ${chunks.length} chunks`);
-    
-    if (!Array.isArray(chunks)) {
-      throw new Error(`Expected chunks to be an array, got ${typeof chunks}`);
-    }
-    
-    debug('Processing chunks...');
-    const texts = chunks.map((chunk: CodeChunk) => {
-      if (!chunk || typeof chunk.code !== 'string') {
-        debug('Invalid chunk found:', JSON.stringify(chunk, null, 2));
-        return '';
+    const output = await simpleGit(repoPath).raw(['diff', '--name-status', '-M', fromCommit, toCommit]);
+    const changes: RepositoryChanges = { changed: [], removed: [] };
+    for (const line of output.split('\n')) {
+      const [status, ...paths] = line.split('\t');
+      if (!status || paths.length === 0) {
+        continue;
+      }
+      if (status.startsWith('D')) {
+        changes.removed.push(paths[0]);
+      } else if (status.startsWith('R')) {
+        changes.removed.push(paths[0]);
+        changes.changed.push(paths[1]);
+      } else {
+        changes.changed.push(paths[paths.length - 1]);
       }
-      debug(`Valid chunk found: ${chunk.name} (${chunk.type}) from ${chunk.filePath}`);
-      return chunk.code;
-    }).filter(text => text.length > 0);
-    
-    debug(`Extracted ${texts.length} valid text chunks`);
-    if (texts.length === 0) {
-      debug('No valid text chunks were extracted. This could mean:');
-      debug('1. No supported files were found in the repository');
-      debug('2. The files were empty or contained no extractable content');
-      debug('3. There was an error during chunking');
     }
-    return texts;
+    return changes;
   } catch (error) {
-    debug('Error in extractRepositoryText:', error);
-    if (error instanceof Error) {
-      debug('Error stack:', error.stack);
+    debug(`Could not diff ${fromCommit}..${toCommit}:`, error);
+    return null;
+  }
+}
+
+// Default token limit per chunk for each embedding provider
+const DEFAULT_TOKEN_LIMITS: Record<EmbeddingProviderConfig['provider'], number> = {
+  openai: 8000,
+  huggingface: 512,
+  xenova: 512
+};
+
+// Model each provider uses when none is configured
+const DEFAULT_EMBEDDING_MODELS: Record<EmbeddingProviderConfig['provider'], string> = {
+  openai: 'text-embedding-3-small',
+  huggingface: 'sentence-transformers/all-MiniLM-L6-v2',
+  xenova: 'Xenova/all-MiniLM-L6-v2'
+};
+
+const DEFAULT_EMBEDDING_BATCH_SIZE = 32;
+
+// Identifies the vectors a configuration produces in the embedding store
+function embeddingModelId(config: EmbeddingProviderConfig): string {
+  return `${config.provider}:${config.model || DEFAULT_EMBEDDING_MODELS[config.provider]}`;
+}
+
+function tokenLimitFor(config: EmbeddingProviderConfig = { provider: 'xenova' }): number {
+  return config.tokenLimit || DEFAULT_TOKEN_LIMITS[config.provider] || DEFAULT_TOKEN_LIMITS.xenova;
+}
+
+// Streams the items to index of a whole repository, chunk by chunk
+async function* repositoryItems(repoPath: string, config: EmbeddingProviderConfig): AsyncGenerator<IndexItem> {
+  debug('Chunking repository:', repoPath);
+  // Python definitions are split on statement boundaries to fit the
+  // embedding model, so splitToTokenLimit rarely has to cut them blindly.
+  for await (const chunk of streamRepositoryChunks(repoPath, { maxTokens: tokenLimitFor(config) })) {
+    if (isValidChunk(chunk)) {
+      yield* chunkItems(chunk, path.relative(repoPath, chunk.filePath), config);
     }
-    throw error;
   }
 }
 
-// Function to create embeddings
-async function createEmbeddings(texts: string[], config: EmbeddingProviderConfig = { provider: 'xenova' }): Promise<EmbeddingResult> {
+// The items of one chunk: one per piece of it that fits the token limit
+function chunkItems(chunk: CodeChunk, source: string, config: EmbeddingProviderConfig): IndexItem[] {
+  return splitToTokenLimit(chunk.code, tokenLimitFor(config)).map(text => ({
+    text,
+    source,
+    document: lexicalDocument(text, chunk),
+    graphDocument: callGraphDocument(chunk)
+  }));
+}
+
+// Drops chunks without code
+function validChunksOf(chunks: CodeChunk[]): CodeChunk[] {
+  return chunks.filter(isValidChunk);
+}
+
+function isValidChunk(chunk: CodeChunk): boolean {
+  if (!chunk || typeof chunk.code !== 'string' || chunk.code.length === 0) {
+    debug('Invalid chunk found:', JSON.stringify(chunk, null, 2));
+    return false;
+  }
+  return true;
+}
+
+// Splits text longer than the token limit into pieces of about equal size
+function splitToTokenLimit(text: string, limit: number): string[] {
+  if (!limit) return [text];
+  // Simple token estimation (4 chars per token on average)
+  const estimatedTokens = Math.ceil(text.length / 4);
+  if (estimatedTokens <= limit) return [text];
+  
+  const numChunks = Math.ceil(estimatedTokens / limit);
+  const chunkSize = Math.ceil(text.length / numChunks);
+  const chunks: string[] = [];
+  
+  for (let i = 0; i < text.length; i += chunkSize) {
+    chunks.push(text.slice(i, i + chunkSize));
+  }
+  return chunks;
+}
+
+// Embeds one batch of texts. With a store, texts embedded before by the
+// same model are read from it instead of being embedded again.
+async function embedBatch(
+  texts: string[],
+  hashes: string[],
+  config: EmbeddingProviderConfig,
+  store?: EmbeddingStore
+): Promise<number[][]> {
+  const embeddings: (number[] | null)[] = store ? store.lookup(hashes) : texts.map(() => null);
+  const missing = embeddings.flatMap((embedding, i) => embedding === null ? [i] : []);
+  const computed = await embedTexts(missing.map(i => texts[i]), config);
+  missing.forEach((textIndex, i) => {
+    embeddings[textIndex] = computed[i];
+    store?.put(hashes[textIndex], computed[i]);
+  });
+  return embeddings as number[][];
+}
+
+// Embeds each text with the configured provider
+async function embedTexts(texts: string[], config: EmbeddingProviderConfig): Promise<number[][]> {
   const embeddings: number[][] = [];
-  const processedTexts: string[] = [];
-
-  // Helper function to chunk text based on token limit
-  const chunkText = (text: string, limit: number): string[] => {
-    if (!limit) return [text];
-    // Simple token estimation (4 chars per token on average)
-    const estimatedTokens = Math.ceil(text.length / 4);
-    if (estimatedTokens <= limit) return [text];
-    
-    // Split into chunks of approximately equal size
-    const numChunks = Math.ceil(estimatedTokens / limit);
-    const chunkSize = Math.ceil(text.length / numChunks);
-    const chunks: string[] = [];
-    
-    for (let i = 0; i < text.length; i += chunkSize) {
-      chunks.push(text.slice(i, i + chunkSize));
-    }
-    return chunks;
-  };
+  if (texts.length === 0) {
+    return embeddings;
+  }
+  const model = config.model || DEFAULT_EMBEDDING_MODELS[config.provider] || DEFAULT_EMBEDDING_MODELS.xenova;
 
   switch (config.provider) {
     case 'openai': {
@@ -189,15 +347,11 @@ async function createEmbeddings(texts: string[], config: EmbeddingProviderConfig
       const openai = new OpenAI({ apiKey });
       
       for (const text of texts) {
-        const chunks = chunkText(text, config.tokenLimit || 8000);
-        for (const chunk of chunks) {
-          const response = await openai.embeddings.create({
-            model: config.model || 'text-embedding-3-small',
-            input: chunk,
-          });
-          embeddings.push(response.data[0].embedding);
-          processedTexts.push(chunk);
-        }
+        const response = await openai.embeddings.create({
+          model,
+          input: text,
+        });
+        embeddings.push(response.data[0].embedding);
       }
       break;
     }
@@ -209,147 +363,345 @@ async function createEmbeddings(texts: string[], config: EmbeddingProviderConfig
       const hf = new HfInference(apiKey);
       
       for (const text of texts) {
-        const chunks = chunkText(text, config.tokenLimit || 512);
-        for (const chunk of chunks) {
-          const response = await hf.featureExtraction({
-            model: config.model || 'sentence-transformers/all-MiniLM-L6-v2',
-            inputs: chunk,
-          });
-          embeddings.push(response as number[]);
-          processedTexts.push(chunk);
-        }
+        const response = await hf.featureExtraction({
+          model,
+          inputs: text,
+        });
+        embeddings.push(response as number[]);
       }
       break;
     }
     
     case 'xenova':
     default: {
-      const extractor = await pipeline('feature-extraction', config.model || 'Xenova/all-MiniLM-L6-v2');
-      
-      for (const text of texts) {
-        const chunks = chunkText(text, config.tokenLimit || 512);
-        for (const chunk of chunks) {
-          const output = await extractor(chunk, { pooling: 'mean', normalize: true });
-          const embeddingArray = Array.from(output.data);
-          embeddings.push(embeddingArray);
-          processedTexts.push(chunk);
-        }
+      const extractor = await featureExtractor(model);
+
+      // A batch is padded to its longest text, so batches are cut from the
+      // texts sorted by length and the results scattered back into place.
+      const batchSize = Math.max(1, config.batchSize || DEFAULT_EMBEDDING_BATCH_SIZE);
+      const order = texts.map((_, i) => i).sort((a, b) => texts[a].length - texts[b].length);
+      const batched: number[][] = new Array(texts.length);
+      const started = Date.now();
+      for (let start = 0; start < order.length; start += batchSize) {
+        const batch = order.slice(start, start + batchSize);
+        const output = await extractor(batch.map(i => texts[i]), { pooling: 'mean', normalize: true });
+        const dimension = output.dims[output.dims.length - 1];
+        batch.forEach((textIndex, row) => {
+          batched[textIndex] = Array.from(output.data.slice(row * dimension, (row + 1) * dimension) as Float32Array);
+        });
+      }
+      const seconds = (Date.now() - started) / 1000;
+      debug(`Embedded ${texts.length} chunks in batches of ${batchSize} in ${seconds.toFixed(1)}s ` +
+        `(${(texts.length / Math.max(seconds, 0.001)).toFixed(1)} chunks/s)`);
+      for (const embedding of batched) {
+        embeddings.push(embedding);
       }
       break;
     }
   }
 
-  return { embeddings, texts: processedTexts };
+  return embeddings;
 }
 
-// Function to create and save FAISS index
-async function createFaissIndex(embeddings: number[][], texts: string[], indexPath: string) {
-  const dimension = embeddings[0].length;
-  const index = new faiss.IndexFlatL2(dimension);
-  
-  // Convert embeddings to Float32Array
-  const float32Embeddings = embeddings.map(emb => new Float32Array(emb));
-  const embeddingsArray = new Float32Array(float32Embeddings.length * dimension);
-  
-  float32Embeddings.forEach((emb, i) => {
-    embeddingsArray.set(emb, i * dimension);
-  });
+// Embeds `items` a batch at a time and writes the index files: the FAISS
+// index, in FAISS's own binary format so that loading it is a single read,
+// the texts, the lexical index, the call graph, the aliases and the
+// metadata. Vectors, texts and aliases go to disk as they are embedded (see
+// indexPipeline.ts), and the index is built from the spilled vectors once
+// their number is known. Texts repeating an earlier one are stored as
+// aliases of it instead (see chunkDedup.ts); the lexical index and the call
+// graph still index their names, texts and calls, as the text they repeat.
+//
+// The lexical index keeps its postings in run files next to the index
+// until it is committed (see lexicalIndex.ts). What stays in memory still
+// grows with the number of indexed texts, by about 1.2KB per text on real
+// code: under 1KB of near-duplicate state (hash, signature and LSH bands,
+// which every later text is checked against), 170 bytes of call graph ids
+// and 100 bytes of hash. Vectors, texts and postings, several times that,
+// do not.
+//
+// The index is renamed into place last, after the files that go with it,
+// and loadIndexCached rejects an index whose texts do not match it.
+// Returns the hash of every indexed text.
+async function writeIndex(
+  items: AsyncIterable<IndexItem>,
+  commit: string,
+  config: EmbeddingProviderConfig,
+  indexPath: string,
+  store?: EmbeddingStore,
+  indexOptions: IndexTypeOptions = {}
+): Promise<string[]> {
+  const spill = new VectorSpill(`${indexPath}.vectors.tmp`);
+  const texts = new JsonArrayWriter(`${indexPath}.texts.json`);
+  const aliases = new JsonArrayWriter(`${indexPath}.aliases.json`);
+  const dedup = new ChunkDeduplicator();
+  const lexical = LexicalIndex.writer(indexPath);
+  const graph = CallGraph.builder();
+  // Chunks of one file share its path
+  const sourcePaths = new Map<string, string>();
+  const sources: string[] = [];
+  const hashes: string[] = [];
+  try {
+    let unsaved = 0;
+    for await (const pulled of batched(items, PIPELINE_BATCH_SIZE)) {
+      const batch: IndexItem[] = [];
+      const batchHashes: string[] = [];
+      for (const item of pulled) {
+        const hash = chunkTextHash(item.text);
+        const of = dedup.add(hashes.length + batch.length, hash, item.text);
+        if (of === null) {
+          batch.push(item);
+          batchHashes.push(hash);
+        } else {
+          const alias: ChunkAlias = {
+            of,
+            source: item.source,
+            text: item.text,
+            name: item.document.name,
+            symbols: item.document.symbols,
+            calls: item.graphDocument.calls
+          };
+          aliases.write(alias);
+          // Found by name and call graph as the text it repeats
+          lexical.addAlias(item.document, of);
+          graph.addAlias(item.graphDocument, of);
+        }
+      }
+      if (batch.length === 0) {
+        continue;
+      }
+      spill.append(await embedBatch(batch.map(item => item.text), batchHashes, config, store));
+      for (const item of batch) {
+        texts.write(item.text);
+        lexical.add(item.document);
+        graph.add(item.graphDocument);
+        let source = sourcePaths.get(item.source);
+        if (source === undefined) {
+          source = item.source;
+          sourcePaths.set(source, source);
+        }
+        sources.push(source);
+      }
+      hashes.push(...batchHashes);
+      // New vectors wait in the store's memory until they are flushed
+      unsaved += batch.length;
+      if (store && unsaved >= STORE_FLUSH_ROWS) {
+        await store.flush();
+        unsaved = 0;
+      }
+      debug(`Embedded ${spill.count} texts`);
+    }
+    const duplicates = dedup.counts.exact + dedup.counts.near;
+    debug(`Stored ${duplicates} duplicate texts as aliases (${dedup.counts.exact} exact, ${dedup.counts.near} near)`);
 
-  // Convert Float32Array to number[] for FAISS
-  const embeddingsNumberArray = Array.from(embeddingsArray);
-  index.add(embeddingsNumberArray);
-  
-  // Save index and texts
-  const indexData = {
-    dimension,
-    embeddings: embeddingsNumberArray
-  };
-  fs.writeFileSync(indexPath, JSON.stringify(indexData));
-  fs.writeFileSync(`${indexPath}.texts.json`, JSON.stringify(texts));
+    if (spill.count === 0) {
+      debug('No text was extracted. This could mean:');
+      debug('1. No supported files were found');
+      debug('2. Files were empty or contained no extractable content');
+      debug('3. There was an error during chunking');
+      throw new Error('No text was extracted from the repository');
+    }
+    if (store) {
+      await store.save();
+      const stats = store.stats();
+      debug(`Embedding store: ${(stats.hitRate * 100).toFixed(1)}% hit rate over ${stats.lookups} lookups, ` +
+        `${stats.vectors} vectors stored`);
+    }
+
+    const started = Date.now();
+    const { index, descriptor } = buildFaissIndexFrom(spill, indexOptions);
+    debug(`Built ${descriptor} index of ${spill.count} vectors in ${Date.now() - started}ms`);
+
+    // Every file is renamed into place, so readers never see a partial one
+    const tmpPath = `${indexPath}.tmp`;
+    index.write(tmpPath);
+    texts.commit();
+    aliases.commit();
+    lexical.commit();
+    graph.build().save(indexPath);
+    writeIndexMetadata(indexPath, indexMetadataFor(commit, config, descriptor, sources, duplicates));
+    fs.renameSync(tmpPath, indexPath);
+    return hashes;
+  } catch (error) {
+    texts.abort();
+    aliases.abort();
+    lexical.abort();
+    fs.rmSync(`${indexPath}.tmp`, { force: true });
+    throw error;
+  } finally {
+    spill.close();
+  }
 }
 
-// Function to load FAISS index and search
-async function searchSimilarTexts(query: string, indexPath: string, k: number = 3): Promise<string[]> {
-  const extractor = await pipeline('feature-extraction', 'Xenova/all-MiniLM-L6-v2');
-  const queryEmbedding = await extractor(query, { pooling: 'mean', normalize: true });
-  
-  // Load index from file
-  const indexData = JSON.parse(fs.readFileSync(indexPath, 'utf-8'));
-  const index = new faiss.IndexFlatL2(indexData.dimension);
-  index.add(indexData.embeddings);
-  
-  const texts = JSON.parse(fs.readFileSync(`${indexPath}.texts.json`, 'utf-8'));
-  
-  // Convert query embedding to number[]
-  const queryArray = Array.from(queryEmbedding.data);
-  
+function writeIndexMetadata(indexPath: string, metadata: IndexMetadata) {
+  const tmpPath = `${indexPath}.meta.json.tmp`;
+  fs.writeFileSync(tmpPath, JSON.stringify(metadata));
+  fs.renameSync(tmpPath, `${indexPath}.meta.json`);
+}
+
+function readIndexMetadata(indexPath: string): IndexMetadata | null {
+  const metadataPath = `${indexPath}.meta.json`;
+  if (!fs.existsSync(indexPath) || !fs.existsSync(metadataPath)) {
+    return null;
+  }
   try {
-    const rawResult = index.search(queryArray, k);
-    let searchResult: SearchResult;
-    
-    // Handle different possible result formats
-    if (Array.isArray(rawResult) && rawResult.length === 2) {
-      // If result is [distances, labels]
-      searchResult = {
-        distances: rawResult[0],
-        labels: rawResult[1]
-      };
-    } else if (rawResult && typeof rawResult === 'object') {
-      // If result is an object with distances and labels
-      searchResult = {
-        distances: (rawResult as any).distances || [],
-        labels: (rawResult as any).labels || []
-      };
-    } else {
-      throw new Error('Unexpected search result format');
-    }
-    
-    if (!Array.isArray(searchResult.labels) || searchResult.labels.length === 0) {
-      throw new Error('No results found');
-    }
-    
-    // Return the most relevant texts
-    return searchResult.labels.map((label: number) => texts[label]);
-  } catch (error: unknown) {
-    debug('Search error:', error);
-    const errorMessage = error instanceof Error ? error.message : 'Unknown error';
-    throw new Error(`Search failed: ${errorMessage}`);
+    return JSON.parse(fs.readFileSync(metadataPath, 'utf-8'));
+  } catch (error) {
+    debug(`Ignoring unreadable index metadata ${metadataPath}:`, error);
+    return null;
   }
 }
 
-// Function to save repository mapping
-async function saveRepositoryMapping(repoUrl: string, indexPath: string) {
-  let repoMap: Record<string, string> = {};
-  
-  if (fs.existsSync(REPOSITORY_MAP_PATH)) {
-    const existingData = fs.readFileSync(REPOSITORY_MAP_PATH, 'utf-8');
-    repoMap = JSON.parse(existingData);
+// Function to load a saved index and its texts through the index cache
+function loadIndexCached(indexPath: string, version: string = indexVersion(indexPath)): LoadedIndex {
+  return indexCache.get(indexPath, version, () => loadIndex(indexPath));
+}
+
+// Feature extraction pipelines are expensive to create, so each model's is
+// created once per process
+const featureExtractors = new Map<string, Promise<any>>();
+
+function featureExtractor(model: string): Promise<any> {
+  let extractor = featureExtractors.get(model);
+  if (!extractor) {
+    extractor = pipeline('feature-extraction', model);
+    extractor.catch(() => featureExtractors.delete(model));
+    featureExtractors.set(model, extractor);
   }
-  
-  repoMap[repoUrl] = indexPath;
-  fs.writeFileSync(REPOSITORY_MAP_PATH, JSON.stringify(repoMap, null, 2));
+  return extractor;
+}
+
+// Questions differing only in case or whitespace are the same question to
+// the query model, which is uncased and whose tokenizer ignores whitespace
+function normaliseQuery(query: string): string {
+  return collapseWhitespace(query).toLowerCase();
+}
+
+function collapseWhitespace(query: string): string {
+  return query.trim().replace(/\s+/g, ' ');
+}
+
+// The same question against the same version of an index gets the same
+// answer. Only whitespace is ignored: the lexical index tells identifiers
+// by their case (parseElmFile is one, parseelmfile is not), so questions
+// differing in case can get different answers.
+function resultKey(indexPath: string, k: number, hops: number, query: string): string {
+  return `${indexPath}\n${k}\n${hops}\n${collapseWhitespace(query)}`;
 }
 
-// Function to get repository mapping
-function getRepositoryMapping(): Record<string, string> {
-  if (!fs.existsSync(REPOSITORY_MAP_PATH)) {
-    return {};
+async function embedQuery(normalisedQuery: string, model: string): Promise<number[]> {
+  const key = `${model}\n${normalisedQuery}`;
+  const cached = queryEmbeddingCache.lookup(key, '');
+  if (cached !== undefined) {
+    return cached;
   }
-  
-  const data = fs.readFileSync(REPOSITORY_MAP_PATH, 'utf-8');
-  return JSON.parse(data);
+  const extractor = await featureExtractor(model);
+  const queryEmbedding = await extractor(normalisedQuery, { pooling: 'mean', normalize: true });
+  const embedding: number[] = Array.from(queryEmbedding.data);
+  queryEmbeddingCache.set(key, '', embedding, 8 * embedding.length + 2 * key.length);
+  return embedding;
+}
+
+// Function to load FAISS index and search
+// With `hops` > 0 the chunks within that many calls of the matches are
+// returned after them, from the call graph rather than further searches.
+async function searchSimilarTexts(query: string, indexPath: string, k: number = 3, hops: number = 0): Promise<string[]> {
+  return (await searchIndex(query, indexPath, k, hops)).map(hit => hit.text);
+}
+
+// The best matches in one index, best first, with their vector distances
+async function searchIndex(query: string, indexPath: string, k: number = 3, hops: number = 0): Promise<SearchHit[]> {
+  const version = indexVersion(indexPath);
+  const key = resultKey(indexPath, k, hops, query);
+  const cachedResult = resultCache.lookup(key, version);
+  if (cachedResult !== undefined) {
+    return cachedResult;
+  }
+
+  // Load index from file, unless it is cached from an earlier question. A
+  // question that names a symbol of the repository is answered without
+  // running the embedding model.
+  const loaded = loadIndexCached(indexPath, version);
+  const hits = searchLoadedIndex(loaded, query, k, hops, null) ??
+    searchLoadedIndex(loaded, query, k, hops, await embedQuery(normaliseQuery(query), QUERY_EMBEDDING_MODEL)) as SearchHit[];
+  cacheHits(key, version, hits);
+  return hits;
+}
+
+function cacheHits(key: string, version: string, hits: SearchHit[]) {
+  resultCache.set(key, version, hits, hits.reduce((sum, hit) => sum + 2 * (hit.text?.length ?? 0) + 8, 0));
 }
 
 // Function to list available repositories
 function listAvailableRepositories(): string[] {
-  const repoMap = getRepositoryMapping();
-  return Object.keys(repoMap);
+  return Object.keys(catalog.read());
+}
+
+function describeCatalogEntry(entry: CatalogEntry): string {
+  const details = [
+    entry.commit && `commit ${entry.commit.slice(0, 7)}`,
+    entry.chunks !== null && `${entry.chunks} chunks`,
+    entry.embeddingModel ?? entry.embeddingProvider,
+    entry.builtAt && `built ${entry.builtAt}`
+  ].filter(Boolean);
+  return details.length > 0 ? `${entry.repoUrl} (${details.join(', ')})` : entry.repoUrl;
 }
 
 // Function to get index path for a repository
 function getIndexPathForRepository(repoUrl: string): string | null {
-  const repoMap = getRepositoryMapping();
-  return repoMap[repoUrl] || null;
+  return catalog.get(repoUrl)?.indexPath ?? null;
+}
+
+// Searches the indexes of several repositories at once and merges their
+// best k matches. The question is embedded once for all of them, and each
+// index is searched on a worker thread (see searchWorkers.ts), so the
+// search takes about as long as the slowest repository's.
+async function searchRepositories(query: string, repoUrls: string[], k: number = 5): Promise<{ repoUrl: string; hit: SearchHit }[]> {
+  const entries = repoUrls.map(repoUrl => catalog.get(repoUrl)).filter((entry): entry is CatalogEntry => entry !== null);
+  const vector = await embedQuery(normaliseQuery(query), QUERY_EMBEDDING_MODEL);
+  const rankings = await Promise.all(entries.map(async (entry): Promise<SearchHit[]> => {
+    try {
+      const version = indexVersion(entry.indexPath);
+      const key = resultKey(entry.indexPath, k, 0, query);
+      const cachedResult = resultCache.lookup(key, version);
+      if (cachedResult !== undefined) {
+        return cachedResult;
+      }
+      const hits = await searchWorkers.search({ indexPath: entry.indexPath, version, query, k, hops: 0, vector });
+      cacheHits(key, version, hits);
+      return hits;
+    } catch (error) {
+      debug(`Search of ${entry.repoUrl} failed:`, error);
+      return [];
+    }
+  }));
+
+  const found = rankings.flatMap((hits, r) => hits.map(hit => ({ repoUrl: entries[r].repoUrl, hit })));
+  // Distances are only comparable when every match has one; otherwise the
+  // rankings are merged by reciprocal-rank fusion
+  if (found.every(({ hit }) => hit.distance !== null)) {
+    return found.sort((a, b) => (a.hit.distance as number) - (b.hit.distance as number)).slice(0, k);
+  }
+  const ids: number[][] = [];
+  let next = 0;
+  for (const hits of rankings) {
+    ids.push(hits.map(() => next++));
+  }
+  return reciprocalRankFusion(ids, k).map(id => found[id]);
+}
+
+// Function to remove a processed repository: its clone, its index and the
+// stored embeddings no other repository references
+async function removeRepository(repoUrl: string): Promise<boolean> {
+  await EmbeddingStore.releaseEverywhere(EMBEDDING_STORE_PATH, repoUrl);
+  const entry = await catalog.remove(repoUrl);
+  if (!entry) {
+    return false;
+  }
+  indexCache.invalidate(entry.indexPath);
+  searchWorkers.invalidate(entry.indexPath);
+  fs.rmSync(path.dirname(entry.indexPath), { recursive: true, force: true });
+  return true;
 }
 
 // Main function to process repository
@@ -358,40 +710,49 @@ export async function processRepository(config: RepositoryConfig) {
     debug('Starting repository processing...');
     debug('Config:', JSON.stringify(config, null, 2));
     
-    debug('Cloning repository...');
-    const repoPath = await cloneRepository(config.repoUrl, config.storagePath);
-    debug('Repository cloned to:', repoPath);
-    
-    // List all files in the repository
-    debug('Listing all files in repository...');
-    const allFiles = getAllFiles(repoPath);
-    debug(`Found ${allFiles.length} total files in repository`);
-    debug('File types:', [...new Set(allFiles.map(f => path.extname(f)))].join(', '));
-    
-    debug('Extracting text from repository...');
-    const texts = await extractRepositoryText(repoPath);
-    debug(`Extracted ${texts.length} text chunks from repository`);
-    
-    if (texts.length === 0) {
-      debug('No text was extracted. This could mean:');
-      debug('1. No supported files were found');
-      debug('2. Files were empty or contained no extractable content');
-      debug('3. There was an error during chunking');
-      throw new Error('No text was extracted from the repository');
-    }
-    
-    debug('Creating embeddings...');
-    const { embeddings, texts: processedTexts } = await createEmbeddings(texts, config.embeddingConfig);
-    debug(`Created ${embeddings.length} embeddings`);
+    debug('Syncing repository...');
+    const { repoPath, commit } = await syncRepository(config.repoUrl, config.storagePath);
+    debug('Repository synced to:', repoPath);
     
-    debug('Creating FAISS index...');
     const indexPath = path.join(config.storagePath, 'index.faiss');
-    await createFaissIndex(embeddings, processedTexts, indexPath);
-    debug('FAISS index created at:', indexPath);
+    const embeddingConfig = config.embeddingConfig || { provider: 'xenova' };
+    const previous = config.incremental === false ? null : readIndexMetadata(indexPath);
+    const changes = previous && previous.commit && sameEmbeddingModel(previous, embeddingConfig)
+      ? await diffRepository(repoPath, previous.commit, commit)
+      : null;
+
+    const store = EmbeddingStore.open(EMBEDDING_STORE_PATH, embeddingModelId(embeddingConfig));
+
+    let hashes: string[];
+    if (previous && changes) {
+      debug(`Updating index built at ${previous.commit}: ${changes.changed.length} changed, ${changes.removed.length} removed files`);
+      hashes = await updateIndex(repoPath, commit, embeddingConfig, indexPath, previous, changes, store, config.indexOptions);
+    } else {
+      hashes = await buildIndex(repoPath, commit, embeddingConfig, indexPath, store, config.indexOptions);
+    }
+    debug('FAISS index written at:', indexPath);
+    indexCache.invalidate(indexPath);
+    searchWorkers.invalidate(indexPath);
+
+    // The repository now references exactly the chunks of its new index
+    store.retain(config.repoUrl, hashes);
+    const dropped = await store.gc(EMBEDDING_STORE_MAX_GARBAGE);
+    await EmbeddingStore.releaseEverywhere(EMBEDDING_STORE_PATH, config.repoUrl, embeddingModelId(embeddingConfig));
+    debug(`Embedding store: ${store.stats().vectors} vectors after dropping ${dropped} unreferenced`);
     
-    // Save the repository mapping
-    await saveRepositoryMapping(config.repoUrl, indexPath);
-    debug('Repository mapping saved');
+    // Record the new index in the catalog
+    const metadata = readIndexMetadata(indexPath);
+    await catalog.put({
+      repoUrl: config.repoUrl,
+      indexPath,
+      commit,
+      embeddingProvider: embeddingConfig.provider,
+      embeddingModel: embeddingConfig.model || null,
+      indexType: metadata?.indexType ?? null,
+      chunks: hashes.length,
+      builtAt: metadata?.builtAt ?? new Date().toISOString()
+    });
+    debug('Repository catalog updated');
     
     debug('Repository processing completed successfully!');
     return indexPath;
@@ -404,20 +765,137 @@ export async function processRepository(config: RepositoryConfig) {
   }
 }
 
-// Helper function to get all files in a directory recursively
-function getAllFiles(dirPath: string, arrayOfFiles: string[] = []): string[] {
-  const files = fs.readdirSync(dirPath);
+function sameEmbeddingModel(metadata: IndexMetadata, config: EmbeddingProviderConfig): boolean {
+  return metadata.embeddingProvider === config.provider && metadata.embeddingModel === (config.model || null);
+}
 
-  files.forEach(file => {
-    const fullPath = path.join(dirPath, file);
-    if (fs.statSync(fullPath).isDirectory()) {
-      arrayOfFiles = getAllFiles(fullPath, arrayOfFiles);
-    } else {
-      arrayOfFiles.push(fullPath);
+function indexMetadataFor(commit: string, config: EmbeddingProviderConfig, indexType: string, sources: string[], aliases: number): IndexMetadata {
+  return {
+    commit,
+    embeddingProvider: config.provider,
+    embeddingModel: config.model || null,
+    indexType,
+    builtAt: new Date().toISOString(),
+    sources,
+    aliases
+  };
+}
+
+function readIndexAliases(indexPath: string): ChunkAlias[] {
+  const aliasesPath = `${indexPath}.aliases.json`;
+  return fs.existsSync(aliasesPath) ? JSON.parse(fs.readFileSync(aliasesPath, 'utf-8')) : [];
+}
+
+// The lexical index entry of one embedded text, cut from `chunk`
+function lexicalDocument(text: string, chunk: CodeChunk): LexicalDocument {
+  return { text, name: chunk.name || '', symbols: [...(chunk.calls || []), ...(chunk.imports || [])] };
+}
+
+function callGraphDocument(chunk: CodeChunk): CallGraphDocument {
+  return { name: chunk.name || '', calls: chunk.calls || [] };
+}
+
+// Chunks, embeds and indexes the whole repository. Returns the hashes of the
+// indexed texts.
+async function buildIndex(
+  repoPath: string,
+  commit: string,
+  config: EmbeddingProviderConfig,
+  indexPath: string,
+  store?: EmbeddingStore,
+  indexOptions: IndexTypeOptions = {}
+): Promise<string[]> {
+  return writeIndex(repositoryItems(repoPath, config), commit, config, indexPath, store, indexOptions);
+}
+
+// Re-chunks and re-embeds only the files that changed since the index was
+// built, taking the vectors of every other file from the embedding store.
+// Returns the hashes of the indexed texts.
+//
+// Only embedding is incremental: everything else is rewritten through
+// writeIndex, in time linear in the repository. The FAISS index is rebuilt
+// from all the vectors, and retrained for the IVF types. The lexical index,
+// the call graph, the texts and the aliases are rewritten from the stored
+// ones. On one core, rebuilding 100k 384-d vectors takes 0.14s as Flat,
+// 4.7s as IVF316,Flat and 47s as HNSW32,Flat (20s at 50k, where "auto"
+// switches to HNSW). Embedding the same 100k chunks takes hours. Updating in
+// place would need an ID-mapped index, and FAISS cannot remove vectors from
+// HNSW. Texts, postings and call graph edges are also addressed by position,
+// and the type and nlist of the index depend on the number of vectors.
+async function updateIndex(
+  repoPath: string,
+  commit: string,
+  config: EmbeddingProviderConfig,
+  indexPath: string,
+  previous: IndexMetadata,
+  changes: RepositoryChanges,
+  store: EmbeddingStore,
+  indexOptions: IndexTypeOptions = {}
+): Promise<string[]> {
+  const storedTexts = readIndexTexts(indexPath);
+  if (isLegacyIndex(indexPath)) {
+    // Seed the store with the vectors of the old JSON index so that they
+    // are not embedded again
+    const legacy = loadLegacyIndex(indexPath);
+    storedTexts.forEach((text, i) => {
+      store.put(chunkTextHash(text), legacy.embeddings.slice(i * legacy.dimension, (i + 1) * legacy.dimension));
+    });
+  }
+  return writeIndex(changedIndexItems(repoPath, config, indexPath, previous, changes, storedTexts),
+    commit, config, indexPath, store, indexOptions);
+}
+
+// The items of an updated index: the stored texts and aliases of unchanged
+// files, whose vectors come back from the embedding store, then the chunks
+// of the changed files
+async function* changedIndexItems(
+  repoPath: string,
+  config: EmbeddingProviderConfig,
+  indexPath: string,
+  previous: IndexMetadata,
+  changes: RepositoryChanges,
+  storedTexts: string[]
+): AsyncGenerator<IndexItem> {
+  const stale = new Set([...changes.changed, ...changes.removed]);
+  const storedLexical = LexicalIndex.load(indexPath);
+  const storedGraph = CallGraph.load(indexPath);
+  let kept = 0;
+  for (const [i, source] of previous.sources.entries()) {
+    if (stale.has(source)) {
+      continue;
     }
-  });
+    kept += 1;
+    const name = storedLexical?.names[i] ?? '';
+    yield {
+      text: storedTexts[i],
+      source,
+      document: { text: storedTexts[i], name, symbols: storedLexical?.symbols[i] ?? [] },
+      graphDocument: storedGraph?.document(i) ?? { name, calls: [] }
+    };
+  }
+  debug(`Kept ${kept} of ${previous.sources.length} stored vectors`);
+  // Aliases are deduplicated again: one whose representative was in a
+  // changed file becomes a representative itself
+  for (const alias of readIndexAliases(indexPath)) {
+    if (!stale.has(alias.source)) {
+      yield {
+        text: alias.text,
+        source: alias.source,
+        document: { text: alias.text, name: alias.name, symbols: alias.symbols },
+        graphDocument: { name: alias.name, calls: alias.calls }
+      };
+    }
+  }
 
-  return arrayOfFiles;
+  const { files: changedFiles, skipped } = new FileDiscovery(repoPath).filter(changes.changed
+    .map(file => path.join(repoPath, file))
+    .filter(file => SUPPORTED_EXTENSIONS.includes(path.extname(file)) && fs.existsSync(file)));
+  logSkippedFiles(skipped);
+  const chunks = validChunksOf(await chunkFiles(repoPath, changedFiles, { maxTokens: tokenLimitFor(config) }));
+  debug(`Extracted ${chunks.length} text chunks from ${changedFiles.length} changed files`);
+  for (const chunk of chunks) {
+    yield* chunkItems(chunk, path.relative(repoPath, chunk.filePath), config);
+  }
 }
 
 // Create server instance
@@ -459,9 +937,14 @@ server.tool(
     repoUrl: z.string().describe("URL of the GitHub repository"),
     embeddingProvider: z.enum(['openai', 'huggingface', 'xenova']).optional().describe("Embedding provider to use"),
     embeddingModel: z.string().optional().describe("Model to use for embeddings"),
-    tokenLimit: z.number().optional().describe("Maximum number of tokens per chunk")
+    tokenLimit: z.number().optional().describe("Maximum number of tokens per chunk"),
+    batchSize: z.number().optional().describe("Chunks embedded per forward pass with the xenova provider (default 32)"),
+    indexType: z.enum(['auto', 'flat', 'ivf-flat', 'ivf-pq', 'hnsw']).optional().describe("FAISS index type; auto (default) uses exact search for small repositories and HNSW for large ones"),
+    nprobe: z.number().optional().describe("Inverted lists searched per query by the IVF index types (default 16); more raise recall and query time"),
+    efSearch: z.number().optional().describe("Candidates kept during an HNSW search (default 128); more raise recall and query time"),
+    incremental: z.boolean().optional().describe("Only re-index files changed since the last run (default true); false rebuilds from a fresh clone")
   },
-  async ({ repoUrl, embeddingProvider, embeddingModel, tokenLimit }) => {
+  async ({ repoUrl, embeddingProvider, embeddingModel, tokenLimit, batchSize, indexType, nprobe, efSearch, incremental }) => {
     try {
       // Create the default storage directory if it doesn't exist
       if (!fs.existsSync(DEFAULT_STORAGE_PATH)) {
@@ -472,7 +955,9 @@ server.tool(
       const repoName = repoUrl.split('/').pop()?.replace('.git', '') || 'repository';
       const repoStoragePath = path.join(DEFAULT_STORAGE_PATH, repoName);
       
-      if (fs.existsSync(repoStoragePath)) {
+      // The clone and index are kept between runs so that the next run can
+      // update them from the git diff; a full rebuild starts from scratch.
+      if (incremental === false && fs.existsSync(repoStoragePath)) {
         fs.rmSync(repoStoragePath, { recursive: true, force: true });
       }
       fs.mkdirSync(repoStoragePath, { recursive: true });
@@ -480,10 +965,13 @@ server.tool(
       const indexPath = await processRepository({ 
         repoUrl, 
         storagePath: repoStoragePath,
+        incremental,
+        indexOptions: { type: indexType, nprobe, efSearch },
         embeddingConfig: {
           provider: embeddingProvider || 'xenova',
           model: embeddingModel,
-          tokenLimit
+          tokenLimit,
+          batchSize
         }
       });
       
@@ -515,8 +1003,9 @@ server.tool(
   {
     question: z.string().describe("Question about the repository"),
     repoUrl: z.string().describe("URL of the GitHub repository to query"),
+    expand: z.number().optional().describe("Also return the chunks within this many calls of the matches (default 0)"),
   },
-  async ({ question, repoUrl }) => {
+  async ({ question, repoUrl, expand }) => {
     try {
       const indexPath = getIndexPathForRepository(repoUrl);
       
@@ -531,7 +1020,7 @@ server.tool(
         };
       }
       
-      const similarTexts = await searchSimilarTexts(question, indexPath);
+      const similarTexts = await searchSimilarTexts(question, indexPath, 3, expand ?? 0);
       
       return {
         content: [
@@ -554,6 +1043,104 @@ server.tool(
   }
 );
 
+// Add a tool for asking one question of several repositories at once
+server.tool(
+  "search-repositories",
+  "Ask a question about several processed repositories and return the best matches across them",
+  {
+    question: z.string().describe("Question about the repositories"),
+    repoUrls: z.array(z.string()).optional().describe("URLs of the repositories to search (default: all processed repositories)"),
+    k: z.number().optional().describe("Number of matches to return (default 5)"),
+  },
+  async ({ question, repoUrls, k }) => {
+    try {
+      const urls = repoUrls ?? listAvailableRepositories();
+      const missing = urls.filter(repoUrl => !getIndexPathForRepository(repoUrl));
+      if (missing.length === urls.length) {
+        return {
+          content: [
+            {
+              type: "text",
+              text: "No index found for any of the repositories. Please process them first using the process-repository tool.",
+            },
+          ],
+        };
+      }
+
+      const matches = await searchRepositories(question, urls, k ?? 5);
+      const notes = missing.length > 0 ? `\n\nNo index found for: ${missing.join(', ')}` : '';
+      return {
+        content: [
+          {
+            type: "text",
+            text: `Relevant context:\n${matches.map(({ repoUrl, hit }) => `[${repoUrl}]\n${hit.text}`).join('\n\n')}${notes}`,
+          },
+        ],
+      };
+    } catch (error: any) {
+      return {
+        content: [
+          {
+            type: "text",
+            text: `Error searching repositories: ${error.message}`,
+          },
+        ],
+      };
+    }
+  }
+);
+
+// Add a tool to navigate the call graph of a processed repository
+server.tool(
+  "call-graph",
+  "Find where a symbol is defined, what calls it, or what it calls",
+  {
+    repoUrl: z.string().describe("URL of the GitHub repository to query"),
+    symbol: z.string().describe("Name of a function, method or type"),
+    direction: z.enum(['definitions', 'callers', 'callees']).describe("What to look up for the symbol"),
+  },
+  async ({ repoUrl, symbol, direction }) => {
+    try {
+      const indexPath = getIndexPathForRepository(repoUrl);
+      const loaded = indexPath ? loadIndexCached(indexPath) : null;
+      const callGraph = loaded?.callGraph;
+      if (!loaded || !callGraph) {
+        return {
+          content: [
+            {
+              type: "text",
+              text: `No call graph found for repository: ${repoUrl}. Please process the repository (again) using the process-repository tool.`,
+            },
+          ],
+        };
+      }
+
+      const documents = direction === 'definitions' ? callGraph.definitions(symbol)
+        : direction === 'callers' ? callGraph.callersOf(symbol)
+        : callGraph.calleesOf(symbol);
+      return {
+        content: [
+          {
+            type: "text",
+            text: documents.length === 0
+              ? `No ${direction} found for ${symbol}`
+              : `${direction} of ${symbol}:\n${documents.map(doc => loaded.texts[doc]).join('\n\n')}`,
+          },
+        ],
+      };
+    } catch (error: any) {
+      return {
+        content: [
+          {
+            type: "text",
+            text: `Error reading the call graph: ${error.message}`,
+          },
+        ],
+      };
+    }
+  }
+);
+
 // Add a new tool to list available repositories
 server.tool(
   "list-repositories",
@@ -561,7 +1148,7 @@ server.tool(
   {},
   async () => {
     try {
-      const repositories = listAvailableRepositories();
+      const repositories = Object.values(catalog.read());
       
       if (repositories.length === 0) {
         return {
@@ -578,7 +1165,7 @@ server.tool(
         content: [
           {
             type: "text",
-            text: `Available repositories:\n${repositories.join('\n')}`,
+            text: `Available repositories:\n${repositories.map(describeCatalogEntry).join('\n')}`,
           },
         ],
       };
@@ -595,6 +1182,62 @@ server.tool(
   }
 );
 
+// Add a tool to report how well the server's caches are doing
+server.tool(
+  "cache-stats",
+  "Show hit rates and memory use of the index, query embedding and search result caches",
+  {},
+  async () => {
+    const lines = Object.entries({ index: indexCache, queryEmbedding: queryEmbeddingCache, result: resultCache })
+      .map(([name, cache]) => {
+        const stats = cache.stats();
+        const lookups = stats.hits + stats.misses;
+        const hitRate = lookups > 0 ? (100 * stats.hits / lookups).toFixed(1) : '0.0';
+        return `${name}: ${stats.hits}/${lookups} hits (${hitRate}%), ${stats.entries} entries, ` +
+          `${(stats.bytes / (1024 * 1024)).toFixed(1)} of ${(stats.maxBytes / (1024 * 1024)).toFixed(0)} MB, ${stats.evictions} evictions`;
+      });
+    return {
+      content: [
+        {
+          type: "text",
+          text: lines.join('\n'),
+        },
+      ],
+    };
+  }
+);
+
+// Add a tool to remove a processed repository
+server.tool(
+  "remove-repository",
+  "Remove a processed repository and the embeddings only it uses",
+  {
+    repoUrl: z.string().describe("URL of the GitHub repository to remove"),
+  },
+  async ({ repoUrl }) => {
+    try {
+      const removed = await removeRepository(repoUrl);
+      return {
+        content: [
+          {
+            type: "text",
+            text: removed ? `Removed repository: ${repoUrl}` : `No index found for repository: ${repoUrl}`,
+          },
+        ],
+      };
+    } catch (error: any) {
+      return {
+        content: [
+          {
+            type: "text",
+            text: `Error removing repository: ${error.message}`,
+          },
+        ],
+      };
+    }
+  }
+);
+
 async function main() {
   const transport = new StdioServerTransport();
   await server.connect(transport);
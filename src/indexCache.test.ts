@@ -0,0 +1,57 @@
+import { IndexCache } from './indexCache';
+
+describe('IndexCache', () => {
+  const loader = (value: string, bytes: number) => jest.fn(() => ({ value, bytes }));
+
+  it('loads once per version', () => {
+    const cache = new IndexCache<string>(100);
+    const load = loader('a', 10);
+    expect(cache.get('repo-a', 'v1', load)).toBe('a');
+    expect(cache.get('repo-a', 'v1', load)).toBe('a');
+    expect(load).toHaveBeenCalledTimes(1);
+
+    expect(cache.get('repo-a', 'v2', load)).toBe('a');
+    expect(load).toHaveBeenCalledTimes(2);
+    expect(cache.stats()).toMatchObject({ entries: 1, bytes: 10, hits: 1, misses: 2 });
+  });
+
+  it('evicts the least recently used entries to stay within budget', () => {
+    const cache = new IndexCache<string>(100);
+    cache.get('a', 'v', loader('a', 40));
+    cache.get('b', 'v', loader('b', 40));
+    cache.get('a', 'v', loader('a', 40));
+    cache.get('c', 'v', loader('c', 40));
+
+    const reloadA = loader('a', 40);
+    const reloadB = loader('b', 40);
+    cache.get('a', 'v', reloadA);
+    cache.get('b', 'v', reloadB);
+    expect(reloadA).not.toHaveBeenCalled();
+    expect(reloadB).toHaveBeenCalledTimes(1);
+    expect(cache.stats().bytes).toBeLessThanOrEqual(100);
+  });
+
+  it('does not cache values larger than the budget', () => {
+    const cache = new IndexCache<string>(100);
+    cache.get('small', 'v', loader('small', 10));
+    expect(cache.get('huge', 'v', loader('huge', 500))).toBe('huge');
+    expect(cache.stats()).toMatchObject({ entries: 1, bytes: 10 });
+  });
+
+  it('drops invalidated entries', () => {
+    const cache = new IndexCache<string>(100);
+    const load = loader('a', 10);
+    cache.get('a', 'v', load);
+    cache.invalidate('a');
+    cache.get('a', 'v', load);
+    expect(load).toHaveBeenCalledTimes(2);
+  });
+
+  it('looks values up by key and version', () => {
+    const cache = new IndexCache<string[]>(100);
+    cache.set('question', 'index-v1', ['answer'], 12);
+    expect(cache.lookup('question', 'index-v1')).toEqual(['answer']);
+    expect(cache.lookup('question', 'index-v2')).toBeUndefined();
+    expect(cache.stats()).toMatchObject({ hits: 1, misses: 1 });
+  });
+});
@@ -0,0 +1,96 @@
+// Least recently used cache of loaded indexes (and of other values derived
+// from them, such as query results) for the lifetime of the server.
+//
+// Entries are tagged with a version (for an index, the caller derives it from
+// the files' mtimes and sizes), so a value computed from an index that has
+// since been rewritten on disk is recomputed on its next use even when nobody
+// invalidates it explicitly.
+// The sizes of all entries together stay within `maxBytes`; the least
+// recently used entries are evicted to make room. A value larger than the
+// whole budget is returned without being cached.
+
+export interface IndexCacheStats {
+    entries: number;
+    bytes: number;
+    maxBytes: number;
+    hits: number;
+    misses: number;
+    evictions: number;
+}
+
+interface Entry<T> {
+    value: T;
+    version: string;
+    bytes: number;
+}
+
+export class IndexCache<T> {
+    // A Map iterates in insertion order, so re-inserting an entry on every
+    // use keeps the least recently used one first
+    private entries = new Map<string, Entry<T>>();
+    private bytes = 0;
+    private hits = 0;
+    private misses = 0;
+    private evictions = 0;
+
+    constructor(readonly maxBytes: number) {}
+
+    get(key: string, version: string, load: () => { value: T; bytes: number }): T {
+        const cached = this.lookup(key, version);
+        if (cached !== undefined) {
+            return cached;
+        }
+        const loaded = load();
+        this.set(key, version, loaded.value, loaded.bytes);
+        return loaded.value;
+    }
+
+    // The cached value of `key` at `version`, counted as a hit or a miss
+    lookup(key: string, version: string): T | undefined {
+        const entry = this.entries.get(key);
+        if (entry && entry.version === version) {
+            this.hits += 1;
+            this.entries.delete(key);
+            this.entries.set(key, entry);
+            return entry.value;
+        }
+        this.misses += 1;
+        return undefined;
+    }
+
+    set(key: string, version: string, value: T, bytes: number) {
+        this.invalidate(key);
+        if (bytes > this.maxBytes) {
+            return;
+        }
+        for (const [oldest, old] of this.entries) {
+            if (this.bytes + bytes <= this.maxBytes) {
+                break;
+            }
+            this.entries.delete(oldest);
+            this.bytes -= old.bytes;
+            this.evictions += 1;
+        }
+        this.entries.set(key, { value, version, bytes });
+        this.bytes += bytes;
+    }
+
+    invalidate(key: string) {
+        const entry = this.entries.get(key);
+        if (entry) {
+            this.entries.delete(key);
+            this.bytes -= entry.bytes;
+        }
+    }
+
+    stats(): IndexCacheStats {
+        return {
+            entries: this.entries.size,
+            bytes: this.bytes,
+            maxBytes: this.maxBytes,
+            hits: this.hits,
+            misses: this.misses,
+            evictions: this.evictions
+        };
+    }
+}
@@ -0,0 +1,58 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { JsonArrayWriter, VectorSpill, batched } from './indexPipeline';
+
+describe('indexPipeline', () => {
+  let root: string;
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'index-pipeline-'));
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  it('groups items into batches', async () => {
+    async function* numbers() {
+      for (let i = 0; i < 5; i++) {
+        yield i;
+      }
+    }
+    const batches: number[][] = [];
+    for await (const batch of batched(numbers(), 2)) {
+      batches.push(batch);
+    }
+    expect(batches).toEqual([[0, 1], [2, 3], [4]]);
+  });
+
+  it('spills vectors to disk and reads them back', () => {
+    const spill = new VectorSpill(path.join(root, 'vectors.tmp'));
+    spill.append([[1, 2], [3, 4]]);
+    spill.append([[5, 6]]);
+    expect(spill.count).toBe(3);
+    expect(spill.dimension).toBe(2);
+    expect([...spill.blocks()].map(block => Array.from(block))).toEqual([[1, 2, 3, 4, 5, 6]]);
+    expect(Array.from(spill.sample(2))).toEqual([1, 2, 3, 4]);
+    expect(() => spill.append([[1, 2, 3]])).toThrow('dimension');
+    spill.close();
+    expect(fs.existsSync(path.join(root, 'vectors.tmp'))).toBe(false);
+  });
+
+  it('writes a JSON array only on commit', () => {
+    const filePath = path.join(root, 'texts.json');
+    const writer = new JsonArrayWriter(filePath);
+    writer.write('a "quoted" text');
+    writer.write('b');
+    expect(fs.existsSync(filePath)).toBe(false);
+    writer.commit();
+    writer.abort();
+    expect(JSON.parse(fs.readFileSync(filePath, 'utf-8'))).toEqual(['a "quoted" text', 'b']);
+
+    const aborted = new JsonArrayWriter(path.join(root, 'other.json'));
+    aborted.write('c');
+    aborted.abort();
+    expect(fs.readdirSync(root)).toEqual(['texts.json']);
+  });
+});
@@ -0,0 +1,129 @@
+import fs from "fs";
+import { VectorSource } from "./indexTypes";
+
+// Building blocks of the streaming chunk -> embed -> index pipeline.
+//
+// Chunks are pulled from the chunkers one batch at a time, so a parser that
+// runs ahead of the embedding model is held back by the pipe it writes to
+// rather than by ever larger buffers here. Embedded vectors and their texts
+// go straight to files next to the index: vectors to a spill file the FAISS
+// index is built from once their number (and so the index type) is known,
+// texts to the `.texts.json` array. Neither is kept in memory as a whole.
+
+// Rows read back from a spill file at a time
+const BLOCK_ROWS = 4096;
+
+// Groups `items` into arrays of `size`, the last one possibly shorter
+export async function* batched<T>(items: AsyncIterable<T> | Iterable<T>, size: number): AsyncGenerator<T[]> {
+    let batch: T[] = [];
+    for await (const item of items) {
+        batch.push(item);
+        if (batch.length >= size) {
+            yield batch;
+            batch = [];
+        }
+    }
+    if (batch.length > 0) {
+        yield batch;
+    }
+}
+
+// Float32 rows appended to a temporary file and read back in blocks
+export class VectorSpill implements VectorSource {
+    private fd: number;
+    private rows = 0;
+    dimension = 0;
+
+    constructor(readonly filePath: string) {
+        this.fd = fs.openSync(filePath, "w+");
+    }
+
+    get count(): number {
+        return this.rows;
+    }
+
+    append(vectors: number[][]) {
+        if (vectors.length === 0) {
+            return;
+        }
+        if (this.dimension === 0) {
+            this.dimension = vectors[0].length;
+        }
+        const rows = new Float32Array(vectors.length * this.dimension);
+        vectors.forEach((vector, i) => {
+            if (vector.length !== this.dimension) {
+                throw new Error(`Embedding has dimension ${vector.length}, expected ${this.dimension}`);
+            }
+            rows.set(vector, i * this.dimension);
+        });
+        fs.writeSync(this.fd, Buffer.from(rows.buffer), 0, rows.byteLength, this.rows * this.dimension * 4);
+        this.rows += vectors.length;
+    }
+
+    private readRows(start: number, count: number): Float32Array {
+        const rows = new Float32Array(count * this.dimension);
+        fs.readSync(this.fd, Buffer.from(rows.buffer), 0, rows.byteLength, start * this.dimension * 4);
+        return rows;
+    }
+
+    // Every `step`-th row, so the sample spans the whole repository
+    sample(size: number): Float32Array {
+        if (size >= this.rows) {
+            return this.readRows(0, this.rows);
+        }
+        const sample = new Float32Array(size * this.dimension);
+        const step = this.rows / size;
+        for (let i = 0; i < size; i++) {
+            sample.set(this.readRows(Math.floor(i * step), 1), i * this.dimension);
+        }
+        return sample;
+    }
+
+    *blocks(): Generator<Float32Array> {
+        for (let start = 0; start < this.rows; start += BLOCK_ROWS) {
+            yield this.readRows(start, Math.min(BLOCK_ROWS, this.rows - start));
+        }
+    }
+
+    // Closes and deletes the file
+    close() {
+        fs.closeSync(this.fd);
+        fs.rmSync(this.filePath, { force: true });
+    }
+}
+
+// Writes a JSON array one element at a time to a temporary file, which
+// commit() renames into place
+export class JsonArrayWriter {
+    private fd: number;
+    private tmpPath: string;
+    private count = 0;
+    private closed = false;
+
+    constructor(readonly filePath: string) {
+        this.tmpPath = `${filePath}.tmp`;
+        this.fd = fs.openSync(this.tmpPath, "w");
+        fs.writeSync(this.fd, "[");
+    }
+
+    write(value: unknown) {
+        fs.writeSync(this.fd, (this.count > 0 ? "," : "") + JSON.stringify(value));
+        this.count += 1;
+    }
+
+    commit() {
+        fs.writeSync(this.fd, "]");
+        fs.closeSync(this.fd);
+        this.closed = true;
+        fs.renameSync(this.tmpPath, this.filePath);
+    }
+
+    // Drops what was written, unless it was committed
+    abort() {
+        if (!this.closed) {
+            fs.closeSync(this.fd);
+            this.closed = true;
+            fs.rmSync(this.tmpPath, { force: true });
+        }
+    }
+}
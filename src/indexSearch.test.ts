@@ -0,0 +1,46 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import faiss from 'faiss-node';
+import { isLegacyIndex, loadIndex, searchLoadedIndex } from './indexSearch';
+
+describe('indexSearch', () => {
+  let root: string;
+  let indexPath: string;
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'index-search-'));
+    indexPath = path.join(root, 'index.faiss');
+    fs.writeFileSync(`${indexPath}.texts.json`, JSON.stringify(['origin', 'x', 'y']));
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  it('loads and searches an index written in the old JSON format', () => {
+    fs.writeFileSync(indexPath, JSON.stringify({ dimension: 2, embeddings: [0, 0, 1, 0, 0, 1] }));
+    expect(isLegacyIndex(indexPath)).toBe(true);
+    const { value } = loadIndex(indexPath);
+    expect(value.index.ntotal()).toBe(3);
+    expect(value.lexical).toBeNull();
+    expect(value.callGraph).toBeNull();
+    const hits = searchLoadedIndex(value, 'where is x', 1, 0, [0.9, 0.1])!;
+    expect(hits.map(hit => hit.text)).toEqual(['x']);
+    expect(hits[0].distance).toBeCloseTo(0.02);
+  });
+
+  it('loads an index in FAISS binary format', () => {
+    const index = new faiss.IndexFlatL2(2);
+    index.add([0, 0, 1, 0, 0, 1]);
+    index.write(indexPath);
+    expect(isLegacyIndex(indexPath)).toBe(false);
+    const { value } = loadIndex(indexPath);
+    expect(searchLoadedIndex(value, 'where is y', 1, 0, [0.1, 0.9])!.map(hit => hit.text)).toEqual(['y']);
+  });
+
+  it('refuses an index whose texts do not match it', () => {
+    fs.writeFileSync(indexPath, JSON.stringify({ dimension: 2, embeddings: [0, 0, 1, 0] }));
+    expect(() => loadIndex(indexPath)).toThrow('is being rewritten');
+  });
+});
@@ -0,0 +1,164 @@
+import fs from "fs";
+import faiss, { Index } from "faiss-node";
+import { LexicalIndex, codeIdentifiers, reciprocalRankFusion } from "./lexicalIndex";
+import { CallGraph } from "./callGraph";
+
+// Loading a repository index from its files and answering a question from
+// it. Shared by the server, which searches one repository at a time in its
+// own thread, and by the search workers (searchWorkers.ts), which search
+// several repositories at once.
+
+export interface LoadedIndex {
+    index: Index;
+    texts: string[];
+    // Null for indexes built before lexical indexes existed
+    lexical: LexicalIndex | null;
+    // Null for indexes built before call graphs existed
+    callGraph: CallGraph | null;
+}
+
+export interface SearchHit {
+    text: string;
+    // L2 distance to the question, or null for matches found another way
+    // (lexical search or call graph expansion)
+    distance: number | null;
+}
+
+interface SearchResult {
+    distances: number[];
+    labels: number[];
+}
+
+// Most chunks call graph expansion adds to an answer
+const MAX_EXPANDED_CHUNKS = 10;
+
+// Indexes written before the binary format held the vectors as JSON, at
+// about 8KB per 384-d vector against FAISS's 1.5KB, and took 2.2s to parse
+// at 20k vectors where FAISS reads the binary in 9ms. JSON also cannot hold
+// more than about 66k such vectors: the text exceeds V8's longest string.
+export function isLegacyIndex(indexPath: string): boolean {
+    const fd = fs.openSync(indexPath, "r");
+    try {
+        const first = Buffer.alloc(1);
+        fs.readSync(fd, first, 0, 1, 0);
+        return first[0] === "{".charCodeAt(0);
+    } finally {
+        fs.closeSync(fd);
+    }
+}
+
+export function loadLegacyIndex(indexPath: string): { dimension: number; embeddings: number[] } {
+    return JSON.parse(fs.readFileSync(indexPath, "utf-8"));
+}
+
+// Loads a saved FAISS index, in either format
+export function loadFaissIndex(indexPath: string): Index {
+    if (isLegacyIndex(indexPath)) {
+        console.error(`Loading legacy JSON index ${indexPath}; process the repository again to convert it`);
+        const indexData = loadLegacyIndex(indexPath);
+        const index = new faiss.IndexFlatL2(indexData.dimension);
+        index.add(indexData.embeddings);
+        return index;
+    }
+    return Index.read(indexPath);
+}
+
+// Texts of the stored vectors, in index order
+export function readIndexTexts(indexPath: string): string[] {
+    return JSON.parse(fs.readFileSync(`${indexPath}.texts.json`, "utf-8"));
+}
+
+// Changes whenever the index at indexPath is rewritten
+export function indexVersion(indexPath: string): string {
+    return [indexPath, `${indexPath}.texts.json`, LexicalIndex.path(indexPath), CallGraph.path(indexPath)]
+        .filter(file => fs.existsSync(file))
+        .map(file => fs.statSync(file))
+        .map(stat => `${stat.mtimeMs}:${stat.size}`)
+        .join("/");
+}
+
+// Loads an index and everything searched with it, and estimates its size for
+// an IndexCache
+export function loadIndex(indexPath: string): { value: LoadedIndex; bytes: number } {
+    console.error(`Loading index ${indexPath}`);
+    const index = loadFaissIndex(indexPath);
+    const texts = readIndexTexts(indexPath);
+    if (index.ntotal() !== texts.length) {
+        // Between the new texts and the new index of a rewrite
+        throw new Error(`Index ${indexPath} is being rewritten, try again`);
+    }
+    const lexical = LexicalIndex.load(indexPath);
+    const callGraph = CallGraph.load(indexPath);
+    const bytes = index.ntotal() * index.getDimension() * 4 + texts.reduce((sum, text) => sum + 2 * text.length, 0) +
+        (lexical?.bytes ?? 0) + (callGraph?.bytes ?? 0);
+    return { value: { index, texts, lexical, callGraph }, bytes };
+}
+
+// The best k matches of `query` in a loaded index, best first, followed with
+// `hops` > 0 by the chunks within that many calls of them. A question that
+// names a symbol of the repository is answered from the lexical index alone;
+// any other needs the embedding of the question, `vector`, and without it
+// the result is null.
+export function searchLoadedIndex(
+    loaded: LoadedIndex,
+    query: string,
+    k: number,
+    hops: number,
+    vector: number[] | null
+): SearchHit[] | null {
+    const { index, texts, lexical, callGraph } = loaded;
+    const hits = (labels: number[], distances: Map<number, number> = new Map()): SearchHit[] => {
+        const expanded = callGraph && hops > 0 ? callGraph.expand(labels, hops, labels.length + MAX_EXPANDED_CHUNKS) : labels;
+        return expanded.map(label => ({ text: texts[label], distance: distances.get(label) ?? null }));
+    };
+
+    if (lexical && codeIdentifiers(query).some(identifier => lexical.has(identifier))) {
+        const labels = lexical.search(query, k);
+        if (labels.length > 0) {
+            return hits(labels);
+        }
+    }
+    if (vector === null) {
+        return null;
+    }
+
+    try {
+        // With a lexical index both rankings go deeper than k, so that fusion
+        // has candidates to agree on
+        const depth = Math.min(index.ntotal(), lexical ? Math.max(10 * k, 50) : k);
+        const rawResult = index.search(vector, depth);
+        let searchResult: SearchResult;
+
+        // Handle different possible result formats
+        if (Array.isArray(rawResult) && rawResult.length === 2) {
+            // If result is [distances, labels]
+            searchResult = {
+                distances: rawResult[0],
+                labels: rawResult[1]
+            };
+        } else if (rawResult && typeof rawResult === "object") {
+            // If result is an object with distances and labels
+            searchResult = {
+                distances: (rawResult as any).distances || [],
+                labels: (rawResult as any).labels || []
+            };
+        } else {
+            throw new Error("Unexpected search result format");
+        }
+
+        if (!Array.isArray(searchResult.labels) || searchResult.labels.length === 0) {
+            throw new Error("No results found");
+        }
+
+        // Return the most relevant texts, by reciprocal-rank fusion of the
+        // vector and BM25 rankings when there is a lexical index
+        const dense = searchResult.labels.filter(label => label >= 0);
+        const labels = lexical ? reciprocalRankFusion([dense, lexical.search(query, depth)], k) : dense.slice(0, k);
+        const distances = new Map(searchResult.labels.map((label, i) => [label, searchResult.distances[i]]));
+        return hits(labels, distances);
+    } catch (error: unknown) {
+        console.error("Search error:", error);
+        const errorMessage = error instanceof Error ? error.message : "Unknown error";
+        throw new Error(`Search failed: ${errorMessage}`);
+    }
+}
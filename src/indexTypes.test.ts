@@ -0,0 +1,52 @@
+import { buildFaissIndex, factoryDescriptor, readSearchParameters, resolveIndexType, setSearchParameters } from './indexTypes';
+
+describe('indexTypes', () => {
+  it('chooses exact search for small corpora and HNSW for large ones', () => {
+    expect(resolveIndexType({}, 1000)).toBe('flat');
+    expect(resolveIndexType({ type: 'auto' }, 500000)).toBe('hnsw');
+    expect(resolveIndexType({ type: 'ivf-pq' }, 1000)).toBe('ivf-pq');
+  });
+
+  it('builds factory descriptors from the options', () => {
+    expect(factoryDescriptor({ type: 'flat' }, 100, 384)).toBe('Flat');
+    expect(factoryDescriptor({ type: 'ivf-flat' }, 1000000, 384)).toBe('IVF1000,Flat');
+    expect(factoryDescriptor({ type: 'ivf-pq', nlist: 256 }, 1000000, 384)).toBe('IVF256,PQ64');
+    expect(factoryDescriptor({ type: 'hnsw', hnswM: 16 }, 1000000, 384)).toBe('HNSW16,Flat');
+  });
+
+  it('rejects a PQ size that does not divide the dimension', () => {
+    expect(() => factoryDescriptor({ type: 'ivf-pq', pqM: 7 }, 1000000, 384)).toThrow(/divide/);
+  });
+
+  describe('search parameters', () => {
+    const dimension = 8;
+    const vectors = Float32Array.from({ length: 2000 * dimension }, (_, i) => Math.sin(i * 12.9898) * 43758.5453 % 1);
+    const queries = Array.from({ length: 20 }, (_, q) => Array.from(vectors.subarray(q * 97 * dimension, (q * 97 + 1) * dimension)));
+    const exact = buildFaissIndex(vectors, dimension, { type: 'flat' }).index;
+    const labels = (index: ReturnType<typeof buildFaissIndex>['index']) => queries.map(query => index.search(query, 10).labels);
+
+    it('searches every list of an IVF index when nprobe is nlist', () => {
+      const { index, descriptor } = buildFaissIndex(vectors, dimension, { type: 'ivf-flat', nlist: 16, nprobe: 16 });
+      expect(descriptor).toBe('IVF16,Flat');
+      expect(labels(index)).toEqual(labels(exact));
+    });
+
+    it('writes efSearch into HNSW indexes', () => {
+      const { index } = buildFaissIndex(vectors, dimension, { type: 'hnsw', efSearch: 2000 });
+      expect(labels(index)).toEqual(labels(exact));
+      expect(readSearchParameters(index.toBuffer())).toEqual({ efSearch: 2000 });
+      expect(setSearchParameters(index.toBuffer(), { efSearch: 64 })).toBe(true);
+      expect(setSearchParameters(exact.toBuffer(), { efSearch: 64 })).toBe(false);
+    });
+
+    it('refuses to patch an index laid out differently', () => {
+      const { index } = buildFaissIndex(vectors, dimension, { type: 'ivf-flat', nlist: 16, nprobe: 4 });
+      const buffer = index.toBuffer();
+      expect(readSearchParameters(buffer)).toEqual({ nprobe: 4 });
+      // The fourcc of the quantizer, which follows nprobe
+      buffer.write('??', 37 + 16, 'latin1');
+      expect(() => setSearchParameters(buffer, { nprobe: 2 })).toThrow('Unexpected layout');
+      expect(readSearchParameters(exact.toBuffer())).toBeNull();
+    });
+  });
+});
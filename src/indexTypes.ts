@@ -0,0 +1,244 @@
+import { Index } from "faiss-node";
+
+// FAISS index types for the repository indexes.
+//
+// Flat search is exact but costs O(n) per query. For large repositories an
+// approximate index answers in roughly O(sqrt(n)) (IVF) or O(log n) (HNSW)
+// at some loss of recall. The type is fixed when the index is built and
+// recorded as a FAISS factory descriptor in the index metadata.
+//
+// The search-time knobs, nprobe for IVF and efSearch for HNSW, trade query
+// time for recall. FAISS's defaults of 1 and 16 cost a lot of recall: on
+// 100k clustered 384-d vectors recall@10 was 0.78 at nprobe 1 (1.000 at 16,
+// 0.9ms a query) and 0.74 at efSearch 16 (0.96 at 128, 0.3ms). faiss-node
+// exposes no ParameterSpace, but FAISS saves both knobs with the index, so
+// they are written into the serialised index after it is built and every
+// later read of the index file uses them. That relies on the layout written
+// by the FAISS faiss-node bundles, so package.json pins faiss-node, and the
+// index read back is checked to hold what was written.
+
+export type IndexType = "auto" | "flat" | "ivf-flat" | "ivf-pq" | "hnsw";
+
+export const INDEX_TYPES: IndexType[] = ["auto", "flat", "ivf-flat", "ivf-pq", "hnsw"];
+
+export interface IndexTypeOptions {
+    type?: IndexType;
+    // Inverted lists for the IVF types; defaults to about sqrt(n)
+    nlist?: number;
+    // Sub-quantizers for IVF-PQ; must divide the dimension
+    pqM?: number;
+    // Links per node for HNSW
+    hnswM?: number;
+    // Inverted lists searched per query by the IVF types
+    nprobe?: number;
+    // Candidates kept during an HNSW search; below the number of results
+    // asked for, FAISS uses that number instead
+    efSearch?: number;
+    // Vectors used to train the IVF types; defaults to 50 per list
+    trainSample?: number;
+}
+
+// Below this many vectors exact search is fast enough
+const AUTO_FLAT_LIMIT = 50000;
+const DEFAULT_HNSW_M = 32;
+const DEFAULT_NPROBE = 16;
+const DEFAULT_EF_SEARCH = 128;
+
+// Resolves "auto" and the defaults to a concrete type for n vectors
+export function resolveIndexType(options: IndexTypeOptions, n: number): IndexType {
+    const type = options.type ?? "auto";
+    if (type !== "auto") {
+        return type;
+    }
+    return n < AUTO_FLAT_LIMIT ? "flat" : "hnsw";
+}
+
+function defaultNlist(n: number): number {
+    return Math.max(1, Math.min(65536, Math.round(Math.sqrt(n))));
+}
+
+function defaultPqM(dimension: number): number {
+    return [64, 48, 32, 16, 8, 4, 2, 1].find(m => dimension % m === 0 && dimension / m >= 4) ?? 1;
+}
+
+// The FAISS factory descriptor of the index to build for n vectors
+export function factoryDescriptor(options: IndexTypeOptions, n: number, dimension: number): string {
+    const nlist = options.nlist ?? defaultNlist(n);
+    switch (resolveIndexType(options, n)) {
+        case "ivf-flat":
+            return `IVF${nlist},Flat`;
+        case "ivf-pq": {
+            const m = options.pqM ?? defaultPqM(dimension);
+            if (dimension % m !== 0) {
+                throw new Error(`IVF-PQ needs pqM to divide the dimension ${dimension}, got ${m}`);
+            }
+            return `IVF${nlist},PQ${m}`;
+        }
+        case "hnsw":
+            return `HNSW${options.hnswM ?? DEFAULT_HNSW_M},Flat`;
+        case "flat":
+        default:
+            return "Flat";
+    }
+}
+
+export interface SearchParameters {
+    nprobe?: number;
+    efSearch?: number;
+}
+
+// Where the search parameter of a FAISS index serialised by write_index is:
+// nprobe for an IVF index, efSearch for an HNSW index, null for other types.
+// The layout is FAISS's: a header (fourcc, d, ntotal, two unused words,
+// is_trained, metric type and, for metrics beyond L2 and inner product, its
+// argument); an IVF index then has nlist and nprobe, and an HNSW index five
+// vectors (a size_t length, then the items) followed by entry_point,
+// max_level, efConstruction, efSearch and an unused word. Both then write
+// their quantizer or storage index, whose fourcc starts the same way; a
+// buffer that does not have it there is laid out differently, and throws.
+function searchParameterField(buffer: Buffer): { name: "nprobe" | "efSearch"; offset: number } | null {
+    const fourcc = buffer.toString("latin1", 0, 4);
+    const header = 37 + (buffer.readInt32LE(33) > 1 ? 4 : 0);
+    let field: { name: "nprobe" | "efSearch"; offset: number };
+    let next: number;
+    if (fourcc.startsWith("Iw")) {
+        field = { name: "nprobe", offset: header + 8 };
+        next = header + 16;
+    } else if (fourcc.startsWith("IHN")) {
+        let offset = header;
+        for (const itemBytes of [8, 4, 4, 8, 4]) {
+            if (offset + 8 > buffer.length) {
+                break;
+            }
+            offset += 8 + itemBytes * Number(buffer.readBigUInt64LE(offset));
+        }
+        field = { name: "efSearch", offset: offset + 12 };
+        next = offset + 20;
+    } else {
+        return null;
+    }
+    if (next + 4 > buffer.length || buffer.toString("latin1", next, next + 2) !== "Ix") {
+        throw new Error(`Unexpected layout of a serialised ${fourcc} index`);
+    }
+    return field;
+}
+
+// The search parameters saved in a serialised IVF or HNSW index, or null for
+// other types
+export function readSearchParameters(buffer: Buffer): SearchParameters | null {
+    const field = searchParameterField(buffer);
+    if (!field) {
+        return null;
+    }
+    return field.name === "nprobe"
+        ? { nprobe: Number(buffer.readBigUInt64LE(field.offset)) }
+        : { efSearch: buffer.readInt32LE(field.offset) };
+}
+
+// Writes `parameters` into `buffer`, a serialised FAISS index, and returns
+// whether it is an IVF or HNSW index that has them
+export function setSearchParameters(buffer: Buffer, parameters: SearchParameters): boolean {
+    const field = searchParameterField(buffer);
+    if (!field) {
+        return false;
+    }
+    if (field.name === "nprobe" && parameters.nprobe !== undefined) {
+        const nlist = Number(buffer.readBigUInt64LE(field.offset - 8));
+        buffer.writeBigUInt64LE(BigInt(Math.max(1, Math.min(nlist, parameters.nprobe))), field.offset);
+    }
+    if (field.name === "efSearch" && parameters.efSearch !== undefined) {
+        buffer.writeInt32LE(Math.max(1, parameters.efSearch), field.offset);
+    }
+    return true;
+}
+
+// `index` with `parameters`, by a round trip through its serialised form.
+// The index read back must hold the parameters written and every vector;
+// if it does not, or the layout is not the one expected, FAISS's defaults
+// are kept and a warning logged.
+export function withSearchParameters(index: Index, parameters: SearchParameters): Index {
+    try {
+        const buffer = index.toBuffer();
+        if (!setSearchParameters(buffer, parameters)) {
+            return index;
+        }
+        const patched = Index.fromBuffer(buffer);
+        const expected = JSON.stringify(readSearchParameters(buffer));
+        const actual = JSON.stringify(readSearchParameters(patched.toBuffer()));
+        if (actual !== expected || patched.ntotal() !== index.ntotal()) {
+            throw new Error(`read back ${actual} with ${patched.ntotal()} vectors, wrote ${expected} with ${index.ntotal()}`);
+        }
+        return patched;
+    } catch (error) {
+        console.error(`Could not set search parameters ${JSON.stringify(parameters)}, keeping FAISS's defaults:`,
+            error instanceof Error ? error.message : error);
+        return index;
+    }
+}
+
+export interface VectorSource {
+    readonly count: number;
+    readonly dimension: number;
+    // `size` rows spread over the whole source
+    sample(size: number): Float32Array;
+    // Every row, a block of rows at a time
+    blocks(): Iterable<Float32Array>;
+}
+
+// Every `step`-th vector, so the sample spans the whole repository
+function trainingSample(vectors: Float32Array, dimension: number, size: number): Float32Array {
+    const n = vectors.length / dimension;
+    if (size >= n) {
+        return vectors;
+    }
+    const sample = new Float32Array(size * dimension);
+    const step = n / size;
+    for (let i = 0; i < size; i++) {
+        const row = Math.floor(i * step);
+        sample.set(vectors.subarray(row * dimension, (row + 1) * dimension), i * dimension);
+    }
+    return sample;
+}
+
+// Builds, trains if needed, and fills an index with `vectors`, n rows of
+// `dimension` floats
+export function buildFaissIndex(
+    vectors: Float32Array,
+    dimension: number,
+    options: IndexTypeOptions = {}
+): { index: Index; descriptor: string } {
+    return buildFaissIndexFrom({
+        count: vectors.length / dimension,
+        dimension,
+        sample: size => trainingSample(vectors, dimension, size),
+        blocks: () => [vectors]
+    }, options);
+}
+
+// As buildFaissIndex, adding the vectors of `source` a block at a time
+export function buildFaissIndexFrom(source: VectorSource, options: IndexTypeOptions = {}): { index: Index; descriptor: string } {
+    const n = source.count;
+    let descriptor = factoryDescriptor(options, n, source.dimension);
+    const nlist = options.nlist ?? defaultNlist(n);
+    // Training needs at least one vector per list (and 256 per PQ centroid
+    // set); small corpora fall back to an exact index
+    if (descriptor.startsWith("IVF") && n < Math.max(nlist, descriptor.includes("PQ") ? 256 : 0)) {
+        descriptor = "Flat";
+    }
+    const index = Index.fromFactory(source.dimension, descriptor);
+    if (!index.isTrained()) {
+        const size = Math.min(n, options.trainSample ?? Math.max(50 * nlist, 10000));
+        index.train(Array.from(source.sample(size)));
+    }
+    for (const block of source.blocks()) {
+        index.add(Array.from(block));
+    }
+    if (descriptor === "Flat") {
+        return { index, descriptor };
+    }
+    const parameters = {
+        nprobe: options.nprobe ?? DEFAULT_NPROBE,
+        efSearch: options.efSearch ?? DEFAULT_EF_SEARCH
+    };
+    return { index: withSearchParameters(index, parameters), descriptor };
+}
@@ -0,0 +1,67 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { LexicalIndex, codeIdentifiers, reciprocalRankFusion, tokenizeCode } from './lexicalIndex';
+
+describe('lexicalIndex', () => {
+  it('splits camelCase and snake_case identifiers', () => {
+    expect(tokenizeCode('parseElmFile(x)')).toEqual(['parseelmfile', 'parse', 'elm', 'file']);
+    expect(tokenizeCode('def parse_elm_file(path):')).toEqual(['parse_elm_file', 'parse', 'elm', 'file', 'path']);
+    expect(codeIdentifiers('where is parse_elm_file used')).toEqual(['parse_elm_file']);
+  });
+
+  it('ranks the chunk named by the query first', () => {
+    const index = LexicalIndex.build([
+      { text: 'def scan(source):\n    return []', name: 'scan', symbols: [] },
+      { text: 'def parse_elm_file(path):\n    return scan(read(path))', name: 'parse_elm_file', symbols: ['scan', 'read'] },
+      { text: 'def main():\n    parse_elm_file(sys.argv[1])', name: 'main', symbols: ['parse_elm_file'] },
+    ]);
+    expect(index.search('parse_elm_file', 3)).toEqual([1, 2]);
+    expect(index.search('where is scan used', 1)).toEqual([0]);
+    expect(index.search('unrelated words', 3)).toEqual([]);
+  });
+
+  const documents = [
+    { text: 'def scan(source):\n    return []', name: 'scan', symbols: [] },
+    { text: 'def read_elm_file(path):\n    return open(path).read()', name: 'read_elm_file', symbols: ['open'] },
+    { text: 'def main():\n    scan(read_elm_file(sys.argv[1]))', name: 'main', symbols: ['scan', 'read_elm_file'] },
+  ];
+  const alias = { text: 'def load_elm_source(path):\n    return open(path).read()', name: 'load_elm_source', symbols: ['open'] };
+
+  // Writes the documents with the alias between the second and the third
+  const write = (indexPath: string, runPostings?: number) => {
+    const writer = LexicalIndex.writer(indexPath, runPostings);
+    writer.add(documents[0]);
+    writer.add(documents[1]);
+    writer.addAlias(alias, 1);
+    writer.add(documents[2]);
+    writer.commit();
+  };
+
+  it('finds an aliased chunk by its own name, as the chunk it repeats', () => {
+    const index = LexicalIndex.build(documents, [{ document: alias, of: 1 }]);
+    expect(index.size).toBe(3);
+    expect(index.has('load_elm_source')).toBe(true);
+    expect(index.search('load_elm_source', 1)).toEqual([1]);
+    expect(index.search('where is read_elm_file used', 3)).toEqual([1, 2]);
+  });
+
+  it('merges postings written in several runs into the same file', () => {
+    const root = fs.mkdtempSync(path.join(os.tmpdir(), 'lexical-index-'));
+    try {
+      write(path.join(root, 'one'));
+      write(path.join(root, 'many'), 2);
+      const one = fs.readFileSync(LexicalIndex.path(path.join(root, 'one')), 'utf-8');
+      expect(fs.readFileSync(LexicalIndex.path(path.join(root, 'many')), 'utf-8')).toBe(one);
+      expect(JSON.parse(one).postings.scan).toEqual([0, 4, 2, 2]);
+      expect(fs.readdirSync(root).sort()).toEqual(['many.bm25.json', 'one.bm25.json']);
+      expect(LexicalIndex.load(path.join(root, 'many'))!.search('load_elm_source', 1)).toEqual([1]);
+    } finally {
+      fs.rmSync(root, { recursive: true, force: true });
+    }
+  });
+
+  it('fuses rankings by reciprocal rank', () => {
+    expect(reciprocalRankFusion([[1, 2, 3], [2, 4, 5]], 2)).toEqual([2, 1]);
+  });
+});
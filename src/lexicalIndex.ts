@@ -0,0 +1,481 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+
+// BM25 inverted index over the chunks of a repository index, stored next to
+// it as `${indexPath}.bm25.json`. Document i is the i-th vector of the FAISS
+// index, so lexical and vector results can be fused by position.
+//
+// The tokenizer is identifier aware: `parseElmFile` and `parse_elm_file`
+// both index as the whole identifier plus its parts (parse, elm, file), so a
+// question can name a symbol exactly or describe it in words. Each chunk's
+// own name is indexed with extra weight, and the names it calls and imports
+// once more, since those come straight from the chunkers' ASTs.
+//
+// A chunk stored as an alias of an indexed one (see chunkDedup.ts) is
+// indexed as an extra document after the indexed ones, and `aliasOf` gives
+// the document it repeats; a match on the alias is a match on that
+// document, so a duplicate under another name is still found by its name.
+//
+// An index is written by a LexicalIndexWriter, which keeps the postings of
+// a repository of any size on disk until it merges them into the file.
+
+const FORMAT_VERSION = 2;
+const K1 = 1.2;
+const B = 0.75;
+// Times a chunk's own name counts towards its term frequencies
+const NAME_BOOST = 3;
+// Constant of reciprocal-rank fusion; 60 is the value from the original paper
+const RRF_K = 60;
+// Postings (doc, tf pairs) a writer holds before it writes them to a run
+// file, about 25MB of memory
+const RUN_POSTINGS = 1 << 20;
+// Int32s read from a run file at a time while runs are merged
+const RUN_BLOCK_INTS = 1 << 16;
+// Characters of the index file buffered before they are written
+const WRITE_CHARS = 1 << 16;
+
+const IDENTIFIER = /[A-Za-z_$][A-Za-z0-9_$]*/g;
+const WORD_BOUNDARY = /[_$]+|(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])/;
+
+const STOP_WORDS = new Set([
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "in", "is", "it", "of",
+    "on", "or", "the", "to", "what", "when", "where", "which", "who", "why", "with", "used", "use", "uses",
+    "def", "return", "import", "const", "let", "var", "function", "class", "if", "else", "self", "this", "new"
+]);
+
+export function tokenizeCode(text: string): string[] {
+    const tokens: string[] = [];
+    for (const [word] of text.matchAll(IDENTIFIER)) {
+        const whole = word.toLowerCase();
+        if (whole.length > 1 && !STOP_WORDS.has(whole)) {
+            tokens.push(whole);
+        }
+        const parts = word.split(WORD_BOUNDARY);
+        if (parts.length > 1) {
+            for (const part of parts) {
+                const lower = part.toLowerCase();
+                if (lower.length > 1 && lower !== whole && !STOP_WORDS.has(lower)) {
+                    tokens.push(lower);
+                }
+            }
+        }
+    }
+    return tokens;
+}
+
+// Identifiers in a query that are written like code rather than prose
+export function codeIdentifiers(query: string): string[] {
+    return [...query.matchAll(IDENTIFIER)]
+        .map(([word]) => word)
+        .filter(word => word.split(WORD_BOUNDARY).length > 1)
+        .map(word => word.toLowerCase());
+}
+
+export interface LexicalDocument {
+    text: string;
+    name: string;
+    // Called and imported names
+    symbols: string[];
+}
+
+interface StoredLexicalIndex {
+    version: number;
+    names: string[];
+    symbols: string[][];
+    lengths: number[];
+    // term -> [doc, tf, doc, tf, ...]
+    postings: Record<string, number[]>;
+    // Missing in version 1, which had no aliases
+    aliasOf?: number[];
+}
+
+// Term frequencies of a document, with its name counted NAME_BOOST times,
+// and its length in tokens
+function termFrequencies(document: LexicalDocument): { frequencies: Map<string, number>; length: number } {
+    const tokens = [...tokenizeCode(document.text), ...tokenizeCode(document.symbols.join(" "))];
+    const nameTokens = tokenizeCode(document.name);
+    for (let i = 0; i < NAME_BOOST; i++) {
+        tokens.push(...nameTokens);
+    }
+    const frequencies = new Map<string, number>();
+    for (const token of tokens) {
+        frequencies.set(token, (frequencies.get(token) ?? 0) + 1);
+    }
+    return { frequencies, length: tokens.length };
+}
+
+export class LexicalIndex {
+    private averageLength: number;
+
+    private constructor(
+        readonly names: string[],
+        readonly symbols: string[][],
+        private lengths: number[],
+        private postings: Map<string, number[]>,
+        readonly aliasOf: number[] = []
+    ) {
+        this.averageLength = lengths.reduce((sum, length) => sum + length, 0) / Math.max(1, lengths.length);
+    }
+
+    // An index of `documents`, written in a temporary directory and loaded
+    static build(documents: LexicalDocument[], aliases: { document: LexicalDocument; of: number }[] = []): LexicalIndex {
+        const dir = fs.mkdtempSync(path.join(os.tmpdir(), "lexical-index-"));
+        try {
+            const indexPath = path.join(dir, "index");
+            const writer = LexicalIndex.writer(indexPath);
+            documents.forEach(document => writer.add(document));
+            aliases.forEach(alias => writer.addAlias(alias.document, alias.of));
+            writer.commit();
+            return LexicalIndex.load(indexPath)!;
+        } finally {
+            fs.rmSync(dir, { recursive: true, force: true });
+        }
+    }
+
+    // Writes the lexical index of the index at indexPath from documents
+    // added one at a time
+    static writer(indexPath: string, runPostings = RUN_POSTINGS): LexicalIndexWriter {
+        return new LexicalIndexWriter(indexPath, runPostings);
+    }
+
+    static path(indexPath: string): string {
+        return `${indexPath}.bm25.json`;
+    }
+
+    // The lexical index stored with the index at indexPath, or null if it has
+    // none (it was built before lexical indexes existed)
+    static load(indexPath: string): LexicalIndex | null {
+        const lexicalPath = LexicalIndex.path(indexPath);
+        if (!fs.existsSync(lexicalPath)) {
+            return null;
+        }
+        const stored: StoredLexicalIndex = JSON.parse(fs.readFileSync(lexicalPath, "utf-8"));
+        if (stored.version !== FORMAT_VERSION && stored.version !== 1) {
+            return null;
+        }
+        return new LexicalIndex(stored.names, stored.symbols, stored.lengths, new Map(Object.entries(stored.postings)),
+            stored.aliasOf ?? []);
+    }
+
+    // Number of documents, not counting aliases
+    get size(): number {
+        return this.lengths.length - this.aliasOf.length;
+    }
+
+    has(term: string): boolean {
+        return this.postings.has(term);
+    }
+
+    // Rough memory footprint, for cache budgets
+    get bytes(): number {
+        let bytes = 8 * this.lengths.length + 8 * this.aliasOf.length;
+        for (const [term, list] of this.postings) {
+            bytes += 2 * term.length + 8 * list.length;
+        }
+        return bytes;
+    }
+
+    // The best k documents for a query by BM25, best first. A document
+    // scores as its best-scoring alias if that beats its own score.
+    search(query: string, k: number): number[] {
+        const scores = new Map<number, number>();
+        const n = this.lengths.length;
+        for (const term of new Set(tokenizeCode(query))) {
+            const list = this.postings.get(term);
+            if (!list) {
+                continue;
+            }
+            const documentFrequency = list.length / 2;
+            const idf = Math.log(1 + (n - documentFrequency + 0.5) / (documentFrequency + 0.5));
+            for (let i = 0; i < list.length; i += 2) {
+                const doc = list[i];
+                const tf = list[i + 1];
+                const norm = tf + K1 * (1 - B + B * this.lengths[doc] / this.averageLength);
+                scores.set(doc, (scores.get(doc) ?? 0) + idf * tf * (K1 + 1) / norm);
+            }
+        }
+        const size = this.size;
+        for (const [doc, score] of scores) {
+            if (doc >= size) {
+                scores.delete(doc);
+                const of = this.aliasOf[doc - size];
+                scores.set(of, Math.max(scores.get(of) ?? 0, score));
+            }
+        }
+        return [...scores.entries()]
+            .sort((a, b) => b[1] - a[1] || a[0] - b[0])
+            .slice(0, k)
+            .map(([doc]) => doc);
+    }
+}
+
+// The documents or the aliases of a LexicalIndexWriter. Names and symbols
+// are written to fragments of JSON arrays as they come, and postings, once
+// there are `runPostings` of them, to a run file of records sorted by term:
+// the term's length in UTF-8 bytes, the term padded to whole int32s, the
+// number of postings, then that many doc, tf pairs.
+class WriterPart {
+    count = 0;
+    readonly lengths: number[] = [];
+    readonly runs: string[] = [];
+    private postings = new Map<string, number[]>();
+    private buffered = 0;
+    private namesFd: number;
+    private symbolsFd: number;
+
+    constructor(private basePath: string, private runPostings: number) {
+        this.namesFd = fs.openSync(this.namesPath, "w");
+        this.symbolsFd = fs.openSync(this.symbolsPath, "w");
+    }
+
+    get namesPath(): string {
+        return `${this.basePath}.names`;
+    }
+
+    get symbolsPath(): string {
+        return `${this.basePath}.symbols`;
+    }
+
+    add(document: LexicalDocument) {
+        const { frequencies, length } = termFrequencies(document);
+        const separator = this.count > 0 ? "," : "";
+        fs.writeSync(this.namesFd, separator + JSON.stringify(document.name));
+        fs.writeSync(this.symbolsFd, separator + JSON.stringify(document.symbols));
+        for (const [term, tf] of frequencies) {
+            let list = this.postings.get(term);
+            if (!list) {
+                list = [];
+                this.postings.set(term, list);
+            }
+            list.push(this.count, tf);
+        }
+        this.lengths.push(length);
+        this.count += 1;
+        this.buffered += frequencies.size;
+        if (this.buffered >= this.runPostings) {
+            this.flush();
+        }
+    }
+
+    // Writes the postings held in memory to a new run file
+    flush() {
+        if (this.postings.size === 0) {
+            return;
+        }
+        const terms = [...this.postings.keys()].sort();
+        const encoded = terms.map(term => Buffer.from(term, "utf-8"));
+        const ints = encoded.reduce((sum, bytes) => sum + 2 + Math.ceil(bytes.length / 4), 0) + 2 * this.buffered;
+        const record = new Int32Array(ints);
+        const bytes = Buffer.from(record.buffer);
+        let offset = 0;
+        terms.forEach((term, i) => {
+            const list = this.postings.get(term)!;
+            record[offset++] = encoded[i].length;
+            encoded[i].copy(bytes, offset * 4);
+            offset += Math.ceil(encoded[i].length / 4);
+            record[offset++] = list.length / 2;
+            record.set(list, offset);
+            offset += list.length;
+        });
+        const runPath = `${this.basePath}.run${this.runs.length}`;
+        fs.writeFileSync(runPath, bytes);
+        this.runs.push(runPath);
+        this.postings.clear();
+        this.buffered = 0;
+    }
+
+    close() {
+        fs.closeSync(this.namesFd);
+        fs.closeSync(this.symbolsFd);
+    }
+
+    remove() {
+        for (const file of [this.namesPath, this.symbolsPath, ...this.runs]) {
+            fs.rmSync(file, { force: true });
+        }
+    }
+}
+
+// Reads the records of a run file (see WriterPart) in order
+class RunReader {
+    private fd: number;
+    private size: number;
+    private block = new Int32Array(RUN_BLOCK_INTS);
+    private position = 0;
+    private available = 0;
+    private offset = 0;
+    // Term of the next record, null at the end
+    term: string | null = null;
+
+    constructor(filePath: string) {
+        this.fd = fs.openSync(filePath, "r");
+        this.size = fs.fstatSync(this.fd).size;
+        this.next();
+    }
+
+    private int(): number {
+        if (this.position === this.available) {
+            const bytes = fs.readSync(this.fd, Buffer.from(this.block.buffer), 0, this.block.byteLength, this.offset);
+            if (bytes < 4) {
+                throw new Error("Truncated lexical index run");
+            }
+            this.offset += bytes;
+            this.available = bytes >> 2;
+            this.position = 0;
+        }
+        return this.block[this.position++];
+    }
+
+    private next() {
+        if (this.offset === this.size && this.position === this.available) {
+            this.term = null;
+            return;
+        }
+        const length = this.int();
+        const term = new Int32Array(Math.ceil(length / 4));
+        for (let i = 0; i < term.length; i++) {
+            term[i] = this.int();
+        }
+        this.term = Buffer.from(term.buffer).toString("utf-8", 0, length);
+    }
+
+    // The doc, tf pairs of the current record, moving on to the next
+    postings(): Int32Array {
+        const pairs = new Int32Array(2 * this.int());
+        for (let i = 0; i < pairs.length; i++) {
+            pairs[i] = this.int();
+        }
+        this.next();
+        return pairs;
+    }
+
+    close() {
+        fs.closeSync(this.fd);
+    }
+}
+
+// Writes the lexical index of a repository index from documents added one at
+// a time. Only the document lengths and a run's worth of postings are held
+// in memory; everything else waits in files next to the index until
+// commit() merges it into the index file, term by term in sorted order.
+// Aliases may be added between documents; `of` is the document they repeat.
+export class LexicalIndexWriter {
+    private documents: WriterPart;
+    private aliases: WriterPart;
+    private aliasOf: number[] = [];
+    private tmpPath: string;
+    private closed = false;
+
+    constructor(readonly indexPath: string, runPostings = RUN_POSTINGS) {
+        this.tmpPath = `${LexicalIndex.path(indexPath)}.tmp`;
+        this.documents = new WriterPart(`${this.tmpPath}.documents`, runPostings);
+        this.aliases = new WriterPart(`${this.tmpPath}.aliases`, runPostings);
+    }
+
+    add(document: LexicalDocument) {
+        this.documents.add(document);
+    }
+
+    addAlias(document: LexicalDocument, of: number) {
+        this.aliases.add(document);
+        this.aliasOf.push(of);
+    }
+
+    // Merges everything written into the index file and renames it into place
+    commit() {
+        const parts = [this.documents, this.aliases];
+        parts.forEach(part => {
+            part.flush();
+            part.close();
+        });
+        this.closed = true;
+        const fd = fs.openSync(this.tmpPath, "w");
+        let pending = "";
+        const write = (text: string) => {
+            pending += text;
+            if (pending.length >= WRITE_CHARS) {
+                fs.writeSync(fd, pending);
+                pending = "";
+            }
+        };
+        const array = (fragments: string[]) => {
+            write("[");
+            fragments.filter(fragment => fs.statSync(fragment).size > 0).forEach((fragment, i) => {
+                write(i > 0 ? "," : "");
+                fs.writeSync(fd, pending);
+                pending = "";
+                fs.writeSync(fd, fs.readFileSync(fragment));
+            });
+            write("]");
+        };
+        // Aliases are numbered after the documents
+        const readers = parts.flatMap((part, p) =>
+            part.runs.map(run => ({ reader: new RunReader(run), offset: p === 0 ? 0 : this.documents.count })));
+        try {
+            write(`{"version":${FORMAT_VERSION},"names":`);
+            array(parts.map(part => part.namesPath));
+            write(`,"symbols":`);
+            array(parts.map(part => part.symbolsPath));
+            write(`,"lengths":${JSON.stringify([...this.documents.lengths, ...this.aliases.lengths])},"postings":{`);
+            let first = true;
+            for (;;) {
+                let term: string | null = null;
+                for (const { reader } of readers) {
+                    if (reader.term !== null && (term === null || reader.term < term)) {
+                        term = reader.term;
+                    }
+                }
+                if (term === null) {
+                    break;
+                }
+                const lists: string[] = [];
+                for (const { reader, offset } of readers) {
+                    if (reader.term === term) {
+                        const pairs = reader.postings();
+                        for (let i = 0; i < pairs.length; i += 2) {
+                            pairs[i] += offset;
+                        }
+                        lists.push(pairs.join(","));
+                    }
+                }
+                write(`${first ? "" : ","}${JSON.stringify(term)}:[${lists.join(",")}]`);
+                first = false;
+            }
+            write(`},"aliasOf":${JSON.stringify(this.aliasOf)}}`);
+            fs.writeSync(fd, pending);
+        } finally {
+            readers.forEach(({ reader }) => reader.close());
+            fs.closeSync(fd);
+        }
+        fs.renameSync(this.tmpPath, LexicalIndex.path(this.indexPath));
+        parts.forEach(part => part.remove());
+    }
+
+    // Drops what was written, unless it was committed
+    abort() {
+        if (!this.closed) {
+            this.documents.close();
+            this.aliases.close();
+            this.closed = true;
+        }
+        this.documents.remove();
+        this.aliases.remove();
+        fs.rmSync(this.tmpPath, { force: true });
+    }
+}
+
+// Merges rankings (lists of document ids, best first) by reciprocal-rank
+// fusion and returns the best k
+export function reciprocalRankFusion(rankings: number[][], k: number): number[] {
+    const scores = new Map<number, number>();
+    for (const ranking of rankings) {
+        ranking.forEach((doc, rank) => {
+            scores.set(doc, (scores.get(doc) ?? 0) + 1 / (RRF_K + rank + 1));
+        });
+    }
+    return [...scores.entries()]
+        .sort((a, b) => b[1] - a[1] || a[0] - b[0])
+        .slice(0, k)
+        .map(([doc]) => doc);
+}
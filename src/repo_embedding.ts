@@ -8,8 +8,7 @@ import path from 'path';
 import { pipeline } from '@xenova/transformers';
 import faiss from 'faiss-node';
 import { createInterface } from 'readline';
-import { walkAndChunkDirectory } from './chunkers/chunkerRouter';
-import { CodeChunk } from './chunkers/tsChunker';
+import { streamRepositoryChunks } from './chunkers/chunkerRouter';
 
 // Types
 interface RepositoryConfig {
@@ -66,10 +65,14 @@ async function cloneRepository(repoUrl: string, storagePath: string): Promise<st
   return repoPath;
 }
 
-// Function to extract text from repository
+// Function to extract text from repository, from the files FileDiscovery
+// keeps (ignore files, size limits, generated code), like the server does
 async function extractRepositoryText(repoPath: string): Promise<string[]> {
-  const chunks = await walkAndChunkDirectory(repoPath);
-  return chunks.map((chunk: CodeChunk) => chunk.code);
+  const texts: string[] = [];
+  for await (const chunk of streamRepositoryChunks(repoPath)) {
+    texts.push(chunk.code);
+  }
+  return texts;
 }
 
 // Function to create embeddings
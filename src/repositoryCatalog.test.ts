@@ -0,0 +1,60 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { CatalogEntry, RepositoryCatalog } from './repositoryCatalog';
+
+describe('RepositoryCatalog', () => {
+  let root: string;
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'repository-catalog-'));
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  const entry = (repoUrl: string): CatalogEntry => ({
+    repoUrl,
+    indexPath: path.join(root, repoUrl, 'index.faiss'),
+    commit: 'abc1234',
+    embeddingProvider: 'xenova',
+    embeddingModel: null,
+    indexType: 'flat',
+    chunks: 10,
+    builtAt: '2024-01-01T00:00:00.000Z'
+  });
+
+  it('keeps every entry of concurrent puts', async () => {
+    const urls = Array.from({ length: 20 }, (_, i) => `repo-${i}`);
+    await Promise.all(urls.map(url => new RepositoryCatalog(root).put(entry(url))));
+    expect(Object.keys(new RepositoryCatalog(root).read()).sort()).toEqual([...urls].sort());
+    expect(fs.existsSync(path.join(root, 'catalog.json.lock'))).toBe(false);
+  });
+
+  it('removes entries', async () => {
+    const catalog = new RepositoryCatalog(root);
+    await catalog.put(entry('a'));
+    expect(await catalog.remove('a')).toMatchObject({ repoUrl: 'a', chunks: 10 });
+    expect(await catalog.remove('a')).toBeNull();
+    expect(catalog.get('a')).toBeNull();
+  });
+
+  it('imports the legacy repository map', async () => {
+    fs.writeFileSync(path.join(root, 'repository_map.json'), JSON.stringify({ old: '/storage/old/index.faiss' }));
+    const catalog = new RepositoryCatalog(root);
+    expect(catalog.get('old')).toMatchObject({ indexPath: '/storage/old/index.faiss', commit: null });
+
+    await catalog.put(entry('new'));
+    expect(Object.keys(catalog.read()).sort()).toEqual(['new', 'old']);
+  });
+
+  it('breaks a stale lock', async () => {
+    const lockPath = path.join(root, 'catalog.json.lock');
+    fs.writeFileSync(lockPath, '12345');
+    const old = new Date(Date.now() - 60000);
+    fs.utimesSync(lockPath, old, old);
+    await new RepositoryCatalog(root).put(entry('a'));
+    expect(new RepositoryCatalog(root).get('a')).not.toBeNull();
+  });
+});
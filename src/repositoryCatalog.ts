@@ -0,0 +1,99 @@
+import fs from "fs";
+import path from "path";
+import { FileLock } from "./fileLock";
+
+// Catalog of processed repositories, stored as `catalog.json` in the storage
+// directory.
+//
+// Every change runs as a transaction: it takes the catalog's FileLock,
+// re-reads the catalog, applies the change and replaces the file by an
+// atomic rename. Concurrent process-repository calls, in one server or
+// several, therefore never lose each other's entries, and readers, who do
+// not lock, always see a complete catalog. A lock left behind by a crashed
+// process is broken once it is older than 30s.
+//
+// The catalog replaces repository_map.json (repository URL -> index path),
+// whose entries are imported the first time the catalog is written.
+
+export interface CatalogEntry {
+    repoUrl: string;
+    indexPath: string;
+    commit: string | null;
+    embeddingProvider: string | null;
+    embeddingModel: string | null;
+    indexType: string | null;
+    chunks: number | null;
+    builtAt: string | null;
+}
+
+type Entries = Record<string, CatalogEntry>;
+
+export class RepositoryCatalog {
+    readonly catalogPath: string;
+    private lock: FileLock;
+    private legacyMapPath: string;
+
+    constructor(storagePath: string) {
+        this.catalogPath = path.join(storagePath, "catalog.json");
+        this.lock = new FileLock(`${this.catalogPath}.lock`);
+        this.legacyMapPath = path.join(storagePath, "repository_map.json");
+    }
+
+    // All entries, by repository URL
+    read(): Entries {
+        if (fs.existsSync(this.catalogPath)) {
+            return JSON.parse(fs.readFileSync(this.catalogPath, "utf-8"));
+        }
+        return this.readLegacyMap();
+    }
+
+    get(repoUrl: string): CatalogEntry | null {
+        return this.read()[repoUrl] ?? null;
+    }
+
+    private readLegacyMap(): Entries {
+        if (!fs.existsSync(this.legacyMapPath)) {
+            return {};
+        }
+        const repoMap: Record<string, string> = JSON.parse(fs.readFileSync(this.legacyMapPath, "utf-8"));
+        return Object.fromEntries(Object.entries(repoMap).map(([repoUrl, indexPath]) => [repoUrl, {
+            repoUrl, indexPath, commit: null, embeddingProvider: null, embeddingModel: null,
+            indexType: null, chunks: null, builtAt: null
+        }]));
+    }
+
+    // Runs `change` on the current entries under the lock and saves what it
+    // leaves in them
+    async transaction<T>(change: (entries: Entries) => T): Promise<T> {
+        return this.lock.run(() => {
+            const entries = this.read();
+            const result = change(entries);
+            fs.mkdirSync(path.dirname(this.catalogPath), { recursive: true });
+            const tmpPath = `${this.catalogPath}.${process.pid}.tmp`;
+            const fd = fs.openSync(tmpPath, "w");
+            try {
+                fs.writeSync(fd, JSON.stringify(entries, null, 2));
+                fs.fsyncSync(fd);
+            } finally {
+                fs.closeSync(fd);
+            }
+            fs.renameSync(tmpPath, this.catalogPath);
+            return result;
+        });
+    }
+
+    async put(entry: CatalogEntry) {
+        await this.transaction(entries => {
+            entries[entry.repoUrl] = entry;
+        });
+    }
+
+    // Returns the removed entry, if there was one
+    async remove(repoUrl: string): Promise<CatalogEntry | null> {
+        return this.transaction(entries => {
+            const entry = entries[repoUrl] ?? null;
+            delete entries[repoUrl];
+            return entry;
+        });
+    }
+}
@@ -0,0 +1,23 @@
+import { parentPort, workerData } from "worker_threads";
+import { IndexCache } from "./indexCache";
+import { LoadedIndex, loadIndex, searchLoadedIndex } from "./indexSearch";
+
+// Entry point of the worker threads of SearchWorkerPool (searchWorkers.ts).
+// Each worker keeps the indexes it has loaded in a cache of its own and
+// answers one search at a time.
+
+const cache = new IndexCache<LoadedIndex>(workerData.cacheBytes);
+
+parentPort!.on("message", (message) => {
+    if (message.type === "invalidate") {
+        cache.invalidate(message.indexPath);
+        return;
+    }
+    try {
+        const loaded = cache.get(message.indexPath, message.version, () => loadIndex(message.indexPath));
+        const hits = searchLoadedIndex(loaded, message.query, message.k, message.hops, message.vector);
+        parentPort!.postMessage({ id: message.id, hits });
+    } catch (error) {
+        parentPort!.postMessage({ id: message.id, error: error instanceof Error ? error.message : String(error) });
+    }
+});
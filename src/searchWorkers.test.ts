@@ -0,0 +1,58 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { SearchRequest, SearchWorkerPool } from './searchWorkers';
+
+// Stands in for searchWorker.js: blocks its thread for 200ms, as a
+// synchronous FAISS search does, then answers with its thread id
+const WORKER_SOURCE = `
+const { parentPort, threadId } = require('worker_threads');
+parentPort.on('message', message => {
+  if (message.type !== 'search') return;
+  if (message.query === 'crash') process.exit(3);
+  const end = Date.now() + 200;
+  while (Date.now() < end) {}
+  parentPort.postMessage({ id: message.id, hits: [{ text: message.indexPath + ':' + threadId, distance: null }] });
+});
+`;
+
+describe('SearchWorkerPool', () => {
+  let root: string;
+  let pool: SearchWorkerPool;
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'search-workers-'));
+    const workerPath = path.join(root, 'worker.js');
+    fs.writeFileSync(workerPath, WORKER_SOURCE);
+    pool = new SearchWorkerPool({ size: 3, workerPath });
+  });
+
+  afterEach(async () => {
+    await pool.close();
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  const request = (indexPath: string, query: string = 'q'): SearchRequest =>
+    ({ indexPath, version: '1', query, k: 5, hops: 0, vector: [0, 1] });
+
+  it('searches different indexes in parallel', async () => {
+    // Start the workers first, so that their start-up is not timed
+    await Promise.all(['a', 'b', 'c'].map(indexPath => pool.search(request(indexPath))));
+    const started = Date.now();
+    const results = await Promise.all(['a', 'b', 'c'].map(indexPath => pool.search(request(indexPath))));
+    expect(Date.now() - started).toBeLessThan(500);
+    const threads = results.map(hits => hits[0].text.split(':')[1]);
+    expect(new Set(threads).size).toBe(3);
+  });
+
+  it('keeps each index on one worker', async () => {
+    const first = await pool.search(request('a'));
+    await pool.search(request('b'));
+    expect(await pool.search(request('a'))).toEqual(first);
+  });
+
+  it('rejects the searches of a worker that dies and replaces it', async () => {
+    await expect(pool.search(request('a', 'crash'))).rejects.toThrow('exited with code 3');
+    expect((await pool.search(request('a')))[0].text).toMatch(/^a:/);
+  });
+});
@@ -0,0 +1,135 @@
+import os from "os";
+import path from "path";
+import { Worker } from "worker_threads";
+import { SearchHit } from "./indexSearch";
+
+// A few worker threads that search repository indexes in parallel.
+//
+// faiss-node searches synchronously, so searches in the server's own thread
+// run one after another however they are awaited. Here every repository is
+// searched in a worker thread instead, and a question asked of several
+// repositories takes about as long as the slowest of their searches (as
+// long as there are no more repositories than workers).
+//
+// Each index is assigned to one worker the first time it is searched, the
+// one with the fewest indexes, and is only ever loaded there; the workers
+// share the cache budget equally. Workers are started on first use, do not
+// keep the process alive, and are replaced if they die.
+
+export interface SearchRequest {
+    indexPath: string;
+    // indexVersion() of the index, so that a rewritten index is reloaded
+    version: string;
+    query: string;
+    k: number;
+    hops: number;
+    // Embedding of the question
+    vector: number[];
+}
+
+export interface SearchWorkerPoolOptions {
+    // Number of worker threads; defaults to min(4, CPUs)
+    size?: number;
+    // Memory budget for the indexes loaded by all workers together
+    cacheBytes?: number;
+    workerPath?: string;
+}
+
+interface PendingSearch {
+    worker: Worker;
+    resolve: (hits: SearchHit[]) => void;
+    reject: (error: Error) => void;
+}
+
+export class SearchWorkerPool {
+    private workers: (Worker | null)[];
+    // Worker slot of each index searched so far
+    private slots = new Map<string, number>();
+    private pending = new Map<number, PendingSearch>();
+    private nextId = 0;
+    private cacheBytes: number;
+    private workerPath: string;
+
+    constructor(options: SearchWorkerPoolOptions = {}) {
+        const size = options.size ?? Math.max(1, Math.min(4, os.cpus().length));
+        this.workers = new Array(size).fill(null);
+        this.cacheBytes = Math.floor((options.cacheBytes ?? 1024 * 1024 * 1024) / size);
+        this.workerPath = options.workerPath ?? path.join(__dirname, "searchWorker.js");
+    }
+
+    search(request: SearchRequest): Promise<SearchHit[]> {
+        const slot = this.slotOf(request.indexPath);
+        const worker = this.worker(slot);
+        return new Promise((resolve, reject) => {
+            const id = this.nextId++;
+            this.pending.set(id, { worker, resolve, reject });
+            worker.postMessage({ type: "search", id, ...request });
+        });
+    }
+
+    // Drops the index from the memory of the worker that loaded it
+    invalidate(indexPath: string) {
+        const slot = this.slots.get(indexPath);
+        if (slot !== undefined) {
+            this.workers[slot]?.postMessage({ type: "invalidate", indexPath });
+            this.slots.delete(indexPath);
+        }
+    }
+
+    async close(): Promise<void> {
+        const workers = this.workers.filter((worker): worker is Worker => worker !== null);
+        this.workers.fill(null);
+        await Promise.all(workers.map(worker => worker.terminate()));
+    }
+
+    private slotOf(indexPath: string): number {
+        let slot = this.slots.get(indexPath);
+        if (slot === undefined) {
+            const assigned = this.workers.map(() => 0);
+            for (const taken of this.slots.values()) {
+                assigned[taken] += 1;
+            }
+            slot = assigned.indexOf(Math.min(...assigned));
+            this.slots.set(indexPath, slot);
+        }
+        return slot;
+    }
+
+    private worker(slot: number): Worker {
+        const existing = this.workers[slot];
+        if (existing) {
+            return existing;
+        }
+        const worker = new Worker(this.workerPath, { workerData: { cacheBytes: this.cacheBytes } });
+        worker.on("message", ({ id, hits, error }) => {
+            const search = this.pending.get(id);
+            if (!search) {
+                return;
+            }
+            this.pending.delete(id);
+            if (error !== undefined) {
+                search.reject(new Error(error));
+            } else {
+                search.resolve(hits);
+            }
+        });
+        worker.on("error", (error) => this.fail(slot, worker, error));
+        worker.on("exit", (code) => this.fail(slot, worker, new Error(`Search worker exited with code ${code}`)));
+        worker.unref();
+        this.workers[slot] = worker;
+        return worker;
+    }
+
+    // Rejects the searches of a dead worker; the next search starts another
+    private fail(slot: number, worker: Worker, error: Error) {
+        if (this.workers[slot] === worker) {
+            this.workers[slot] = null;
+        }
+        for (const [id, search] of this.pending) {
+            if (search.worker === worker) {
+                this.pending.delete(id);
+                search.reject(error);
+            }
+        }
+    }
+}